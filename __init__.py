@@ -14,27 +14,47 @@ Modules
 
 utilities
     A set of functions for data processing and analysis.
-    last update: 22/01/2025
+    last update: 18/10/2026
+
+data
+    Loading the PIAAC data.
+    last update: 18/10/2026
+
+codebook
+    Codebook registry for the PIAAC code variables.
+    last update: 18/10/2026
 
 clean
     A set of functions for data cleaning.
-    last update: 23/01/2025
+    last update: 18/10/2026
 
 isco
     Clean existing and create additional occupation and education variables based on ISCO-08.
-    last update: 23/01/2025
+    last update: 18/10/2026
 
  em
     Functions computing education mismatch measures.
-    last update: 24/01/2025   
+    last update: 18/10/2026
 
 sm
     Functions computing skill mismatch measures.
-    last update: 27/02/2025
+    last update: 18/10/2026
 
 graphs
     Labour mismatch data visualisation functions.
-    last update: 27/02/2025
+    last update: 18/10/2026
+
+parallel
+    Per-country parallel execution of the measurement pipeline.
+    last update: 18/10/2026
+
+bootstrap
+    Bootstrap confidence intervals for the mismatch shares and Matthew's correlation coefficients.
+    last update: 18/10/2026
+
+pipeline
+    Lazy computation of the derived variables and mismatch measures.
+    last update: 18/10/2026
 
 References
 ----------
@@ -53,10 +73,15 @@ email: vsevolod.v.iakovlev@gmail.com
 """
 
 from .src import (
+    data,
+    codebook,
     clean,
     em,
     isco,
     sm,
     utilities,
-    graphs
+    graphs,
+    parallel,
+    bootstrap,
+    pipeline
 )
@@ -0,0 +1,302 @@
+"""
+Bootstrap confidence intervals for the mismatch shares and Matthew's correlation coefficients.
+
+Functions:
+----------
+
+replicate_weights(n, n_replicates, method, strata, seed)
+    Draw bootstrap replicate weights for all the replicates at once.
+    last update: 18/10/2026
+
+shares_ci(piaac_df, mismatch_variable, feature, n_replicates, method, alpha, seed, chunk_size, max_workers)
+    Bootstrap confidence intervals for the mismatch shares within each group.
+    last update: 18/10/2026
+
+mcc_ci(df, feature_list, group_var, n_replicates, method, alpha, seed, chunk_size, max_workers)
+    Bootstrap confidence intervals for Matthew's correlation coefficients between the measures.
+    last update: 18/10/2026
+"""
+
+import pandas as pd
+import numpy as np
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from mismatch_toolbox.src import utilities
+
+# read-only arrays of the kernels, set once in each worker process by _share() (see _run())
+_SHARED = {}
+
+def replicate_weights(n, n_replicates, method='poisson', strata=None, seed=None):
+
+    """
+    Draw bootstrap replicate weights for all the replicates at once.
+
+    Parameters
+    ----------
+    n : int, number of observations.
+    n_replicates : int, number of replicates.
+    method : str, 'poisson' (independent Poisson(1) weights) or 'multinomial' (resampling with replacement,
+    within each stratum). Default is 'poisson'.
+    strata : numpy.ndarray, integer stratum code of each observation (0, 1, ...), e.g. the countries,
+    only used by 'multinomial'. Default is None (a single stratum).
+    seed : int or numpy.random.SeedSequence, random seed. Default is None.
+
+    Returns
+    -------
+    weights : numpy.ndarray, (n_replicates, n) weight of each observation in each replicate.
+
+    Description
+    -----------
+    1. 'poisson': draw the (n_replicates, n) matrix of Poisson(1) weights;
+    2. 'multinomial': draw n_s positions with replacement within each stratum of size n_s (one uniform
+    number per observation and replicate) and count how many times each observation is drawn
+    with a single np.bincount over all the replicates.
+    """
+
+    rng = np.random.default_rng(seed)
+    if method == 'poisson':
+        return rng.poisson(1.0, size=(n_replicates, n)).astype(np.float64)
+    elif method == 'multinomial':
+        if strata is None:
+            strata = np.zeros(n, dtype=np.intp)
+        order = np.argsort(strata, kind='stable')
+        sizes = np.bincount(strata)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        sorted_strata = strata[order]
+        # the i-th draw of a stratum picks one of its observations uniformly
+        draws = starts[sorted_strata] + (rng.random((n_replicates, n)) * sizes[sorted_strata]).astype(np.intp)
+        draws = np.minimum(draws, (starts + sizes - 1)[sorted_strata])
+        keys = (np.arange(n_replicates)[:, None] * n + order[draws]).ravel()
+        return np.bincount(keys, minlength=n_replicates * n).reshape(n_replicates, n).astype(np.float64)
+    else:
+        raise ValueError("method must be 'poisson' or 'multinomial'")
+
+
+def _chunks(n_replicates, seed, chunk_size):
+
+    """
+    Split the replicates into chunks with independent child seeds.
+    """
+
+    n_chunks = -(-n_replicates // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    sizes = [min(chunk_size, n_replicates - i * chunk_size) for i in range(n_chunks)]
+    return seeds, sizes
+
+
+def _share(shared):
+
+    """
+    Make the read-only arrays of the kernels available in the current process.
+    """
+
+    _SHARED.clear()
+    _SHARED.update(shared)
+
+
+def _run(kernel, shared, n_replicates, seed, chunk_size, max_workers):
+
+    """
+    Run [kernel](seed, size) on every chunk of replicates and stack the results.
+    """
+
+    # the arrays in [shared] are sent once to each worker by the pool initializer
+    # (inherited without pickling under fork), only the seeds and the sizes are sent with the chunks
+    seeds, sizes = _chunks(n_replicates, seed, chunk_size)
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    max_workers = max(1, min(max_workers, len(sizes)))
+    try:
+        if max_workers == 1:
+            _share(shared)
+            results = [kernel(chunk_seed, size) for chunk_seed, size in zip(seeds, sizes)]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_share, initargs=(shared,)) as executor:
+                results = list(executor.map(kernel, seeds, sizes))
+    finally:
+        _SHARED.clear()
+    return np.concatenate(results, axis=0)
+
+
+def _summary(estimate, replicates, alpha):
+
+    """
+    Return the standard error and the percentile interval of each statistic.
+    """
+
+    se = np.nanstd(replicates, axis=0, ddof=1)
+    low, high = np.nanquantile(replicates, [alpha / 2, 1 - alpha / 2], axis=0)
+    return {'estimate': estimate.ravel(), 'se': se.ravel(), 'ci_low': low.ravel(), 'ci_high': high.ravel()}
+
+
+def _shares_kernel(seed, size, n_bins, method):
+
+    """
+    Weighted counts of the (group, mismatch value) cells in a chunk of replicates.
+    """
+
+    key = _SHARED['key']
+    strata = _SHARED['strata']
+    weights = replicate_weights(len(key), size, method, strata, seed)
+    keys = (np.arange(size)[:, None] * n_bins + key[None, :]).ravel()
+    return np.bincount(keys, weights=weights.ravel(), minlength=size * n_bins).reshape(size, n_bins)
+
+
+def shares_ci(piaac_df, mismatch_variable, feature, n_replicates=1000, method='poisson', alpha=0.05, seed=None,
+              chunk_size=100, max_workers=None):
+
+    """
+    Bootstrap confidence intervals for the mismatch shares within each group.
+
+    Parameters
+    ----------
+    piaac_df : pandas.core.frame.DataFrame, piaac dataset.
+    mismatch_variable : str, mismatch variable name.
+    feature : str, group variable, e.g. 'cntrycode'.
+    n_replicates : int, number of bootstrap replicates. Default is 1000.
+    method : str, replicate weights, 'poisson' or 'multinomial' (resampling within each group),
+    see replicate_weights(). Default is 'poisson'.
+    alpha : float, the confidence level is 1 - [alpha]. Default is 0.05.
+    seed : int, random seed; the results do not depend on [max_workers]. Default is None.
+    chunk_size : int, number of replicates drawn at once by a worker. Default is 100.
+    max_workers : int, number of worker processes. Default is None (number of CPUs, at most one per chunk).
+
+    Returns
+    -------
+    ci_df : pandas.core.frame.DataFrame, one row per group and share ('wellshare', 'overshare', 'undershare',
+    and 'errorshare' for dsa) with columns [feature], 'share', 'estimate', 'se', 'ci_low', 'ci_high'.
+
+    Description
+    -----------
+    1. encode the groups and the mismatch values as one cell code per observation
+    (observations with a missing group or mismatch value are not used, as in utilities.mismatch_shares());
+    2. split the replicates into chunks with independent seeds (numpy.random.SeedSequence.spawn())
+    and run the chunks in a process pool;
+    3. in each chunk, draw the replicate weights as a matrix and compute the weighted counts of the cells
+    of all the replicates with a single np.bincount;
+    4. divide the counts by the group totals and summarise the shares with the standard error
+    and the percentile interval.
+    """
+
+    values = [value for value in utilities.SHARES if (value != 9999) | (mismatch_variable == 'dsa')]
+    group, groups = utilities.group_codes(piaac_df, feature)
+    measure = utilities.measure_values(piaac_df[mismatch_variable])
+    valid = (group >= 0) & (np.isnan(measure) == False)
+    value_codes = pd.Index(values).get_indexer(measure[valid])
+    other = value_codes < 0
+    value_codes[other] = len(values)
+    n_bins = len(groups) * (len(values) + 1)
+    key = group[valid] * (len(values) + 1) + value_codes
+
+    # point estimates and replicates
+    kernel = functools.partial(_shares_kernel, n_bins=n_bins, method=method)
+    counts = np.bincount(key, minlength=n_bins).reshape(1, len(groups), len(values) + 1).astype(np.float64)
+    replicates = _run(kernel, {'key': key, 'strata': group[valid]}, n_replicates, seed, chunk_size, max_workers).reshape(-1, len(groups), len(values) + 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        estimate = counts[..., :len(values)] / counts.sum(axis=2, keepdims=True)
+        replicates = replicates[..., :len(values)] / replicates.sum(axis=2, keepdims=True)
+
+    ci_df = pd.DataFrame({feature: np.repeat(np.asarray(groups), len(values)),
+                          'share': [utilities.SHARES[value] for value in values] * len(groups)})
+    for column, result in _summary(estimate[0], replicates, alpha).items():
+        ci_df[column] = result
+    return ci_df
+
+
+def _mcc_kernel(seed, size, n_patterns, n_groups, n_measures, n_values, method):
+
+    """
+    Matthew's correlation coefficients of the pairs of measures in a chunk of replicates.
+    """
+
+    pattern = _SHARED['pattern']
+    patterns = _SHARED['patterns']
+    offsets = _SHARED['offsets']
+    weights = replicate_weights(len(pattern), size, method, _SHARED['strata'], seed)
+    keys = (np.arange(size)[:, None] * n_patterns + pattern[None, :]).ravel()
+    pattern_weights = np.bincount(keys, weights=weights.ravel(), minlength=size * n_patterns).reshape(size, n_patterns)
+    upper = np.triu_indices(n_measures, 1)
+    mcc = np.zeros((size, n_groups, len(upper[0])))
+    tables = np.zeros((size, len(upper[0]), n_values, n_values))
+    for g in range(n_groups):
+        # the patterns are sorted by group, the weighted counts of each pair of measures are obtained
+        # with one matrix product by the one-hot code of its cell (n_values ** 2 columns per pattern)
+        group_weights = pattern_weights[:, offsets[g]:offsets[g + 1]]
+        group_patterns = patterns[offsets[g]:offsets[g + 1]]
+        for p, (m1, m2) in enumerate(zip(upper[0], upper[1])):
+            present = np.flatnonzero((group_patterns[:, 1 + m1] >= 0) & (group_patterns[:, 1 + m2] >= 0))
+            cells = np.zeros((len(present), n_values * n_values))
+            cells[np.arange(len(present)), group_patterns[present, 1 + m1] * n_values + group_patterns[present, 1 + m2]] = 1.0
+            tables[:, p] = (group_weights[:, present] @ cells).reshape(size, n_values, n_values)
+        mcc[:, g] = utilities.mcc_from_tables(tables)
+    return mcc
+
+
+def mcc_ci(df, feature_list, group_var=None, n_replicates=1000, method='poisson', alpha=0.05, seed=None,
+           chunk_size=100, max_workers=None):
+
+    """
+    Bootstrap confidence intervals for Matthew's correlation coefficients between the measures.
+
+    Parameters
+    ----------
+    df : pandas.core.frame.DataFrame, dataset.
+    feature_list : list, list of measures.
+    group_var : str, group variable, e.g. 'cntryname'. Default is None (a single group).
+    n_replicates : int, number of bootstrap replicates. Default is 1000.
+    method : str, replicate weights, 'poisson' or 'multinomial' (resampling within each group),
+    see replicate_weights(). Default is 'poisson'.
+    alpha : float, the confidence level is 1 - [alpha]. Default is 0.05.
+    seed : int, random seed; the results do not depend on [max_workers]. Default is None.
+    chunk_size : int, number of replicates drawn at once by a worker. Default is 100.
+    max_workers : int, number of worker processes. Default is None (number of CPUs, at most one per chunk).
+
+    Returns
+    -------
+    ci_df : pandas.core.frame.DataFrame, one row per (group and) pair of measures with columns
+    ([group_var]), 'measure_1', 'measure_2', 'estimate', 'se', 'ci_low', 'ci_high'.
+
+    Description
+    -----------
+    1. compute the point estimates with utilities.mcc_tensor();
+    2. encode the measures with utilities.measure_codes() and collapse the observations into the distinct
+    patterns of (group, codes of all the measures);
+    3. split the replicates into chunks with independent seeds (numpy.random.SeedSequence.spawn())
+    and run the chunks in a process pool, the pattern arrays are shared once per worker;
+    4. in each chunk, draw the replicate weights as a matrix, add them up by pattern with a single np.bincount
+    and obtain the contingency tables of all the replicates with one matrix product per group and pair
+    of measures (pairwise complete observations, as in utilities.mcc_matrix()), so that the memory
+    grows with the number of patterns times n_values ** 2 rather than (k * n_values) ** 2;
+    5. compute the coefficients of the upper triangle with utilities.mcc_from_tables() and summarise them
+    with the standard error and the percentile interval.
+    """
+
+    k = len(feature_list)
+    estimate, groups = utilities.mcc_tensor(df, feature_list, group_var)
+    codes, values = utilities.measure_codes(df, feature_list)
+    if group_var is None:
+        group = np.zeros(df.shape[0], dtype=np.intp)
+    else:
+        group = utilities.group_codes(df, group_var)[0]
+    n_groups = estimate.shape[0]
+    valid = (group >= 0) & (codes >= 0).any(axis=0)
+
+    # distinct patterns of the group and the codes of all the measures (sorted by group)
+    patterns, pattern = np.unique(np.vstack([group[valid], codes[:, valid]]).T, axis=0, return_inverse=True)
+    pattern = pattern.ravel()
+    offsets = np.searchsorted(patterns[:, 0], np.arange(n_groups + 1))
+
+    kernel = functools.partial(_mcc_kernel, n_patterns=len(patterns), n_groups=n_groups, n_measures=k,
+                               n_values=len(values), method=method)
+    shared = {'pattern': pattern, 'strata': group[valid], 'patterns': patterns, 'offsets': offsets}
+    replicates = _run(kernel, shared, n_replicates, seed, chunk_size, max_workers)
+
+    upper = np.triu_indices(k, 1)
+    ci_df = pd.DataFrame({'measure_1': np.tile(np.asarray(feature_list)[upper[0]], n_groups),
+                          'measure_2': np.tile(np.asarray(feature_list)[upper[1]], n_groups)})
+    if group_var is not None:
+        ci_df.insert(0, group_var, np.repeat(np.asarray(groups), len(upper[0])))
+    for column, result in _summary(estimate[:, upper[0], upper[1]], replicates, alpha).items():
+        ci_df[column] = result
+    return ci_df
@@ -1,27 +1,115 @@
 """
 A set of functions for data cleaning.
 
+Classes:
+--------
+
+FilterPlan(df)
+    Deferred row filter for drop_nan() and drop_val().
+    last update: 18/10/2026
+
 Functions:
 ----------
 
-drop_nan(df, var, log_df)
+drop_nan(df, var, log_df, plan)
     Drop observations containing missing values for a given variable.
-    last update: 22/01/2025
+    last update: 18/10/2026
 
-drop_val(df, var, values_list, operator, log_df)
+drop_val(df, var, values_list, operator, log_df, plan)
     Drop observations with specific values for a given variable.
-    last update: 22/01/2025
+    last update: 18/10/2026
+
+trim_bounds(values, l_quantile, h_quantile)
+    Compute the trimming bounds of a variable.
+    last update: 18/10/2026
 
-preparation(piaac_df, log_df)
+trim(df, var, log_df, bounds, plan)
+    Trim a variable at the 1st and 99th percentiles (or at given bounds).
+    last update: 18/10/2026
+
+preparation(piaac_df, log_df, plan, trim_earn)
     Prepare the dataset for analysis.
-    last update: 23/01/2025
+    last update: 18/10/2026
 """
 
 from mismatch_toolbox.src import utilities
+from mismatch_toolbox.src import codebook
 import pandas as pd
 import numpy as np
 
-def drop_nan(df, var, log_df):
+class FilterPlan:
+
+    """
+    Deferred row filter for drop_nan() and drop_val().
+
+    Parameters
+    ----------
+    df : pandas.core.frame.DataFrame, dataset the plan is created for.
+
+    Description
+    -----------
+    Instead of removing rows immediately (which copies every column of the
+    dataset), drop_nan() and drop_val() called with [plan] only mark the rows
+    for removal and log the same messages as usual. The surviving rows are
+    materialized once by flush(). Columns can still be added to the dataset
+    between the steps, as long as no rows are removed outside the plan.
+
+    Attributes
+    ----------
+    keep : numpy.ndarray, boolean mask of the rows that survived all steps so far.
+    steps : list, (step description, number of dropped observations) for each step.
+    codes, labels : numpy.ndarray, country codes of the rows and their country IDs
+    (see utilities.country_codes()), used for the sample attrition records.
+    """
+
+    def __init__(self, df):
+        self.keep = np.ones(df.shape[0], dtype=bool)
+        self.steps = []
+        self.codes, self.labels = utilities.country_codes(df)
+
+    def n(self):
+
+        """
+        Number of surviving observations.
+        """
+
+        return int(self.keep.sum())
+
+    def add(self, drop_mask, step):
+
+        """
+        Mark the observations in [drop_mask] for removal and return how many of them were still surviving.
+        """
+
+        drop_mask = np.asarray(drop_mask, dtype=bool) & self.keep
+        n_dropped = int(drop_mask.sum())
+        self.keep &= ~drop_mask
+        self.steps.append((step, n_dropped))
+        return n_dropped
+
+    def alive(self, df, var):
+
+        """
+        Return the values of [var] for the surviving observations.
+        """
+
+        return df.loc[self.keep, var]
+
+    def flush(self, df):
+
+        """
+        Remove the marked observations from [df] at once and reset the plan.
+        """
+
+        if self.keep.all() == False:
+            # an independent frame (not a slice), so that the later column assignments do not warn
+            df = df.take(np.flatnonzero(self.keep))
+            self.codes = self.codes[self.keep]
+        self.keep = np.ones(df.shape[0], dtype=bool)
+        return df
+
+
+def drop_nan(df, var, log_df, plan=None):
     
     """
     Drop observations containing missing values for a given variable.
@@ -31,6 +119,7 @@ def drop_nan(df, var, log_df):
     df : pandas.core.frame.DataFrame, dataset.
     var : str, variable name.
     log_df : pandas.core.frame.DataFrame, log file.
+    plan : FilterPlan, if given, the observations are only marked for removal in [plan]. Default is None.
     
     Returns
     -------
@@ -40,91 +129,53 @@ def drop_nan(df, var, log_df):
     Description
     -----------
     1. identify whether the variable is string or numeric;
-    2. if string: identify observations containing 'nan';
+    2. if string: identify observations containing 'nan' (or missing values);
     3. if nueric: identify observations containing missing values;
-    4. drop observation containing either missing values or 'nan';
-    5. repeat the missing values check;
-    6. register the changes in [log_df].    
+    4. drop observation containing either missing values or 'nan'
+    (or mark them for removal in [plan]);
+    5. register the changes and the number of dropped observations per country
+    (see utilities.attrition()) in [log_df].
     """
 
-    if (df[var].dtypes == 'O') == True:
-        nan = 'nan'
-        if (nan in df[var].unique()) == True:
-            log_record = (str(df[var].value_counts()[nan]) + ' observations have the value of nan for [' + var + ']')
-            log_df = utilities.log(log_df, log_record)
-            n_before = df.shape[0]
-            cntries_before = df['cntryname'].value_counts()
-            cntries_before = cntries_before.rename(var + ': orig')
-            log_record = ('n=' + str(n_before))
-            log_df = utilities.log(log_df, log_record)
-            log_record = ('removing the observations...')
-            log_df = utilities.log(log_df, log_record)
-            df.drop(df[df[var] == nan].index, inplace=True)
-            if (nan in df[var].unique()) == True:
-                log_record = ('It did not work, ' + str(
-                    df[var].value_counts()[nan]) + ' observations still have the value of nan for [' + var + ']')
-                log_df = utilities.log(log_df, log_record)
-                n_afetr = df.shape[0]
-                log_record = ('n=' + str(n_afetr) + '; ' + str(n_before - n_afetr) + ' observations have been removed')
-                log_df = utilities.log(log_df, log_record)
-                cntries_after = df['cntryname'].value_counts()
-                cntries_after = cntries_after.rename(var + ': clnd')
-                cntries_diff = cntries_before - cntries_after
-                cntries_diff = cntries_diff.rename(var + ': diff')
-            else:
-                log_record = ('no observations have the value of nan for [' + var + ']')
-                n_afetr = df.shape[0]
-                log_record = ('n=' + str(n_afetr) + '; ' + str(n_before - n_afetr) + ' observations have been removed')
-                cntries_after = df['cntryname'].value_counts()
-                cntries_after = cntries_after.rename(var + ': clnd')
-                cntries_diff = cntries_before - cntries_after
-                cntries_diff = cntries_diff.rename(var + ': diff')
-        else:
-            log_record = ('no observations have the value of nan for [' + var + ']')
-            log_df = utilities.log(log_df, log_record)
-            log_record = ('n=' + str(df.shape[0]))
-            log_df = utilities.log(log_df, log_record)
+    if plan is None:
+        local_plan = FilterPlan(df)
+    else:
+        local_plan = plan
+
+    if pd.api.types.is_numeric_dtype(df[var]) == False:
+        missing = ((df[var] == 'nan') | df[var].isnull()).to_numpy(dtype=bool)
+    else:
+        missing = df[var].isnull().to_numpy(dtype=bool)
+    n_missing = int((missing & local_plan.keep).sum())
+    n_before = local_plan.n()
+    step = 'drop_nan [' + var + ']'
+    log_df = utilities.attrition(log_df, step, local_plan.codes, local_plan.labels, missing, local_plan.keep)
+
+    if n_missing > 0:
+        log_record = (str(n_missing) + ' observations have the value of nan for [' + var + ']')
+        log_df = utilities.log(log_df, log_record)
+        log_record = ('n=' + str(n_before))
+        log_df = utilities.log(log_df, log_record)
+        log_record = ('removing the observations...')
+        log_df = utilities.log(log_df, log_record)
+        local_plan.add(missing, step)
+        log_record = ('no observations have the value of nan for [' + var + ']')
+        log_df = utilities.log(log_df, log_record)
+        n_after = local_plan.n()
+        log_record = ('n=' + str(n_after) + '; ' + str(n_before - n_after) + ' observations have been removed')
+        log_df = utilities.log(log_df, log_record)
     else:
-        if (df[var].isnull().values.any()) == True:
-            log_record = (str(df[var].isnull().value_counts()[True]) + ' observations have the value of nan for [' + var + ']')
-            log_df = utilities.log(log_df, log_record)
-            n_before = df.shape[0]
-            cntries_before = df['cntryname'].value_counts()
-            cntries_before = cntries_before.rename(var + ': orig')
-            log_record = ('n=' + str(n_before))
-            log_df = utilities.log(log_df, log_record)
-            log_record = ('removing the observations...')
-            log_df = utilities.log(log_df, log_record)
-            df.dropna(subset=var, inplace=True)
-            if (df[var].isnull().values.any()) == True:
-                log_record = ('It did not work, ' + str(df[var].isnull().value_counts()[
-                                                    True]) + ' observations still have the value of nan for [' + var + ']')
-                log_df = utilities.log(log_df, log_record)
-                n_afetr = df.shape[0]
-                log_record = ('n=' + str(n_afetr) + '; ' + str(n_before - n_afetr) + ' observations have been removed')
-                log_df = utilities.log(log_df, log_record)
-                cntries_after = df['cntryname'].value_counts()
-                cntries_after = cntries_after.rename(var + ': clnd')
-                cntries_diff = cntries_before - cntries_after
-                cntries_diff = cntries_diff.rename(var + ': diff')
-            else:
-                log_record = ('no observations have the value of nan for [' + var + ']')
-                log_df = utilities.log(log_df, log_record)
-                n_afetr = df.shape[0]
-                log_record = ('n=' + str(n_afetr) + '; ' + str(n_before - n_afetr) + ' observations have been removed')
-                log_df = utilities.log(log_df, log_record)
-                cntries_after = df['cntryname'].value_counts()
-                cntries_after = cntries_after.rename(var + ': clnd')
-                cntries_diff = cntries_before - cntries_after
-                cntries_diff = cntries_diff.rename(var + ': diff')
-        else:
-            log_record = ('no observations have the value of nan for [' + var + ']')
-            log_df = utilities.log(log_df, log_record)
-            log_record = ('n=' + str(df.shape[0]))
-            log_df = utilities.log(log_df, log_record)
+        log_record = ('no observations have the value of nan for [' + var + ']')
+        log_df = utilities.log(log_df, log_record)
+        log_record = ('n=' + str(n_before))
+        log_df = utilities.log(log_df, log_record)
+
+    if plan is None:
+        df = local_plan.flush(df)
+
     return df, log_df
 
-def drop_val(df, var, values_list, operator, log_df):
+def drop_val(df, var, values_list, operator, log_df, plan=None):
     
     """
     Drop observations with specific values for a given variable.
@@ -136,6 +187,7 @@ def drop_val(df, var, values_list, operator, log_df):
     values_list : list, values to be either dropped or kept
     operator : either "==" or "!="
     log_df : pandas.core.frame.DataFrame, log file.
+    plan : FilterPlan, if given, the observations are only marked for removal in [plan]. Default is None.
 
     Returns
     -------
@@ -144,30 +196,128 @@ def drop_val(df, var, values_list, operator, log_df):
     
     Description
     -----------
-    for each value in [values_list]:  
-        1. drop observations that satisfy the following expression: "observation [operator] [value]";
-        2. register the changes in [log_df].
+    1. if [operator] is "==", drop observations with values in [values_list];
+    2. if [operator] is "!=", drop observations with values not in [values_list];
+    (both are identified with a single isin() and dropped at once, or marked for removal in [plan])
+    3. register the changes and the number of dropped observations per country
+    (see utilities.attrition()) in [log_df].
 
     """
     
-    n_before = df.shape[0]
+    if plan is None:
+        local_plan = FilterPlan(df)
+    else:
+        local_plan = plan
+
+    n_before = local_plan.n()
     log_record = ('n=' + str(n_before))
     log_df = utilities.log(log_df, log_record)
     log_record = ('dropping observations with ' + '[' +var + ']' + operator + str(values_list))
     log_df = utilities.log(log_df, log_record)
-    for value in values_list:
-        if operator == '==':
-            df.drop(df[df[var] == value].index, inplace=True)
-        elif operator == '!=':
-            df.drop(df[df[var] != value].index, inplace=True)
-    n_after = df.shape[0]
+    in_values = df[var].isin(values_list).to_numpy(dtype=bool)
+    step = 'drop_val [' + var + ']' + operator + str(values_list)
+    if operator == '==':
+        drop_mask = in_values
+    elif operator == '!=':
+        drop_mask = ~in_values
+    else:
+        drop_mask = np.zeros(df.shape[0], dtype=bool)
+    log_df = utilities.attrition(log_df, step, local_plan.codes, local_plan.labels, drop_mask, local_plan.keep)
+    local_plan.add(drop_mask, step)
+    n_after = local_plan.n()
     log_record = 'n=' + str(n_after) + '; ' + str(n_before - n_after) + ' observations have been removed'
     log_df = utilities.log(log_df, log_record)
+
+    if plan is None:
+        df = local_plan.flush(df)
     
     return df, log_df
 
 
-def preparation(piaac_df, log_df):
+def trim_bounds(values, l_quantile=0.01, h_quantile=0.99):
+
+    """
+    Compute the trimming bounds of a variable.
+
+    Parameters
+    ----------
+    values : array-like, values of the surviving observations (missing values are ignored).
+    l_quantile : float, lower quantile. Default is 0.01.
+    h_quantile : float, upper quantile. Default is 0.99.
+
+    Returns
+    -------
+    bounds : tuple, (lower bound, upper bound).
+
+    Description
+    -----------
+    1. compute the lower bound as the [l_quantile] quantile of [values];
+    2. compute the upper bound as the [h_quantile] quantile of the values that are not
+    below the lower bound (the upper tail is trimmed after the lower one).
+
+    The bounds only depend on the set of values, not on their order, so they can be computed
+    from the values of several partitions of the dataset pooled in any order.
+    """
+
+    values = pd.Series(np.asarray(values, dtype=float)).dropna()
+    low = values.quantile(l_quantile)
+    high = values[~(values < low)].quantile(h_quantile)
+    return low, high
+
+
+def trim(df, var, log_df, bounds=None, plan=None):
+
+    """
+    Trim a variable at the 1st and 99th percentiles (or at given bounds).
+
+    Parameters
+    ----------
+    df : pandas.core.frame.DataFrame, dataset.
+    var : str, variable name.
+    log_df : pandas.core.frame.DataFrame, log file.
+    bounds : tuple, (lower bound, upper bound), e.g. computed by trim_bounds() over the whole dataset.
+    Default is None (computed from the surviving observations of [df]).
+    plan : FilterPlan, if given, the observations are only marked for removal in [plan]. Default is None.
+
+    Returns
+    -------
+    df : pandas.core.frame.DataFrame, updated dataset.
+    log_df : pandas.core.frame.DataFrame, updated log file.
+
+    Description
+    -----------
+    1. compute the bounds with trim_bounds() unless they are given;
+    2. drop the observations below the lower bound, then the observations above the upper bound
+    (or mark them for removal in [plan]);
+    3. register the number of dropped observations per country (see utilities.attrition())
+    and the remaining number of observations in [log_df].
+    """
+
+    if plan is None:
+        local_plan = FilterPlan(df)
+    else:
+        local_plan = plan
+
+    if bounds is None:
+        bounds = trim_bounds(local_plan.alive(df, var))
+    drop_mask = (df[var] < bounds[0]).to_numpy(dtype=bool)
+    step = 'trim [' + var + '] at the 1st percentile'
+    log_df = utilities.attrition(log_df, step, local_plan.codes, local_plan.labels, drop_mask, local_plan.keep)
+    local_plan.add(drop_mask, step)
+    drop_mask = (df[var] > bounds[1]).to_numpy(dtype=bool)
+    step = 'trim [' + var + '] at the 99th percentile'
+    log_df = utilities.attrition(log_df, step, local_plan.codes, local_plan.labels, drop_mask, local_plan.keep)
+    local_plan.add(drop_mask, step)
+    log_record = 'n=' + str(local_plan.n())
+    log_df = utilities.log(log_df, log_record)
+
+    if plan is None:
+        df = local_plan.flush(df)
+
+    return df, log_df
+
+
+def preparation(piaac_df, log_df, plan=None, trim_earn=True):
 
     """
     Prepare the dataset for analysis.
@@ -176,6 +326,11 @@ def preparation(piaac_df, log_df):
     ----------
     piaac_df : pandas.core.frame.DataFrame, dataset.
     log_df : pandas.core.frame.DataFrame, log file.
+    plan : FilterPlan, if given, the observations are only marked for removal in [plan]
+    and the caller is responsible for plan.flush(). Default is None
+    (the observations are removed once at the end).
+    trim_earn : bool, if False, earnings are not trimmed (e.g. parallel.run() trims them
+    with trim() at the bounds computed over all the countries). Default is True.
 
     Returns
     -------
@@ -189,11 +344,16 @@ def preparation(piaac_df, log_df):
     3. create a variable with country codes;
     4. check and drop for missing values in country ID;
     5. identify the respondents who are unemployed or out of the labour force and drop the from the dataset;
-    6. create a variable earn as a float of earnhrbonusppp, drop missing values, and trim at the 1st and 99th percentiles;
-    7. register the changes in [log_df].
+    6. create a variable earn as a float of earnhrbonusppp, drop missing values, and trim at the 1st and 99th percentiles (see trim());
+    7. register the changes (including the sample attrition at every drop) in [log_df].
     """
     
     # converting cntryid to float
+    if plan is None:
+        local_plan = FilterPlan(piaac_df)
+    else:
+        local_plan = plan
+
     log_record = 'converting cntryid to float'
     log_df = utilities.log(log_df, log_record)
     piaac_df['cntryid'] = pd.to_numeric(piaac_df['cntryid'], errors='coerce')
@@ -201,161 +361,17 @@ def preparation(piaac_df, log_df):
     # create a variable with country names
     log_record = 'creating [cntryname]: variable for country names'
     log_df = utilities.log(log_df, log_record)
-    conditions = [
-        (piaac_df['cntryid'] == 276),
-        (piaac_df['cntryid'] == 643),
-        (piaac_df['cntryid'] == 392),
-        (piaac_df['cntryid'] == 152),
-        (piaac_df['cntryid'] == 702),
-        (piaac_df['cntryid'] == 604),
-        (piaac_df['cntryid'] == 300),
-        (piaac_df['cntryid'] == 233),
-        (piaac_df['cntryid'] == 398),
-        (piaac_df['cntryid'] == 246),
-        (piaac_df['cntryid'] == 724),
-        (piaac_df['cntryid'] == 372),
-        (piaac_df['cntryid'] == 218),
-        (piaac_df['cntryid'] == 528),
-        (piaac_df['cntryid'] == 578),
-        (piaac_df['cntryid'] == 616),
-        (piaac_df['cntryid'] == 250),
-        (piaac_df['cntryid'] == 348),
-        (piaac_df['cntryid'] == 554),
-        (piaac_df['cntryid'] == 376),
-        (piaac_df['cntryid'] == 840),
-        (piaac_df['cntryid'] == 380),
-        (piaac_df['cntryid'] == 410),
-        (piaac_df['cntryid'] == 705),
-        (piaac_df['cntryid'] == 208),
-        (piaac_df['cntryid'] == 56),
-        (piaac_df['cntryid'] == 484),
-        (piaac_df['cntryid'] == 752),
-        (piaac_df['cntryid'] == 703),
-        (piaac_df['cntryid'] == 40),
-        (piaac_df['cntryid'] == 440),
-        (piaac_df['cntryid'] == 203),
-        (piaac_df['cntryid'] == 826),
-        (piaac_df['cntryid'] == 792),
-        (piaac_df['cntryid'] == 124)]
-    values = [
-        'Germany',
-        'Russian Federation',
-        'Japan',
-        'Chile',
-        'Singapore',
-        'Peru',
-        'Greece',
-        'Estonia',
-        'Kazakhstan',
-        'Finland',
-        'Spain',
-        'Ireland',
-        'Ecuador',
-        'Netherlands',
-        'Norway',
-        'Poland',
-        'France',
-        'Hungary',
-        'New Zealand',
-        'Israel',
-        'United States',
-        'Italy',
-        'Korea',
-        'Slovenia',
-        'Denmark',
-        'Belgium',
-        'Mexico',
-        'Sweden',
-        'Slovak Republic',
-        'Austria',
-        'Lithuania',
-        'Czech Republic',
-        'United Kingdom',
-        'Turkey',
-        'Canada']
-    piaac_df['cntryname'] = np.select(conditions, values, default='nan')
+    piaac_df['cntryname'] = codebook.country_names(piaac_df['cntryid'])
 
     # create a variable with country codes
     log_record = 'creating [cntrycode]: variable for country codes'
     log_df = utilities.log(log_df, log_record)
-    conditions = [
-        (piaac_df['cntryid'] == 276),
-        (piaac_df['cntryid'] == 643),
-        (piaac_df['cntryid'] == 392),
-        (piaac_df['cntryid'] == 152),
-        (piaac_df['cntryid'] == 702),
-        (piaac_df['cntryid'] == 604),
-        (piaac_df['cntryid'] == 300),
-        (piaac_df['cntryid'] == 233),
-        (piaac_df['cntryid'] == 398),
-        (piaac_df['cntryid'] == 246),
-        (piaac_df['cntryid'] == 724),
-        (piaac_df['cntryid'] == 372),
-        (piaac_df['cntryid'] == 218),
-        (piaac_df['cntryid'] == 528),
-        (piaac_df['cntryid'] == 578),
-        (piaac_df['cntryid'] == 616),
-        (piaac_df['cntryid'] == 250),
-        (piaac_df['cntryid'] == 348),
-        (piaac_df['cntryid'] == 554),
-        (piaac_df['cntryid'] == 376),
-        (piaac_df['cntryid'] == 840),
-        (piaac_df['cntryid'] == 380),
-        (piaac_df['cntryid'] == 410),
-        (piaac_df['cntryid'] == 705),
-        (piaac_df['cntryid'] == 208),
-        (piaac_df['cntryid'] == 56),
-        (piaac_df['cntryid'] == 484),
-        (piaac_df['cntryid'] == 752),
-        (piaac_df['cntryid'] == 703),
-        (piaac_df['cntryid'] == 40),
-        (piaac_df['cntryid'] == 440),
-        (piaac_df['cntryid'] == 203),
-        (piaac_df['cntryid'] == 826),
-        (piaac_df['cntryid'] == 792),
-        (piaac_df['cntryid'] == 124)]
-    values = [
-        'DEU',
-        'RUS',
-        'JPN',
-        'CHL',
-        'SGP',
-        'PER',
-        'GRC',
-        'EST',
-        'KAZ',
-        'FIN',
-        'ESP',
-        'IRL',
-        'ECU',
-        'NLD',
-        'NOR',
-        'POL',
-        'FRA',
-        'HUN',
-        'NZL',
-        'ISR',
-        'USA',
-        'ITA',
-        'KOR',
-        'SVN',
-        'DNK',
-        'BEL',
-        'MEX',
-        'SWE',
-        'SVK',
-        'AUT',
-        'LTU',
-        'CZE',
-        'GBR',
-        'TUR',
-        'CAN']
-    piaac_df['cntrycode'] = np.select(conditions, values, default='nan')
+    piaac_df['cntrycode'] = codebook.country_codes(piaac_df['cntryid'])
 
     # check and drop for missing values in country ID
     log_record = 'check and drop for missing values in country ID'
     log_df = utilities.log(log_df, log_record)
-    piaac_df, log_df = drop_nan(piaac_df, 'cntryid', log_df)
+    piaac_df, log_df = drop_nan(piaac_df, 'cntryid', log_df, local_plan)
 
     # converting c_d05 (employment status) to float
     log_record = 'converting [c_d05] (employment status) to float'
@@ -365,7 +381,7 @@ def preparation(piaac_df, log_df):
     # drop all respondents who are unemployed or out of the labour force
     log_record = 'drop all respondents who are unemployed or out of the labour force'
     log_df = utilities.log(log_df, log_record)
-    piaac_df, log_df = drop_val(piaac_df, 'c_d05', [1], '!=', log_df)
+    piaac_df, log_df = drop_val(piaac_df, 'c_d05', [1], '!=', log_df, local_plan)
 
     # generate variable earn as a float of an earnings variable of choice
     log_record = 'creating [earn]: variable earn as a float of an earnings variable of choice'
@@ -375,15 +391,16 @@ def preparation(piaac_df, log_df):
     # check and drop for missing values in earnings
     log_record = 'check and drop for missing values in earnings'
     log_df = utilities.log(log_df, log_record)
-    piaac_df, log_df = drop_nan(piaac_df, 'earn', log_df)
+    piaac_df, log_df = drop_nan(piaac_df, 'earn', log_df, local_plan)
 
     # trim earningns at the 1st and 99th percentiles
-    log_record = 'trim earningns at the 1st and 99th percentiles'
-    log_df = utilities.log(log_df, log_record)
-    piaac_df.drop(piaac_df[piaac_df['earn'] < piaac_df['earn'].quantile(0.01)].index, inplace=True)
-    piaac_df.drop(piaac_df[piaac_df['earn'] > piaac_df['earn'].quantile(0.99)].index, inplace=True)
-    log_record = 'n=' + str(piaac_df.shape[0])
-    log_df = utilities.log(log_df, log_record)
+    if trim_earn == True:
+        log_record = 'trim earningns at the 1st and 99th percentiles'
+        log_df = utilities.log(log_df, log_record)
+        piaac_df, log_df = trim(piaac_df, 'earn', log_df, plan=local_plan)
+
+    if plan is None:
+        piaac_df = local_plan.flush(piaac_df)
     
     return piaac_df, log_df
             
\ No newline at end of file
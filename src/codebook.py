@@ -0,0 +1,347 @@
+"""
+Codebook registry for the PIAAC code variables.
+
+Mappings:
+---------
+
+COUNTRIES
+    Country ID (ISO 3166 numeric code) -> (country name, country code).
+
+ISCO1C
+    1-digit ISCO-08 occupation group -> label.
+
+ISCO2C
+    2-digit ISCO-08 occupation group -> label.
+
+ISCO_GROUPS
+    Custom occupation groups based on ISCO-08 required skill level:
+    (variable, code, label, required skill level) in the order of priority.
+
+Functions:
+----------
+
+lookup_index(values, keys)
+    Find the position of each value in a list of integer codes.
+    last update: 18/10/2026
+
+lookup(values, mapping, default)
+    Map integer codes to labels with a single take over a dense lookup array.
+    last update: 18/10/2026
+
+country_names(cntryid)
+    Map country IDs to country names.
+    last update: 18/10/2026
+
+country_codes(cntryid)
+    Map country IDs to country codes.
+    last update: 18/10/2026
+
+isco_groups(isco1c, isco2c, field)
+    Map ISCO-08 occupation groups to custom occupation groups or their required skill level.
+    last update: 18/10/2026
+
+compose(parts, formats, sep, keep_na)
+    Build a categorical composite group key from several variables.
+    last update: 18/10/2026
+"""
+
+import pandas as pd
+import numpy as np
+import math
+
+COUNTRIES = {
+    276: ('Germany', 'DEU'),
+    643: ('Russian Federation', 'RUS'),
+    392: ('Japan', 'JPN'),
+    152: ('Chile', 'CHL'),
+    702: ('Singapore', 'SGP'),
+    604: ('Peru', 'PER'),
+    300: ('Greece', 'GRC'),
+    233: ('Estonia', 'EST'),
+    398: ('Kazakhstan', 'KAZ'),
+    246: ('Finland', 'FIN'),
+    724: ('Spain', 'ESP'),
+    372: ('Ireland', 'IRL'),
+    218: ('Ecuador', 'ECU'),
+    528: ('Netherlands', 'NLD'),
+    578: ('Norway', 'NOR'),
+    616: ('Poland', 'POL'),
+    250: ('France', 'FRA'),
+    348: ('Hungary', 'HUN'),
+    554: ('New Zealand', 'NZL'),
+    376: ('Israel', 'ISR'),
+    840: ('United States', 'USA'),
+    380: ('Italy', 'ITA'),
+    410: ('Korea', 'KOR'),
+    705: ('Slovenia', 'SVN'),
+    208: ('Denmark', 'DNK'),
+    56: ('Belgium', 'BEL'),
+    484: ('Mexico', 'MEX'),
+    752: ('Sweden', 'SWE'),
+    703: ('Slovak Republic', 'SVK'),
+    40: ('Austria', 'AUT'),
+    440: ('Lithuania', 'LTU'),
+    203: ('Czech Republic', 'CZE'),
+    826: ('United Kingdom', 'GBR'),
+    792: ('Turkey', 'TUR'),
+    124: ('Canada', 'CAN'),
+}
+
+ISCO1C = {
+    1: 'Managers',
+    2: 'Professionals',
+    3: 'Technicians and associate professionals',
+    4: 'Clerical support workers',
+    5: 'Service and sales workers',
+    6: 'Skilled agricultural, forestry and fishery workers',
+    7: 'Craft and related trades workers',
+    8: 'Plant and machine operators, and assemblers',
+    9: 'Elementary occupations',
+    0: 'Armed forces occupations',
+}
+
+ISCO2C = {
+    11: 'Chief executives, senior officials and legislators',
+    12: 'Administrative and commercial managers',
+    13: 'Production and specialised services managers',
+    14: 'Hospitality, retail and other services managers',
+    21: 'Science and engineering professionals',
+    22: 'Health professionals',
+    23: 'Teaching professionals',
+    24: 'Business and administration professionals',
+    25: 'Information and communications technology professionals',
+    26: 'Legal, social and cultural professionals',
+    31: 'Science and engineering associate professionals',
+    32: 'Health associate professionals',
+    33: 'Business and administration associate professionals',
+    34: 'Legal, social, cultural and related associate professionals',
+    35: 'Information and communications technicians',
+    41: 'General and keyboard clerks',
+    42: 'Customer services clerks',
+    43: 'Numerical and material recording clerks',
+    44: 'Other clerical support workers',
+    51: 'Personal service workers',
+    52: 'Sales workers',
+    53: 'Personal care workers',
+    54: 'Protective services workers',
+    61: 'Market-oriented skilled agricultural workers',
+    62: 'Market-oriented skilled forestry, fishery and hunting workers',
+    63: 'Subsistence farmers, fishers, hunters and gatherers',
+    71: 'Building and related trades workers, excluding electricians',
+    72: 'Metal, machinery and related trades workers',
+    73: 'Handicraft and printing workers',
+    74: 'Electrical and electronic trades workers',
+    75: 'Food processing, wood working, garment and other craft and related trades workers',
+    81: 'Stationary plant and machine operators',
+    82: 'Assemblers',
+    83: 'Drivers and mobile plant operators',
+    91: 'Cleaners and helpers',
+    92: 'Agricultural, forestry and fishery labourers',
+    93: 'Labourers in mining, construction, manufacturing and transport',
+    94: 'Food preparation assistants',
+    95: 'Street and related sales and service workers',
+    96: 'Refuse workers and other elementary workers',
+    1: 'Commissioned armed forces officers',
+    2: 'Non-commissioned armed forces officers',
+    3: 'Armed forces occupations, other ranks',
+}
+
+ISCO_GROUPS = [
+    ('isco2c', 11, 'High skilled managers', 4),
+    ('isco2c', 12, 'High skilled managers', 4),
+    ('isco2c', 13, 'High skilled managers', 4),
+    ('isco2c', 14, 'Low skilled managers', 3),
+    ('isco1c', 2, 'Professionals', 4),
+    ('isco1c', 3, 'Technicians and associate professionals', 3),
+    ('isco1c', 4, 'Clerical support workers', 2),
+    ('isco1c', 5, 'Service and sales workers', 2),
+    ('isco1c', 6, 'Skilled agricultural, forestry and fishery workers', 2),
+    ('isco1c', 7, 'Craft and related trades workers', 2),
+    ('isco1c', 8, 'Plant and machine operators, and assemblers', 2),
+    ('isco1c', 9, 'Elementary occupations', 1),
+    ('isco2c', 1, 'High skilled armed forces occupations', 3),
+    ('isco2c', 2, 'Medium skilled armed forces occupations', 2),
+    ('isco2c', 3, 'Low skilled armed forces occupations', 1),
+]
+
+def lookup_index(values, keys):
+
+    """
+    Find the position of each value in a list of integer codes.
+
+    Parameters
+    ----------
+    values : pandas.core.series.Series or numpy.ndarray, numeric codes.
+    keys : list, non-negative integer codes.
+
+    Returns
+    -------
+    positions : numpy.ndarray, position of each value in [keys] (-1 if the value is not in [keys]).
+
+    Description
+    -----------
+    1. build a dense array of size max(keys) + 2 holding the position of each key
+    (the first occurrence wins) and -1 elsewhere;
+    2. send the values that are missing, negative, non-integer or larger than max(keys) to the last cell (-1);
+    3. take the positions from the dense array.
+    """
+
+    keys = np.asarray(keys, dtype=np.intp)
+    table = np.full(keys.max() + 2, -1, dtype=np.intp)
+    table[keys[::-1]] = np.arange(len(keys) - 1, -1, -1)
+    values = pd.to_numeric(pd.Series(values, copy=False), errors='coerce').to_numpy(dtype=float)
+    valid = (values >= 0) & (values <= keys.max()) & (values == np.floor(values))
+    index = np.where(valid, values, keys.max() + 1).astype(np.intp)
+    return table.take(index)
+
+
+def lookup(values, mapping, default='nan'):
+
+    """
+    Map integer codes to labels with a single take over a dense lookup array.
+
+    Parameters
+    ----------
+    values : pandas.core.series.Series or numpy.ndarray, numeric codes.
+    mapping : dict, integer code -> label.
+    default : str or float, label for the codes that are not in [mapping]. Default is 'nan'.
+
+    Returns
+    -------
+    labels : numpy.ndarray, label of each value.
+
+    Description
+    -----------
+    1. find the position of each value in the keys of [mapping] with lookup_index();
+    2. take the labels from the values of [mapping] followed by [default]
+    (the same result as np.select() with one condition per code, without
+    holding one boolean array per code in memory).
+    """
+
+    positions = lookup_index(values, list(mapping.keys()))
+    labels = np.array(list(mapping.values()) + [default])
+    return labels.take(positions)
+
+
+def country_names(cntryid):
+
+    """
+    Map country IDs to country names ('nan' for unknown IDs).
+    """
+
+    return lookup(cntryid, {key: value[0] for key, value in COUNTRIES.items()})
+
+
+def country_codes(cntryid):
+
+    """
+    Map country IDs to country codes ('nan' for unknown IDs).
+    """
+
+    return lookup(cntryid, {key: value[1] for key, value in COUNTRIES.items()})
+
+
+def isco_groups(isco1c, isco2c, field='label'):
+
+    """
+    Map ISCO-08 occupation groups to custom occupation groups or their required skill level.
+
+    Parameters
+    ----------
+    isco1c : pandas.core.series.Series, 1-digit ISCO-08 occupation groups.
+    isco2c : pandas.core.series.Series, 2-digit ISCO-08 occupation groups.
+    field : str, either 'label' (custom occupation group, 'nan' if none)
+    or 'skill_level' (required skill level, nan if none). Default is 'label'.
+
+    Returns
+    -------
+    groups : numpy.ndarray, custom occupation group or required skill level of each observation.
+
+    Description
+    -----------
+    1. look up the rows of ISCO_GROUPS for each run of rules on the same variable;
+    2. keep the first matching rule of each observation (the same priority as np.select());
+    3. take the labels or skill levels of the matched rules.
+    """
+
+    variables = {'isco1c': isco1c, 'isco2c': isco2c}
+    positions = None
+    start = 0
+    while start < len(ISCO_GROUPS):
+        end = start
+        while (end < len(ISCO_GROUPS)) and (ISCO_GROUPS[end][0] == ISCO_GROUPS[start][0]):
+            end = end + 1
+        run = lookup_index(variables[ISCO_GROUPS[start][0]], [rule[1] for rule in ISCO_GROUPS[start:end]])
+        run = np.where(run >= 0, run + start, -1)
+        if positions is None:
+            positions = run
+        else:
+            positions = np.where(positions >= 0, positions, run)
+        start = end
+    if field == 'label':
+        values = np.array([rule[2] for rule in ISCO_GROUPS] + ['nan'])
+    elif field == 'skill_level':
+        values = np.array([rule[3] for rule in ISCO_GROUPS] + [math.nan], dtype=float)
+    return values.take(positions)
+
+
+def compose(parts, formats=None, sep=' ', keep_na=None):
+
+    """
+    Build a categorical composite group key from several variables.
+
+    Parameters
+    ----------
+    parts : list, pandas.core.series.Series to be combined (e.g. country code and occupation group).
+    formats : list, for each part either None (labels are the values as str) or a function
+    turning a pandas Index of values into labels. Default is None.
+    sep : str, separator between the labels of the parts. Default is ' '.
+    keep_na : list, for each part whether its missing values are labelled like the other values
+    (e.g. 'nan', as the equivalent string keys would be) instead of giving a missing key. Default is None (no part).
+
+    Returns
+    -------
+    key : pandas.core.arrays.categorical.Categorical, composite group key with the
+    labels "part1[sep]part2..." as categories (sorted, as the equivalent string keys would be).
+
+    Description
+    -----------
+    1. factorize each part and combine the integer codes into a single integer key;
+    2. factorize the combined key, so that the labels are built only once per combination
+    present in the data instead of once per observation;
+    3. build the labels of the combinations from the labels of the parts
+    (combinations with equal labels are merged, a missing value or label in any part gives a missing key
+    unless the missing values of the part are kept by [keep_na]);
+    4. return a categorical with integer codes and the sorted labels as categories.
+    """
+
+    if formats is None:
+        formats = [None] * len(parts)
+    if keep_na is None:
+        keep_na = [False] * len(parts)
+    key = np.zeros(len(parts[0]), dtype=np.int64)
+    missing = np.zeros(len(parts[0]), dtype=bool)
+    part_labels = []
+    for part, formatter, na_label in zip(parts, formats, keep_na):
+        codes, uniques = pd.factorize(part, use_na_sentinel=(na_label == False))
+        if formatter is None:
+            labels = pd.Index(uniques).astype(str)
+        else:
+            labels = pd.Index(formatter(pd.Index(uniques)))
+        part_labels.append(np.asarray(labels, dtype=object))
+        missing |= codes < 0
+        if labels.isna().any() == True:
+            missing |= np.asarray(labels.isna()).take(np.where(codes < 0, 0, codes)) & (codes >= 0)
+        key = key * len(uniques) + np.where(codes < 0, 0, codes)
+    codes = np.full(len(key), -1, dtype=np.intp)
+    codes[~missing], combinations = pd.factorize(key[~missing])
+    for i in range(len(parts)):
+        size = np.prod([len(labels_j) for labels_j in part_labels[i + 1:]], dtype=np.int64)
+        part_codes = (combinations // size) % len(part_labels[i])
+        if i == 0:
+            labels = part_labels[i].take(part_codes)
+        else:
+            labels = labels + sep + part_labels[i].take(part_codes)
+    label_codes, categories = pd.factorize(pd.Index(labels, dtype=object), sort=True)
+    codes = np.where(codes < 0, -1, label_codes.take(np.where(codes < 0, 0, codes)))
+    return pd.Categorical.from_codes(codes, categories=pd.Index(categories).astype(str))
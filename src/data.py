@@ -0,0 +1,670 @@
+"""
+Loading the PIAAC data.
+
+Mappings:
+---------
+
+SCHEMA
+    Column name -> dtype of every PIAAC variable used by the toolbox.
+
+Functions:
+----------
+
+schema_columns(skill_domains)
+    Return the schema of the columns used by the toolbox.
+    last update: 18/10/2026
+
+load_piaac(path, log_df, columns, skill_domains, engine)
+    Load the columns of the PIAAC dataset used by the toolbox with compact numeric dtypes.
+    last update: 18/10/2026
+
+file_hash(path)
+    Compute the SHA-256 digest of a file.
+    last update: 18/10/2026
+
+cache_key(paths, params)
+    Compute the content address of a cleaned dataset.
+    last update: 18/10/2026
+
+evict(cache_dir, max_size, keep)
+    Remove the least recently used cache entries until the cache fits into [max_size].
+    last update: 18/10/2026
+
+ingest(source, log_df, max_workers, columns, skill_domains, engine)
+    Load several PIAAC files (e.g. one per country) in parallel and pool them.
+    last update: 18/10/2026
+
+load_clean(paths, log_df, cache_dir, max_size, columns, skill_domains)
+    Load and clean the PIAAC dataset, reusing a cached result when the inputs have not changed.
+    last update: 18/10/2026
+
+country_ids(countries)
+    Convert country IDs, names or codes to country IDs.
+    last update: 18/10/2026
+
+write_partitioned(piaac_df, path, log_df, overwrite)
+    Write the PIAAC dataset as a parquet dataset partitioned by country.
+    last update: 18/10/2026
+
+read_partitioned(path, log_df, countries, columns)
+    Read selected countries and columns of a dataset written by write_partitioned().
+    last update: 18/10/2026
+"""
+
+import pandas as pd
+import numpy as np
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+from mismatch_toolbox.src import utilities
+from mismatch_toolbox.src import codebook
+from mismatch_toolbox.src import clean
+from mismatch_toolbox.src import isco
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+except ImportError:
+    pyarrow = None
+
+# description of a partitioned dataset, ignored by pyarrow as it starts with '_'
+PARTITIONED_META = '_mismatch_toolbox.json'
+
+# codes that are only compared with integer values are stored as float32,
+# variables entering arithmetic (earnings, years, skill use items, plausible values) as float64
+SCHEMA = {
+    'cntryid': 'float32',
+    'c_d05': 'float32',
+    'earnhrbonusppp': 'float64',
+    'isco1c': 'float32',
+    'isco2c': 'float32',
+    'isco1l': 'float32',
+    'isco2l': 'float32',
+    'b_q01a': 'float32',
+    'b_q01c2': 'float64',
+    'yrsqual': 'float64',
+    'yrsget': 'float64',
+    'f_q07a': 'float32',
+    'f_q07b': 'float32',
+    'g_q01a': 'float64',
+    'g_q01b': 'float64',
+    'g_q01c': 'float64',
+    'g_q01d': 'float64',
+    'g_q01e': 'float64',
+    'g_q01f': 'float64',
+    'g_q01g': 'float64',
+    'g_q01h': 'float64',
+    'g_q02a': 'float64',
+    'g_q02b': 'float64',
+    'g_q02c': 'float64',
+    'g_q02d': 'float64',
+    'g_q03b': 'float64',
+    'g_q03c': 'float64',
+    'g_q03d': 'float64',
+    'g_q03f': 'float64',
+    'g_q03g': 'float64',
+    'g_q03h': 'float64',
+    'f_q05a': 'float64',
+    'f_q05b': 'float64'}
+
+SKILL_DOMAINS = ['lit', 'num', 'psl']
+
+def schema_columns(skill_domains=None):
+
+    """
+    Return the schema of the columns used by the toolbox.
+
+    Parameters
+    ----------
+    skill_domains : list, skill domains whose plausible values are loaded. Default is None (lit, num and psl).
+
+    Returns
+    -------
+    schema : dict, column name -> dtype, SCHEMA followed by the plausible values pv[domain]1, ..., pv[domain]10 (float64).
+    """
+
+    if skill_domains is None:
+        skill_domains = SKILL_DOMAINS
+    schema = dict(SCHEMA)
+    for domain in skill_domains:
+        for i in range(1, 11):
+            schema['pv' + domain + str(i)] = 'float64'
+    return schema
+
+
+def load_piaac(path, log_df, columns=None, skill_domains=None, engine='pyarrow'):
+
+    """
+    Load the columns of the PIAAC dataset used by the toolbox with compact numeric dtypes.
+
+    Parameters
+    ----------
+    path : str, path to the PIAAC csv file.
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe.
+    columns : list, additional columns to be loaded as they are. Default is None.
+    skill_domains : list, skill domains whose plausible values are loaded. Default is None (lit, num and psl).
+    engine : str, csv parser, 'pyarrow' (multithreaded) or 'c'. Default is 'pyarrow'
+    ('c' is used if pyarrow is not installed).
+
+    Returns
+    -------
+    piaac_df : pandas.core.frame.DataFrame, PIAAC dataset with lowercase column names.
+    log_df : pandas.core.frame.DataFrame or LogBuffer, updated log dataframe.
+
+    Description
+    -----------
+    1. read the header and match the schema columns case-insensitively (the public use files
+    have uppercase names), log the schema columns missing from the file;
+    2. parse only the matched columns;
+    3. convert every schema column to its numeric dtype (entries that are not numbers become nan,
+    as with pd.to_numeric(errors='coerce')), so the conversions of the cleaning functions are no-ops;
+    4. register the number of loaded observations and columns in [log_df].
+    """
+
+    schema = schema_columns(skill_domains)
+    if columns is None:
+        columns = []
+    if (engine == 'pyarrow') & (pyarrow is None):
+        engine = 'c'
+
+    # matching the schema columns in the header
+    header = pd.read_csv(path, nrows=0).columns
+    lower = {}
+    for name in header:
+        if name.lower() not in lower:
+            lower[name.lower()] = name
+    wanted = list(schema.keys()) + [column.lower() for column in columns if column.lower() not in schema]
+    usecols = [lower[column] for column in wanted if column in lower]
+    missing = [column for column in wanted if column not in lower]
+    log_record = 'loading ' + str(len(usecols)) + ' of ' + str(len(header)) + ' columns from ' + str(path)
+    log_df = utilities.log(log_df, log_record)
+    if len(missing) > 0:
+        log_record = 'columns not found in the file: ' + str(missing)
+        log_df = utilities.log(log_df, log_record)
+
+    # parsing the matched columns
+    if engine == 'pyarrow':
+        piaac_df = pd.read_csv(path, usecols=usecols, engine='pyarrow')
+    else:
+        piaac_df = pd.read_csv(path, usecols=usecols, low_memory=False)
+    piaac_df = piaac_df[usecols]
+    piaac_df.columns = [name.lower() for name in usecols]
+
+    # converting the schema columns to their dtypes
+    for column, dtype in schema.items():
+        if column in piaac_df.columns:
+            if pd.api.types.is_numeric_dtype(piaac_df[column]) == False:
+                piaac_df[column] = pd.to_numeric(piaac_df[column], errors='coerce')
+            piaac_df[column] = piaac_df[column].astype(dtype)
+
+    log_record = 'n=' + str(piaac_df.shape[0]) + '; ' + str(piaac_df.shape[1]) + ' columns loaded'
+    log_df = utilities.log(log_df, log_record)
+    return piaac_df, log_df
+
+
+def _load_file(path, columns, skill_domains, engine):
+
+    """
+    Load one file with load_piaac() in a worker process and return the dataset, the log records and the time taken.
+    """
+
+    start = time.perf_counter()
+    recorder = utilities.LogBuffer(quiet=True)
+    piaac_df, recorder = load_piaac(path, recorder, columns, skill_domains, engine)
+    return piaac_df, recorder.records, time.perf_counter() - start
+
+
+def ingest(source, log_df, max_workers=None, columns=None, skill_domains=None, engine='pyarrow'):
+
+    """
+    Load several PIAAC files (e.g. one per country) in parallel and pool them.
+
+    Parameters
+    ----------
+    source : str or list, directory (all the .csv files in it), glob pattern (e.g. 'data/prg*p1.csv') or list of paths.
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe.
+    max_workers : int, number of worker processes. Default is None (number of CPUs, at most one per file).
+    columns : list, additional columns to be loaded, see load_piaac(). Default is None.
+    skill_domains : list, skill domains whose plausible values are loaded, see load_piaac(). Default is None.
+    engine : str, csv parser, see load_piaac(). Default is 'pyarrow'.
+
+    Returns
+    -------
+    piaac_df : pandas.core.frame.DataFrame, pooled PIAAC dataset (files in sorted order).
+    log_df : pandas.core.frame.DataFrame or LogBuffer, updated log dataframe.
+
+    Description
+    -----------
+    1. list the files and parse them concurrently with load_piaac() in a process pool
+    (in the current process if there is a single worker);
+    2. harmonize the columns and dtypes across files: columns missing from a file are nan,
+    numeric columns get the common numeric dtype, the other columns become categoricals
+    with the union of the categories of all files;
+    3. allocate each pooled column once and copy the files into it, instead of concatenating
+    the frames (which holds the parts and the pooled copy at the same time);
+    4. register the row count and time of each file in [log_df].
+    """
+
+    # listing the files
+    if isinstance(source, str):
+        if os.path.isdir(source):
+            paths = sorted(glob.glob(os.path.join(source, '*.csv')))
+        else:
+            paths = sorted(glob.glob(source))
+    else:
+        paths = list(source)
+    if len(paths) == 0:
+        raise FileNotFoundError('no files found for ' + str(source))
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    max_workers = max(1, min(max_workers, len(paths)))
+    log_record = 'ingesting ' + str(len(paths)) + ' files with ' + str(max_workers) + ' worker(s)'
+    log_df = utilities.log(log_df, log_record)
+
+    # parsing the files
+    start = time.perf_counter()
+    if max_workers == 1:
+        results = [_load_file(path, columns, skill_domains, engine) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_load_file, paths, [columns] * len(paths),
+                                        [skill_domains] * len(paths), [engine] * len(paths)))
+    frames = [result[0] for result in results]
+    for path, (frame, records, seconds) in zip(paths, results):
+        log_record = os.path.basename(path) + ': n=' + str(frame.shape[0]) + '; ' + str(round(seconds, 3)) + 's'
+        log_df = utilities.log(log_df, log_record)
+        for record in records:
+            if record.startswith('columns not found') == True:
+                log_df = utilities.log(log_df, os.path.basename(path) + ': ' + record)
+
+    # harmonizing the columns and dtypes
+    all_columns = []
+    for frame in frames:
+        for column in frame.columns:
+            if column not in all_columns:
+                all_columns.append(column)
+    schema = list(schema_columns(skill_domains).keys())
+    all_columns = ([column for column in schema if column in all_columns]
+                   + [column for column in all_columns if column not in schema])
+    sizes = [frame.shape[0] for frame in frames]
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    pooled = {}
+    for column in all_columns:
+        parts = [frame[column] for frame in frames if column in frame.columns]
+        if all(pd.api.types.is_numeric_dtype(part.dtype) & (pd.api.types.is_bool_dtype(part.dtype) == False)
+               for part in parts) == True:
+            dtype = np.result_type(*[part.dtype for part in parts])
+            if (len(parts) < len(frames)) & (np.issubdtype(dtype, np.floating) == False):
+                dtype = np.float64
+            values = np.empty(offsets[-1], dtype=dtype)
+            for i, frame in enumerate(frames):
+                if column in frame.columns:
+                    values[offsets[i]:offsets[i + 1]] = frame[column].to_numpy()
+                else:
+                    values[offsets[i]:offsets[i + 1]] = np.nan
+            pooled[column] = values
+        else:
+            # other columns are pooled as categoricals with the union of the categories
+            for frame in frames:
+                if column in frame.columns:
+                    if isinstance(frame[column].dtype, pd.CategoricalDtype) == False:
+                        frame[column] = frame[column].astype('category')
+            kinds = set(frame[column].cat.categories.inferred_type for frame in frames if column in frame.columns)
+            if len(kinds - {'empty'}) > 1:
+                for frame in frames:
+                    if column in frame.columns:
+                        frame[column] = frame[column].cat.rename_categories(frame[column].cat.categories.astype(str))
+            categories = pd.api.types.union_categoricals([frame[column].array for frame in frames if column in frame.columns],
+                                                         ignore_order=True).categories
+            values = np.full(offsets[-1], -1, dtype=np.int32)
+            for i, frame in enumerate(frames):
+                if column in frame.columns:
+                    # the code -1 (missing) picks the appended -1
+                    positions = np.append(categories.get_indexer(frame[column].cat.categories), -1)
+                    values[offsets[i]:offsets[i + 1]] = positions.take(frame[column].cat.codes.to_numpy())
+            pooled[column] = pd.Categorical.from_codes(values, categories=categories)
+        for frame in frames:
+            if column in frame.columns:
+                del frame[column]
+    piaac_df = pd.DataFrame(pooled, columns=all_columns, copy=False)
+
+    log_record = ('n=' + str(piaac_df.shape[0]) + '; ' + str(piaac_df.shape[1]) + ' columns pooled in '
+                  + str(round(time.perf_counter() - start, 3)) + 's')
+    log_df = utilities.log(log_df, log_record)
+    return piaac_df, log_df
+
+
+def file_hash(path):
+
+    """
+    Compute the SHA-256 digest of a file (read in chunks of 1 MB).
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(paths, params):
+
+    """
+    Compute the content address of a cleaned dataset.
+
+    Parameters
+    ----------
+    paths : list, paths to the input files.
+    params : dict, loading and cleaning parameters (must be JSON serializable).
+
+    Returns
+    -------
+    key : str, SHA-256 digest of the contents of the input files, [params], the source code
+    of the loading and cleaning modules, this module and utilities included (so that a new version of the toolbox,
+    e.g. with new SCHEMA dtypes, does not reuse old results), and the versions of pandas and pyarrow
+    (which write and read the cached parquet files).
+    """
+
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(file_hash(path).encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    for module in [sys.modules[__name__], clean, isco, codebook, utilities]:
+        digest.update(inspect.getsource(module).encode())
+    digest.update((pd.__version__ + ' ' + getattr(pyarrow, '__version__', 'None')).encode())
+    digest.update(json.dumps(schema_columns(params.get('skill_domains')), sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def evict(cache_dir, max_size, keep=None):
+
+    """
+    Remove the least recently used cache entries until the cache fits into [max_size].
+
+    Parameters
+    ----------
+    cache_dir : str, cache directory.
+    max_size : int, maximum size of the cache in bytes.
+    keep : str, key of an entry that must not be removed (the entry that has just been written). Default is None.
+
+    Returns
+    -------
+    removed : list, keys of the removed entries.
+
+    Description
+    -----------
+    1. collect the entries (<key>.parquet and <key>.json) and their sizes;
+    2. remove the entries with the oldest modification time (refreshed on every cache hit)
+    until the total size is at most [max_size].
+    """
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.parquet'):
+            key = name[:-len('.parquet')]
+            files = [os.path.join(cache_dir, key + extension) for extension in ['.parquet', '.json']]
+            files = [file for file in files if os.path.exists(file)]
+            size = sum(os.path.getsize(file) for file in files)
+            entries.append((os.path.getmtime(files[0]), key, size, files))
+    entries.sort()
+    total = sum(entry[2] for entry in entries)
+    removed = []
+    for mtime, key, size, files in entries:
+        if total <= max_size:
+            break
+        if key == keep:
+            continue
+        for file in files:
+            os.remove(file)
+        total = total - size
+        removed.append(key)
+    return removed
+
+
+def _temp_path(cache_dir, key):
+
+    """
+    Create a unique temporary file for a cache entry being written.
+    """
+
+    handle, path = tempfile.mkstemp(prefix=key + '.', suffix='.tmp', dir=cache_dir)
+    os.close(handle)
+    return path
+
+
+def load_clean(paths, log_df, cache_dir, max_size=2 * 1024 ** 3, columns=None, skill_domains=None):
+
+    """
+    Load and clean the PIAAC dataset, reusing a cached result when the inputs have not changed.
+
+    Parameters
+    ----------
+    paths : str or list, path(s) to the PIAAC csv file(s).
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe.
+    cache_dir : str, cache directory (created if it does not exist).
+    max_size : int, maximum size of the cache directory in bytes. Default is 2 GB.
+    columns : list, additional columns to be loaded, see load_piaac(). Default is None.
+    skill_domains : list, skill domains whose plausible values are loaded, see load_piaac(). Default is None.
+
+    Returns
+    -------
+    piaac_df : pandas.core.frame.DataFrame, PIAAC dataset after clean.preparation(),
+    isco.education() and isco.occupations().
+    log_df : pandas.core.frame.DataFrame or LogBuffer, updated log dataframe.
+
+    Description
+    -----------
+    1. compute the cache key from the contents of the input files, the parameters
+    and the source code of the cleaning modules (see cache_key());
+    2. on a cache hit: load the cleaned dataset from <key>.parquet, replay the log records
+    and the sample attrition records stored in <key>.json, and mark the entry as recently used;
+    3. on a cache miss: load the files with load_piaac() (ingest() for several files), run the cleaning functions with a
+    shared FilterPlan, store the cleaned dataset and the new log records (written to unique temporary
+    files and moved into place), and evict the
+    least recently used entries if the cache exceeds [max_size].
+    """
+
+    if pyarrow is None:
+        raise ImportError('load_clean() requires pyarrow to read and write parquet files')
+    if isinstance(paths, str):
+        paths = [paths]
+    params = {'columns': columns, 'skill_domains': skill_domains}
+    os.makedirs(cache_dir, exist_ok=True)
+    key = cache_key(paths, params)
+    data_path = os.path.join(cache_dir, key + '.parquet')
+    log_path = os.path.join(cache_dir, key + '.json')
+
+    # cache hit
+    if os.path.exists(data_path) & os.path.exists(log_path):
+        log_record = 'loading the cleaned dataset from the cache: ' + key
+        log_df = utilities.log(log_df, log_record)
+        piaac_df = pd.read_parquet(data_path)
+        with open(log_path) as file:
+            stored = json.load(file)
+        for record in stored['records']:
+            log_df = utilities.log(log_df, record)
+        for record in stored['attrition']:
+            utilities.attrition_records(log_df).append({
+                'step': record['step'],
+                'cntryid': np.array(record['cntryid'], dtype=float),
+                'n_before': np.array(record['n_before'], dtype=np.int64),
+                'n_dropped': np.array(record['n_dropped'], dtype=np.int64)})
+        os.utime(data_path)
+        return piaac_df, log_df
+
+    # cache miss
+    log_record = 'cleaned dataset not found in the cache, cleaning: ' + key
+    log_df = utilities.log(log_df, log_record)
+    recorder = utilities.LogBuffer(quiet=True)
+    if len(paths) == 1:
+        piaac_df, recorder = load_piaac(paths[0], recorder, columns, skill_domains)
+    else:
+        piaac_df, recorder = ingest(paths, recorder, columns=columns, skill_domains=skill_domains)
+    plan = clean.FilterPlan(piaac_df)
+    piaac_df, recorder = clean.preparation(piaac_df, recorder, plan)
+    piaac_df, recorder = isco.education(piaac_df, recorder, plan)
+    piaac_df, recorder = isco.occupations(piaac_df, recorder, plan)
+    piaac_df = plan.flush(piaac_df)
+
+    for record in recorder.records:
+        log_df = utilities.log(log_df, record)
+    attrition = []
+    for record in recorder.attrition:
+        utilities.attrition_records(log_df).append(record)
+        attrition.append({'step': record['step'],
+                          'cntryid': [None if np.isnan(value) else float(value) for value in record['cntryid']],
+                          'n_before': record['n_before'].tolist(),
+                          'n_dropped': record['n_dropped'].tolist()})
+    # each writer gets its own temporary files, so that concurrent sessions missing the same key
+    # do not write into the same file (the last os.replace() wins with a complete entry)
+    data_tmp = _temp_path(cache_dir, key)
+    log_tmp = _temp_path(cache_dir, key)
+    try:
+        piaac_df.to_parquet(data_tmp, engine='pyarrow')
+        with open(log_tmp, 'w') as file:
+            json.dump({'paths': paths, 'params': params, 'records': recorder.records, 'attrition': attrition}, file, default=str)
+        os.replace(data_tmp, data_path)
+        os.replace(log_tmp, log_path)
+    finally:
+        for path in [data_tmp, log_tmp]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    removed = evict(cache_dir, max_size, keep=key)
+    if len(removed) > 0:
+        log_record = str(len(removed)) + ' cache entries removed to keep the cache under ' + str(max_size) + ' bytes'
+        log_df = utilities.log(log_df, log_record)
+    return piaac_df, log_df
+
+
+def country_ids(countries):
+
+    """
+    Convert country IDs, names or codes (see codebook.COUNTRIES) to country IDs.
+    """
+
+    ids = []
+    for country in countries:
+        if isinstance(country, str):
+            matches = [key for key, value in codebook.COUNTRIES.items() if country in value]
+            if len(matches) == 0:
+                raise ValueError('unknown country: ' + country)
+            ids.append(matches[0])
+        else:
+            ids.append(int(country))
+    return ids
+
+
+def write_partitioned(piaac_df, path, log_df, overwrite=False):
+
+    """
+    Write the PIAAC dataset as a parquet dataset partitioned by country.
+
+    Parameters
+    ----------
+    piaac_df : pandas.core.frame.DataFrame, PIAAC dataset (with cntryid).
+    path : str, root directory of the dataset.
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe.
+    overwrite : bool, if True, an existing dataset written by write_partitioned() at [path] is replaced. Default is False.
+
+    Returns
+    -------
+    log_df : pandas.core.frame.DataFrame or LogBuffer, updated log dataframe.
+
+    Description
+    -----------
+    1. write one Hive-style directory per country (path/cntryid=276/...), with the index
+    of [piaac_df] stored as a column;
+    2. store the column order and dtypes (including the categories of categorical columns)
+    in path/_mismatch_toolbox.json, so that read_partitioned() returns the same dtypes;
+    3. register the number of observations and countries in [log_df].
+    """
+
+    if pyarrow is None:
+        raise ImportError('write_partitioned() requires pyarrow')
+    if os.path.exists(path) and (len(os.listdir(path)) > 0):
+        if (overwrite == True) & os.path.exists(os.path.join(path, PARTITIONED_META)):
+            shutil.rmtree(path)
+        else:
+            raise FileExistsError(path + ' is not empty (use overwrite=True to replace a dataset written by write_partitioned())')
+
+    ids = pd.to_numeric(piaac_df['cntryid'], errors='coerce')
+    if (ids.dropna() != np.floor(ids.dropna())).any() == True:
+        raise ValueError('cntryid must contain integer country IDs')
+    meta = {'columns': list(piaac_df.columns), 'dtypes': {}, 'categories': {}}
+    for column in piaac_df.columns:
+        if isinstance(piaac_df[column].dtype, pd.CategoricalDtype):
+            meta['dtypes'][column] = 'category'
+            meta['categories'][column] = piaac_df[column].cat.categories.tolist()
+        else:
+            meta['dtypes'][column] = str(piaac_df[column].dtype)
+    piaac_df.assign(cntryid=ids.astype('Int64')).to_parquet(path, engine='pyarrow', partition_cols=['cntryid'], index=True)
+    with open(os.path.join(path, PARTITIONED_META), 'w') as file:
+        json.dump(meta, file, default=str)
+
+    log_record = 'n=' + str(piaac_df.shape[0]) + '; ' + str(ids.nunique()) + ' countries written to ' + str(path)
+    log_df = utilities.log(log_df, log_record)
+    return log_df
+
+
+def read_partitioned(path, log_df, countries=None, columns=None):
+
+    """
+    Read selected countries and columns of a dataset written by write_partitioned().
+
+    Parameters
+    ----------
+    path : str, root directory of the dataset.
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe.
+    countries : list, country IDs, names or codes to be read. Default is None (all).
+    columns : list, columns to be read (cntryid is always read). Default is None (all).
+
+    Returns
+    -------
+    piaac_df : pandas.core.frame.DataFrame, PIAAC dataset of the selected countries.
+    log_df : pandas.core.frame.DataFrame or LogBuffer, updated log dataframe.
+
+    Description
+    -----------
+    1. open the dataset with cntryid as an integer Hive partition key;
+    2. read only the partitions of [countries] (the other directories are not opened) and only [columns];
+    3. restore the column order, the dtypes and the original row order (index);
+    4. register the number of loaded observations and countries in [log_df].
+    """
+
+    if pyarrow is None:
+        raise ImportError('read_partitioned() requires pyarrow')
+    with open(os.path.join(path, PARTITIONED_META)) as file:
+        meta = json.load(file)
+    partitioning = pyarrow.dataset.partitioning(pyarrow.schema([('cntryid', pyarrow.int64())]), flavor='hive')
+    dataset = pyarrow.dataset.dataset(path, format='parquet', partitioning=partitioning)
+    if columns is None:
+        columns = meta['columns']
+    else:
+        columns = [column for column in meta['columns'] if (column in columns) | (column == 'cntryid')]
+    index_columns = [name for name in dataset.schema.names if name.startswith('__index_level_')]
+    if countries is None:
+        table = dataset.to_table(columns=columns + index_columns)
+    else:
+        table = dataset.to_table(columns=columns + index_columns,
+                                 filter=pyarrow.dataset.field('cntryid').isin(country_ids(countries)))
+    piaac_df = table.to_pandas()
+    piaac_df = piaac_df[columns]
+    for column in columns:
+        if meta['dtypes'][column] == 'category':
+            piaac_df[column] = piaac_df[column].astype(pd.CategoricalDtype(meta['categories'][column]))
+        elif str(piaac_df[column].dtype) != meta['dtypes'][column]:
+            piaac_df[column] = piaac_df[column].astype(meta['dtypes'][column])
+    piaac_df = piaac_df.sort_index()
+
+    log_record = ('n=' + str(piaac_df.shape[0]) + '; ' + str(piaac_df['cntryid'].nunique()) + ' countries and '
+                  + str(len(columns)) + ' columns loaded from ' + str(path))
+    log_df = utilities.log(log_df, log_record)
+    return piaac_df, log_df
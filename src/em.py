@@ -4,38 +4,118 @@ Functions computing education mismatch measures.
 Functions:
 ---------
 
-mean_sl(piaac_df, occ_variable, mean_name, std_name)
+sl_stats(piaac_df, occ_variable)
+    Calculate mean, standard deviation and mode of skill level for each occupation group in a single pass.
+    last update: 18/10/2026
+
+mean_sl(piaac_df, occ_variable, mean_name, std_name, compact)
     Calculate mean and standard deviation of skill level for each occupation group.
-    last update: 24/01/2025
+    last update: 18/10/2026
 
-mode_sl(piaac_df, occ_variable, mode_name, std_name)
+mode_sl(piaac_df, occ_variable, mode_name, std_name, compact)
     Calculate mode and standard deviation of skill level for each occupation group.
-    last update: 24/01/2025
+    last update: 18/10/2026
+
+rm_classify(sl, centre, spread, SDs)
+    Classify observations into realised matches categories.
+    last update: 18/10/2026
 
-rm_mean(piaac_df, SDs, log_df)
+rm_mean(piaac_df, SDs, log_df, compact)
     Measure education mismatch using mean-based realised matches.
-    last update: 24/01/2025
+    last update: 18/10/2026
 
-rm_mode(piaac_df, SDs, log_df)
+rm_mode(piaac_df, SDs, log_df, compact)
     Measure education mismatch using mode-based realised matches.
-    last update: 24/01/2025
+    last update: 18/10/2026
+
+rm_grid(piaac_df, SDs_list, centre, log_df, compact)
+    Measure education mismatch using realised matches for several thresholds at once.
+    last update: 18/10/2026
 
-ja(piaac_df, log_df)
+ja(piaac_df, log_df, compact)
     Measure education mismatch using job analysis.
-    last update: 24/01/2025
+    last update: 18/10/2026
 
-isa(piaac_df, gap, log_df)
+isa(piaac_df, gap, log_df, compact)
     Measure education mismatch using indirect self-assessment.
-    last update: 24/01/2025
+    last update: 18/10/2026
 """
 
 import pandas as pd
 import numpy as np
-import statistics as st
 import math
 from mismatch_toolbox.src import utilities
+from mismatch_toolbox.src import codebook
 
-def mean_sl(piaac_df, occ_variable, mean_name, std_name):
+def sl_stats(piaac_df, occ_variable):
+
+    """
+    Calculate mean, standard deviation and mode of skill level for each occupation group in a single pass.
+
+    Parameters:
+    ----------
+    piaac_df: DataFrame
+        PIAAC dataset
+    occ_variable: str
+        occupation variable
+
+    Returns:
+    -------
+    stats_df: DataFrame
+        group-level table indexed by occupation group with columns 'n', 'mean', 'std' and 'mode'
+    codes: numpy.ndarray
+        occupation group code of each observation (-1 for missing groups),
+        can be used with utilities.group_broadcast() to create observation-level variables
+
+    Description:
+    -----------
+    1. Encode occupation groups as integer codes
+    2. Compute the number of observations and the mean skill level for each group using bincounts
+    3. Compute the standard deviation from the bincount of squared deviations from the group mean
+    4. Compute the mode using a 2-D bincount over occupation groups and skill levels;
+       ties are resolved in favour of the skill level observed first, as in statistics.mode
+    5. Missing skill levels are ignored
+    """
+
+    codes, groups = utilities.group_codes(piaac_df, occ_variable)
+    n_groups = len(groups)
+    sl = pd.to_numeric(piaac_df['isco08_sl_o'], errors='coerce').to_numpy(dtype=float)
+    valid = (codes >= 0) & ~np.isnan(sl)
+    group = codes[valid]
+    sl_valid = sl[valid]
+
+    # mean and standard deviation
+    n = np.bincount(group, minlength=n_groups)
+    sums = np.bincount(group, weights=sl_valid, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, sums / n, math.nan)
+        sq_dev = np.bincount(group, weights=(sl_valid - mean[group]) ** 2, minlength=n_groups)
+        std = np.where(n > 1, np.sqrt(sq_dev / (n - 1)), math.nan)
+
+    # mode over the (small) skill level domain
+    mode = np.full(n_groups, math.nan)
+    if sl_valid.size > 0:
+        if (np.all(sl_valid == np.floor(sl_valid)) == True) and (sl_valid.min() >= 0) and (sl_valid.max() < 64):
+            levels = np.arange(int(sl_valid.max()) + 1, dtype=float)
+            level_idx = sl_valid.astype(np.intp)
+        else:
+            levels, level_idx = np.unique(sl_valid, return_inverse=True)
+        n_levels = len(levels)
+        key = group * n_levels + level_idx
+        counts = np.bincount(key, minlength=n_groups * n_levels).reshape(n_groups, n_levels)
+        first = np.full(n_groups * n_levels, sl.shape[0], dtype=np.intp)
+        np.minimum.at(first, key, np.flatnonzero(valid))
+        first = first.reshape(n_groups, n_levels)
+        is_max = counts == counts.max(axis=1, keepdims=True)
+        mode_idx = np.where(is_max, first, sl.shape[0] + 1).argmin(axis=1)
+        mode = np.where(n > 0, levels[mode_idx], math.nan)
+
+    stats_df = pd.DataFrame({'n': n, 'mean': mean, 'std': std, 'mode': mode}, index=groups)
+    stats_df.index.name = occ_variable
+
+    return stats_df, codes
+
+def mean_sl(piaac_df, occ_variable, mean_name, std_name, compact=False):
 
     """
     Calculate mean and standard deviation of skill level for each occupation group.
@@ -50,42 +130,31 @@ def mean_sl(piaac_df, occ_variable, mean_name, std_name):
         name of the mean skill level variable
     std_name: str
         name of the standard deviation variable
+    compact: bool
+        if True, return the group-level table instead of creating the variables. Default is False
 
     Returns:
     -------
     piaac_df: DataFrame
-        updated PIAAC dataset
+        updated PIAAC dataset (group-level table with columns [mean_name] and [std_name] if compact is True)
 
     Description:
     -----------
-    1. Loop across occupation groups, compute mean skill level for each group
-    and add the occupation group to the conditions and mean skill level to the values
-    2. Create the mean skill level variable
-    3. Repeat for standard deviation
+    1. Compute mean and standard deviation of skill level for all occupation groups at once using sl_stats()
+    2. Either return the group-level table or
+    3. Create the mean skill level and standard deviation variables by broadcasting group values to observations
     """
 
-    conditions = []
-    values = []
-    # loop across occupation groups
-    for group in piaac_df[occ_variable].unique():
-        # compute mean skill level for an occupation group
-        mean_sl = piaac_df.loc[piaac_df[occ_variable] == group, 'isco08_sl_o'].mean()
-        # add the occupation group to the conditions and mean skill level to the values
-        conditions.append((piaac_df[occ_variable] == group))
-        values.append(mean_sl)
-    # create mean_sl variable
-    piaac_df[mean_name] = np.select(conditions, values, default=math.nan)
-
-    # repeat for standard deviation
-    conditions = []
-    values = []
-    for group in piaac_df[occ_variable].unique():
-        std_sl = piaac_df.loc[piaac_df[occ_variable] == group, 'isco08_sl_o'].std()
-        conditions.append((piaac_df[occ_variable] == group))
-        values.append(std_sl)
-    piaac_df[std_name] = np.select(conditions, values, default=math.nan)
-
-def mode_sl(piaac_df, occ_variable, mode_name, std_name):
+    stats_df, codes = sl_stats(piaac_df, occ_variable)
+    if compact == True:
+        return stats_df[['mean', 'std']].rename(columns={'mean': mean_name, 'std': std_name})
+
+    piaac_df[mean_name] = utilities.group_broadcast(stats_df['mean'].to_numpy(), codes)
+    piaac_df[std_name] = utilities.group_broadcast(stats_df['std'].to_numpy(), codes)
+
+    return piaac_df
+
+def mode_sl(piaac_df, occ_variable, mode_name, std_name, compact=False):
 
     """
     Calculate mode and standard deviation of skill level for each occupation group.
@@ -100,36 +169,65 @@ def mode_sl(piaac_df, occ_variable, mode_name, std_name):
         name of the mode skill level variable
     std_name: str
         name of the standard deviation variable
+    compact: bool
+        if True, return the group-level table instead of creating the variables. Default is False
 
     Returns:
     -------
     piaac_df: DataFrame
-        updated PIAAC dataset
+        updated PIAAC dataset (group-level table with columns [mode_name] and [std_name] if compact is True)
 
     Description:
     -----------
-    1. Loop across occupation groups, compute mode skill level for each group
-    and add the occupation group to the conditions and mode skill level to the values
-    2. Create the mode skill level variable
-    3. Repeat for standard deviation
+    1. Compute mode and standard deviation of skill level for all occupation groups at once using sl_stats()
+    2. Either return the group-level table or
+    3. Create the mode skill level and standard deviation variables by broadcasting group values to observations
+    """
+
+    stats_df, codes = sl_stats(piaac_df, occ_variable)
+    if compact == True:
+        return stats_df[['mode', 'std']].rename(columns={'mode': mode_name, 'std': std_name})
+
+    piaac_df[mode_name] = utilities.group_broadcast(stats_df['mode'].to_numpy(), codes)
+    piaac_df[std_name] = utilities.group_broadcast(stats_df['std'].to_numpy(), codes)
+
+    return piaac_df
+
+def rm_classify(sl, centre, spread, SDs):
+
     """
-    conditions = []
-    values = []
-    for group in piaac_df[occ_variable].unique():
-        mode_sl = st.mode(piaac_df.loc[piaac_df[occ_variable] == group, 'isco08_sl_o'])
-        conditions.append((piaac_df[occ_variable] == group))
-        values.append(mode_sl)
-    piaac_df[mode_name] = np.select(conditions, values, default=math.nan)
-
-    conditions = []
-    values = []
-    for group in piaac_df[occ_variable].unique():
-        std_sl = piaac_df.loc[piaac_df[occ_variable] == group, 'isco08_sl_o'].std()
-        conditions.append((piaac_df[occ_variable] == group))
-        values.append(std_sl)
-    piaac_df[std_name] = np.select(conditions, values, default=math.nan)
-
-def rm_mean(piaac_df, SDs, log_df):
+    Classify observations into realised matches categories.
+
+    Parameters:
+    ----------
+    sl: numpy.ndarray
+        obtained skill level of each observation
+    centre: numpy.ndarray
+        group mean or mode of skill level broadcast to observations
+    spread: numpy.ndarray
+        group standard deviation of skill level broadcast to observations
+    SDs: float
+        Number of standard deviations defining the classification threshold
+
+    Returns:
+    -------
+    rm: numpy.ndarray
+        1 if overeducated, 0 if well-matched, -1 if undereducated and nan if missing
+
+    Description:
+    -----------
+    1. Compute the upper and lower thresholds, [centre] + [SDs] * [spread] and [centre] - [SDs] * [spread]
+    2. Assign 1 if at or above the upper threshold, 0 if at or above the lower threshold and -1 otherwise
+    3. Assign nan if the skill level or the thresholds are missing
+    """
+
+    upper = centre + SDs * spread
+    lower = centre - SDs * spread
+    rm = np.where(sl >= upper, 1.0, np.where(sl >= lower, 0.0, -1.0))
+    rm[np.isnan(sl) | np.isnan(upper) | np.isnan(lower)] = math.nan
+    return rm
+
+def rm_mean(piaac_df, SDs, log_df, compact=False):
 
     """
     Measure education mismatch using mean-based realised matches.
@@ -144,6 +242,8 @@ def rm_mean(piaac_df, SDs, log_df):
         from the mean
     log_df: DataFrame
         Log DataFrame
+    compact: bool
+        if True, store [rm_mean_[SDs]] as a nullable Int8 variable (see utilities.compact_measure()). Default is False
         
     Returns:
     -------
@@ -167,20 +267,15 @@ def rm_mean(piaac_df, SDs, log_df):
     # creating variable for country-spec mean-based RM mismatch
     log_record = 'creating [rm_mean_' + str(SDs).replace('.', '') +']: variable for country-spec mean-based RM mismatch with ' + str(SDs).replace('.', '') + ' SDs threshold'
     log_df = utilities.log(log_df, log_record)
-    piaac_df['rm_mean_' + str(SDs).replace('.', '')] = 0
-    conditions = [
-        piaac_df['isco08_sl_o'] >= piaac_df['og_mean_sl'] + SDs * piaac_df['og_std_sl'],
-        ((piaac_df['isco08_sl_o'] < piaac_df['og_mean_sl'] + SDs * piaac_df['og_std_sl']) & 
-         (piaac_df['isco08_sl_o'] >= piaac_df['og_mean_sl'] - SDs * piaac_df['og_std_sl'])),
-        piaac_df['isco08_sl_o'] < piaac_df['og_mean_sl'] - SDs * piaac_df['og_std_sl']]
-    values = [
-        1,
-        0,
-        -1]
-    piaac_df['rm_mean_' + str(SDs).replace('.', '')] = np.select(conditions, values, default=math.nan)
+    piaac_df['rm_mean_' + str(SDs).replace('.', '')] = rm_classify(piaac_df['isco08_sl_o'].to_numpy(dtype=float),
+                                                               piaac_df['og_mean_sl'].to_numpy(dtype=float),
+                                                               piaac_df['og_std_sl'].to_numpy(dtype=float),
+                                                               SDs)
     
     # count missing values in mean-based RM mismatch
     var = 'rm_mean_' + str(SDs).replace('.', '')
+    if compact == True:
+        piaac_df[var] = utilities.compact_measure(piaac_df[var])
     log_record = 'missing values cleaning skipped for [' + var + ']'
     log_df = utilities.log(log_df, log_record)
     log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[False]) + ' observations have the value of nan for ' + var)
@@ -189,7 +284,7 @@ def rm_mean(piaac_df, SDs, log_df):
     return piaac_df, log_df
 
 
-def rm_mode(piaac_df, SDs, log_df):
+def rm_mode(piaac_df, SDs, log_df, compact=False):
 
     """
     Measure education mismatch using mode-based realised matches.
@@ -204,6 +299,8 @@ def rm_mode(piaac_df, SDs, log_df):
         from the mode
     log_df: DataFrame
         Log DataFrame
+    compact: bool
+        if True, store [rm_mode_[SDs]] as a nullable Int8 variable (see utilities.compact_measure()). Default is False
 
     Returns:
     -------
@@ -231,20 +328,15 @@ def rm_mode(piaac_df, SDs, log_df):
     # creating variable for country-spec mode-based RM mismatch
     log_record = 'creating [rm_mode_' + str(SDs).replace('.', '') + ']: variable for country-spec mode-based RM mismatch with ' + str(SDs).replace('.', '') + ' SDs threshold'
     log_df = utilities.log(log_df, log_record)
-    piaac_df['rm_mode_' + str(SDs).replace('.', '')] = 0
-    conditions = [
-        piaac_df['isco08_sl_o'] >= piaac_df['og_mode_sl'] + SDs * piaac_df['og_std_sl'],
-        ((piaac_df['isco08_sl_o'] < piaac_df['og_mode_sl'] + SDs * piaac_df['og_std_sl']) & 
-         (piaac_df['isco08_sl_o'] >= piaac_df['og_mode_sl'] - SDs * piaac_df['og_std_sl'])),
-        piaac_df['isco08_sl_o'] < piaac_df['og_mode_sl'] - SDs * piaac_df['og_std_sl']]
-    values = [
-        1,
-        0,
-        -1]
-    piaac_df['rm_mode_' + str(SDs).replace('.', '')] = np.select(conditions, values, default=math.nan)
+    piaac_df['rm_mode_' + str(SDs).replace('.', '')] = rm_classify(piaac_df['isco08_sl_o'].to_numpy(dtype=float),
+                                                               piaac_df['og_mode_sl'].to_numpy(dtype=float),
+                                                               piaac_df['og_std_sl'].to_numpy(dtype=float),
+                                                               SDs)
     
     # count missing values in mode-based RM mismatch
     var = 'rm_mode_' + str(SDs).replace('.', '')
+    if compact == True:
+        piaac_df[var] = utilities.compact_measure(piaac_df[var])
     log_record = 'missing values cleaning skipped for [' + var + ']'
     log_df = utilities.log(log_df, log_record)
     log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[False]) + ' observations have the value of nan for ' + var)
@@ -252,7 +344,74 @@ def rm_mode(piaac_df, SDs, log_df):
     
     return piaac_df, log_df
 
-def ja(piaac_df, log_df):
+def rm_grid(piaac_df, SDs_list, centre, log_df, compact=False):
+
+    """
+    Measure education mismatch using realised matches for several thresholds at once.
+
+    Parameters:
+    ----------
+    piaac_df: DataFrame
+        PIAAC dataset
+    SDs_list: list
+        Numbers of standard deviations defining the classification thresholds,
+        e.g. [0.5, 1, 1.5, 2]
+    centre: str
+        'mean' for mean-based or 'mode' for mode-based realised matches
+    log_df: DataFrame
+        Log DataFrame
+    compact: bool
+        if True, return the measures as a separate DataFrame of nullable Int8 columns
+        instead of adding them to the PIAAC dataset. Default is False
+
+    Returns:
+    -------
+    piaac_df: DataFrame
+        updated PIAAC dataset (DataFrame with the rm_[centre]_[SDs] columns if compact is True)
+    log_df: DataFrame
+        updated log DataFrame
+
+    Description:
+    -----------
+    1. Calculate country-specific skill level mean (or mode) and standard deviation once using sl_stats()
+    2. Broadcast the group statistics to observations once
+    3. For each threshold in [SDs_list], create variable rm_[centre]_[SDs] using rm_classify()
+    4. Count missing values in each measure
+    """
+
+    # calculating country-specific skill level statistics once for all thresholds
+    log_record = 'calculating country-specific skill level ' + centre + ' and standard deviation'
+    log_df = utilities.log(log_df, log_record)
+    stats_df, codes = sl_stats(piaac_df, 'cntry_isco_lbl')
+    sl = piaac_df['isco08_sl_o'].to_numpy(dtype=float)
+    og_centre = utilities.group_broadcast(stats_df[centre].to_numpy(), codes)
+    og_std = utilities.group_broadcast(stats_df['std'].to_numpy(), codes)
+
+    # creating variables for country-spec RM mismatch for every threshold
+    measures = {}
+    for SDs in SDs_list:
+        var = 'rm_' + centre + '_' + str(SDs).replace('.', '')
+        log_record = 'creating [' + var + ']: variable for country-spec ' + centre + '-based RM mismatch with ' + str(SDs).replace('.', '') + ' SDs threshold'
+        log_df = utilities.log(log_df, log_record)
+        rm = rm_classify(sl, og_centre, og_std, SDs)
+        missing = np.isnan(rm)
+        if compact == True:
+            measures[var] = utilities.compact_measure(rm)
+        else:
+            piaac_df[var] = rm
+
+        # count missing values
+        log_record = 'missing values cleaning skipped for [' + var + ']'
+        log_df = utilities.log(log_df, log_record)
+        log_record = (str(int(missing.sum())) + ' observations have the value of nan for ' + var)
+        log_df = utilities.log(log_df, log_record)
+
+    if compact == True:
+        return pd.DataFrame(measures, index=piaac_df.index), log_df
+
+    return piaac_df, log_df
+
+def ja(piaac_df, log_df, compact=False):
 
     """
     Measure education mismatch using job analysis.
@@ -263,6 +422,8 @@ def ja(piaac_df, log_df):
         PIAAC dataset
     log_df: DataFrame
         Log DataFrame
+    compact: bool
+        if True, store [ja] as a nullable Int8 variable (see utilities.compact_measure()). Default is False
 
     Returns:
     -------
@@ -281,39 +442,7 @@ def ja(piaac_df, log_df):
     # creating variable for required skill level
     log_record = 'creating [isco08_sl_r]: variable for required skill level'
     log_df = utilities.log(log_df, log_record)
-    conditions = [
-        (piaac_df['isco2c'] == 11),
-        (piaac_df['isco2c'] == 12),
-        (piaac_df['isco2c'] == 13),
-        (piaac_df['isco2c'] == 14),
-        (piaac_df['isco1c'] == 2),
-        (piaac_df['isco1c'] == 3),
-        (piaac_df['isco1c'] == 4),
-        (piaac_df['isco1c'] == 5),
-        (piaac_df['isco1c'] == 6),
-        (piaac_df['isco1c'] == 7),
-        (piaac_df['isco1c'] == 8),
-        (piaac_df['isco1c'] == 9),
-        (piaac_df['isco2c'] == 1),
-        (piaac_df['isco2c'] == 2),
-        (piaac_df['isco2c'] == 3)]
-    values = [
-        4,
-        4,
-        4,
-        3,
-        4,
-        3,
-        2,
-        2,
-        2,
-        2,
-        2,
-        1,
-        3,
-        2,
-        1]
-    piaac_df['isco08_sl_r'] = np.select(conditions, values, default=math.nan)
+    piaac_df['isco08_sl_r'] = codebook.isco_groups(piaac_df['isco1c'], piaac_df['isco2c'], 'skill_level')
 
     # creating variable for JA mismatch
     log_record = 'creating [ja]: variable for JA mismatch'
@@ -327,6 +456,8 @@ def ja(piaac_df, log_df):
         0,
         -1]
     piaac_df['ja'] = np.select(conditions, values, default=math.nan)
+    if compact == True:
+        piaac_df['ja'] = utilities.compact_measure(piaac_df['ja'])
     
     # count missing values in JA mismatch
     var = 'ja'
@@ -338,7 +469,7 @@ def ja(piaac_df, log_df):
     return piaac_df, log_df
 
 
-def isa(piaac_df, gap, log_df):
+def isa(piaac_df, gap, log_df, compact=False):
 
     """
     Measure education mismatch using indirect self-assessment.
@@ -351,6 +482,8 @@ def isa(piaac_df, gap, log_df):
         Allowed gap in years of education to be classified as well-matched
     log_df: DataFrame
         Log DataFrame
+    compact: bool
+        if True, store [isa_[gap]] as a nullable Int8 variable (see utilities.compact_measure()). Default is False
 
     Returns:
     -------
@@ -393,6 +526,8 @@ def isa(piaac_df, gap, log_df):
     
     # count missing values in ISA mismatch
     var = 'isa_' + str(gap).replace('.', '')
+    if compact == True:
+        piaac_df[var] = utilities.compact_measure(piaac_df[var])
     log_record = 'missing values cleaning skipped for [' + var + ']'
     log_df = utilities.log(log_df, log_record)
     log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[False]) + ' observations have the value of nan for ' + var)
@@ -8,21 +8,37 @@ format_float(fmt, val)
     Convert a float to a string with a specified format.
     last updated: 03/02/2025
 
-shares_heatmap(piaac_df, measures_list, measures_labels, group_var, sort_by, title, y_labels, x_labels, colorbar, numbers, nan_present, size, vertical, filename, display, save)
+format_floats(fmt, values)
+    Convert an array of floats to strings with a specified format.
+    last updated: 18/10/2026
+
+shares_heatmap(piaac_df, measures_list, measures_labels, group_var, sort_by, title, y_labels, x_labels, colorbar, numbers, nan_present, size, vertical, filename, display, save, max_numbers)
     Plot a heatmap of the mismatch shares.
-    last updated: 03/02/2025
+    last updated: 18/10/2026
 
-corr_heat_map(piaac_df, corr_type, measures_list, measures_labels, country, title, x_labels, y_labels, size, filename, display, save)
+corr_heat_map(piaac_df, corr_type, measures_list, measures_labels, country, title, x_labels, y_labels, size, filename, display, save, corr_matrix)
     Plot a heatmap of the correlation matrix.
-    last updated: 03/02/2025
+    last updated: 18/10/2026
+
+render_batch(specs, piaac_df, filename, max_workers)
+    Render a batch of heatmaps headless in worker processes.
+    last updated: 18/10/2026
 """
 
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_pdf import PdfPages
 
 from mismatch_toolbox.src import utilities
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
+# figure specs and dataset inherited by the forked rendering processes (see render_batch())
+_SHARED = {}
+
 def format_float(fmt, val):
   
   """
@@ -55,6 +71,34 @@ def format_float(fmt, val):
     return "-" + ret[2:]
   return ret
 
+def format_floats(fmt, values):
+
+  """
+  Convert an array of floats to strings with a specified format (see format_float).
+
+  Parameters:
+  ----------
+    fmt : str
+        A format string.
+    values : numpy.ndarray
+        An array of floats to be formatted.
+
+    Returns:
+    -------
+    numpy.ndarray
+        An array of formatted strings.
+  """
+
+  ret = np.char.mod(fmt, values)
+  leading_zero = np.char.startswith(ret, "0.") | np.char.startswith(ret, "-0.")
+  return np.where(leading_zero, np.char.replace(ret, "0.", ".", 1), ret)
+
+
+def _measures(piaac_df, measures_list):
+
+    # float values of the measures, whether stored as float or in the compact form (see utilities.measure_values())
+    return pd.DataFrame({measure: utilities.measure_values(piaac_df[measure]) for measure in measures_list})
+
 def shares_heatmap(piaac_df, 
                    measures_list, 
                    measures_labels, 
@@ -70,17 +114,19 @@ def shares_heatmap(piaac_df,
                    vertical = True, 
                    filename = 'shares_heatmap', 
                    display = True, 
-                   save = True):
+                   save = True,
+                   max_numbers = 2000):
 
     """
     Plot a heatmap of the mismatch shares.
 
     Parameters:
     ----------
-    piaac_df : DataFrame
-        A DataFrame containing the PIAAC data.
+    piaac_df : DataFrame or SharesCube
+        A DataFrame containing the PIAAC data, or a utilities.SharesCube computed across [group_var]
+        with the medians of [sort_by] (the figure is then drawn without the microdata).
     measures_list : list
-        A list of the mismatch measures variable names.
+        A list of the mismatch shares variable names ([measure]_[share]_by_[group_var]).
     measures_labels : list
         A list of the labels for the mismatch measures.
     group_var : str
@@ -109,6 +155,9 @@ def shares_heatmap(piaac_df,
         A boolean indicating whether to display the plot. Default is True.
     save : bool
         A boolean indicating whether to save the plot. Default is True.
+    max_numbers : int
+        A maximum number of cells for which the numbers and the cell boundary ticks are drawn
+        (e.g. with group_var='cntry_isco2c_lbl' only the shading is drawn). Default is 2000, None for no limit.
 
     Returns:
     -------
@@ -123,18 +172,18 @@ def shares_heatmap(piaac_df,
     x = measures_labels
 
     # define the y-axis by the median of specified sort_by for specified group_var level
-    y = piaac_df[[group_var, sort_by]].groupby(by=[group_var]).median().round(decimals=2).sort_values(sort_by, ascending=False).reset_index(level=0).to_numpy().tolist()
-    y_new = []
-    for i in y:
-        y_new += [i[0]]
-    y = y_new
-
-    heatmap_data = np.empty((len(piaac_df[group_var].value_counts()), 1))
-    for measure in measures_list:
-        heatmap_data = np.append(heatmap_data, np.delete(np.array(
-            piaac_df[[group_var, sort_by, measure]].groupby(by=[group_var]).median().sort_values(sort_by, ascending=False)),
-                                                         0, 1), axis=1)
-    heatmap_data = np.delete(heatmap_data, 0, 1)
+    # and collect the median shares of the groups in the same order
+    if isinstance(piaac_df, utilities.SharesCube):
+        if piaac_df.group_var != group_var:
+            raise ValueError('the cube is computed across [' + piaac_df.group_var + '], not [' + group_var + ']')
+        order = piaac_df.order(sort_by)
+        y = piaac_df.groups[order].tolist()
+        heatmap_data = np.column_stack([piaac_df.column(measure)[order] for measure in measures_list])
+    else:
+        medians = piaac_df[[group_var, sort_by] + list(measures_list)].groupby(by=[group_var], observed=True).median()
+        medians = medians.sort_values(sort_by, ascending=False, kind='stable')
+        y = medians.index.tolist()
+        heatmap_data = medians[list(measures_list)].to_numpy(dtype=float)
     heatmap_data = np.around(heatmap_data, decimals=2)
     
     if vertical == False:
@@ -147,14 +196,18 @@ def shares_heatmap(piaac_df,
     fig = plt.figure(figsize=size)
     ax = fig.subplots()
     
+    # the lower limit of the colour scale is the second smallest distinct value
     if nan_present == True:
-        unique_values = np.unique(heatmap_data).tolist()
-        unique_values.sort()
-        min_value = unique_values[1]
+        values = heatmap_data[~np.isnan(heatmap_data)]
+        above_min = values[values > values.min()]
+        min_value = above_min.min() if above_min.size > 0 else np.nan
         im = ax.imshow(heatmap_data, cmap='Greys', vmin=min_value)
     else:
         im = ax.imshow(heatmap_data, cmap='Greys')
 
+    # large heatmaps are drawn without the numbers and the cell boundary ticks
+    large = (max_numbers is not None) and (heatmap_data.size > max_numbers)
+
     # colour schemes can be found at
     # https://matplotlib.org/stable/tutorials/colors/colormaps.html
 
@@ -189,8 +242,9 @@ def shares_heatmap(piaac_df,
 
     # Turn spines off and create white grid.
     ax.spines[:].set_visible(False)
-    ax.set_xticks(np.arange(heatmap_data.shape[1] + 1) - .5, minor=True)
-    ax.set_yticks(np.arange(heatmap_data.shape[0] + 1) - .5, minor=True)
+    if large == False:
+        ax.set_xticks(np.arange(heatmap_data.shape[1] + 1) - .5, minor=True)
+        ax.set_yticks(np.arange(heatmap_data.shape[0] + 1) - .5, minor=True)
     #ax.grid(which="minor", color="w", linestyle='-')
     ax.tick_params(which="minor", bottom=False, left=False)
     ax.yaxis.tick_right()
@@ -200,21 +254,24 @@ def shares_heatmap(piaac_df,
     #plt.setp(ax.get_yticklabels(), rotation=0, ha="left", va="center", rotation_mode="anchor")
 
     threshold = im.norm(heatmap_data.max()) / 2.
-    textcolors = ("black", "white")
+    textcolors = np.array(["black", "white"])
 
-    # Loop over data dimensions and create text annotations.
-    if numbers == True:
+    # Create text annotations with the labels and colours computed for the whole matrix at once,
+    # unless the matrix has more than max_numbers cells.
+    if (numbers == True) and (large == False):
+        labels = format_floats("%.2f", heatmap_data)
+        colors = textcolors[np.ma.filled(im.norm(heatmap_data) > threshold, False).astype(int)]
         for i in range(len(y)):
             for j in range(len(x)):
-                text = ax.text(j, i, format_float("%.2f", heatmap_data[i, j]), ha="center", va="center",
-                               color=textcolors[int(im.norm(heatmap_data[i, j]) > threshold)],
+                text = ax.text(j, i, labels[i, j], ha="center", va="center",
+                               color=colors[i, j],
                                fontsize=14, rotation=0)
 
     ax.set_title(title, fontsize=22, rotation='horizontal', ha='center')
     fig.tight_layout()
     
     if save == True:
-        plt.savefig(filename + '.pdf', bbox_inches="tight")
+        fig.savefig(filename + '.pdf', bbox_inches="tight")
     
     if display == True:
         plt.show()
@@ -234,7 +291,8 @@ def corr_heat_map(piaac_df,
                   size = (5, 5), 
                   filename = 'corr_heatmap', 
                   display = True, 
-                  save = True):
+                  save = True,
+                  corr_matrix = None):
 
     """
     Plot a heatmap of the correlation matrix.
@@ -265,6 +323,10 @@ def corr_heat_map(piaac_df,
         A boolean indicating whether to display the plot. Default is True.
     save : bool
         A boolean indicating whether to save the plot. Default is True.
+    corr_matrix : array-like
+        A precomputed k x k correlation matrix of [measures_list] for [country], e.g. one slice of
+        utilities.mcc_tensor(piaac_df, measures_list, 'cntryname') computed once for all the countries.
+        Default is None (computed from [piaac_df]).
 
     Returns:
     -------
@@ -279,7 +341,14 @@ def corr_heat_map(piaac_df,
     x = measures_labels
     y = measures_labels
     
-    if (country == 'all') & (corr_type == 'matthews'):
+    if corr_matrix is not None:
+        heatmap_data = np.round(np.asarray(corr_matrix, dtype=float), 2)
+        if corr_type == 'matthews':
+            bar_label = "Matthews correlation coefficient"
+        else:
+            bar_label = "Pearson correlation coefficient"
+
+    elif (country == 'all') & (corr_type == 'matthews'):
         heatmap_data = np.array(utilities.mcc_matrix(piaac_df, measures_list).round(2))
         bar_label = "Matthews correlation coefficient"
         
@@ -288,11 +357,11 @@ def corr_heat_map(piaac_df,
         bar_label = "Matthews correlation coefficient"
         
     elif (country == 'all') & (corr_type == 'pearson'):
-        heatmap_data = np.array(piaac_df[measures_list].corr().round(2))
+        heatmap_data = np.array(_measures(piaac_df, measures_list).corr().round(2))
         bar_label = "Pearson correlation coefficient"
         
     elif (country != 'all') & (corr_type == 'pearson'):
-        heatmap_data = np.array(piaac_df.loc[piaac_df['cntryname'] == country, measures_list].corr().round(2))
+        heatmap_data = np.array(_measures(piaac_df.loc[piaac_df['cntryname'] == country], measures_list).corr().round(2))
         bar_label = "Pearson correlation coefficient"
 
     
@@ -349,4 +418,127 @@ def corr_heat_map(piaac_df,
     if display == True:
         plt.show()
 
-    return plt
\ No newline at end of file
+    return plt
+
+
+# plotting functions available to render_batch(), their default filenames and the options used to save their figures
+PLOTS = {'shares_heatmap': (shares_heatmap, 'shares_heatmap', {'bbox_inches': 'tight'}),
+         'corr_heat_map': (corr_heat_map, 'corr_heatmap', {})}
+
+
+def _filename(i, spec):
+
+    """
+    Return the filename of a spec, by default the filename of its plot suffixed with the spec number.
+    """
+
+    if 'filename' in spec:
+        return spec['filename']
+    return PLOTS[spec['plot']][1] + '_' + str(i)
+
+
+def _render(i, spec=None, piaac_df=None, pages=False):
+
+    """
+    Render the figure of a spec in a worker process.
+    """
+
+    # the spec and the dataset are taken from the parent process unless they are passed
+    if spec is None:
+        spec = _SHARED['specs'][i]
+        piaac_df = _SHARED['piaac_df']
+        pages = _SHARED['pages']
+    plt.switch_backend('Agg')
+    kwargs = dict(spec)
+    plot = kwargs.pop('plot')
+    function, save_kwargs = PLOTS[plot][0], PLOTS[plot][2]
+    kwargs.setdefault('piaac_df', piaac_df)
+    kwargs.setdefault('filename', _filename(i, spec))
+    kwargs['display'] = False
+    kwargs['save'] = pages == False
+    function(**kwargs)
+    fig = plt.gcf()
+    if pages == True:
+        plt.close(fig)
+        return fig, save_kwargs
+    plt.close('all')
+    return kwargs['filename'] + '.pdf'
+
+
+def render_batch(specs, piaac_df=None, filename=None, max_workers=None):
+
+    """
+    Render a batch of heatmaps headless in worker processes.
+
+    Parameters:
+    ----------
+    specs : list
+        A list of dicts, each with the key 'plot' ('shares_heatmap' or 'corr_heat_map') and the keyword
+        arguments of the plotting function, e.g. {'plot': 'corr_heat_map', 'corr_matrix': mcc[g], ...}.
+        'display' and 'save' are set by render_batch.
+    piaac_df : DataFrame or SharesCube
+        The data used by the specs without their own 'piaac_df'. Default is None (precomputed data only:
+        a utilities.SharesCube for shares_heatmap, 'corr_matrix' for corr_heat_map).
+    filename : str
+        A filename of a multi-page PDF with one page per spec. Default is None (each figure is saved to
+        the 'filename' of its spec, or to '<plot filename>_<spec number>' if the spec has none).
+    max_workers : int
+        A number of worker processes. Default is None (number of CPUs).
+
+    Returns:
+    -------
+    list
+        A list of the saved files.
+
+    Description:
+    -----------
+    The figures are drawn with the Agg backend in a process pool. The workers are forked and inherit
+    the specs and the data, so only the spec number is sent to them (on platforms without fork the specs
+    and the data are passed as arguments). Two specs saved to the same file raise a ValueError.
+
+    With a [filename] the workers return the figures, which are written to the multi-page PDF in the
+    order of the specs. The PDF backend draws every page again in this process, so the multi-page
+    output is bound by this serial write (e.g. more than half of the time for 24 correlation heatmaps)
+    and does not scale with the number of workers; for large batches save one file per spec instead.
+    """
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    max_workers = max(1, min(max_workers, len(specs)))
+    pages = filename is not None
+    if pages == False:
+        filenames = [_filename(i, spec) for i, spec in enumerate(specs)]
+        duplicates = sorted(set(name for name in filenames if filenames.count(name) > 1))
+        if len(duplicates) > 0:
+            raise ValueError('several specs are saved to the same file: ' + str(duplicates))
+    chunksize = max(1, len(specs) // (4 * max_workers))
+
+    if max_workers == 1:
+        backend = plt.get_backend()
+        try:
+            results = [_render(i, spec, piaac_df, pages) for i, spec in enumerate(specs)]
+        finally:
+            plt.switch_backend(backend)
+    elif 'fork' in multiprocessing.get_all_start_methods():
+        _SHARED['specs'] = specs
+        _SHARED['piaac_df'] = piaac_df
+        _SHARED['pages'] = pages
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                results = list(executor.map(_render, range(len(specs)), chunksize=chunksize))
+        finally:
+            _SHARED.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_render, range(len(specs)), specs, [piaac_df] * len(specs),
+                                        [pages] * len(specs), chunksize=chunksize))
+
+    if pages == False:
+        return results
+
+    # writing the figures to a multi-page PDF in the order of the specs
+    with PdfPages(filename + '.pdf') as pdf:
+        for fig, save_kwargs in results:
+            pdf.savefig(fig, **save_kwargs)
+            plt.close(fig)
+    return [filename + '.pdf']
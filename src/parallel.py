@@ -0,0 +1,493 @@
+"""
+Per-country parallel execution of the measurement pipeline.
+
+Functions:
+----------
+
+partitions(piaac_df)
+    Split the observations of the PIAAC dataset by country.
+    last update: 18/10/2026
+
+run(piaac_df, steps, log_df, max_workers)
+    Run the pipeline steps on the country partitions of the dataset in worker processes.
+    last update: 18/10/2026
+"""
+
+import pandas as pd
+import numpy as np
+import ast
+import contextlib
+import functools
+import io
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from mismatch_toolbox.src import utilities
+from mismatch_toolbox.src import clean
+from mismatch_toolbox.src import isco
+from mismatch_toolbox.src import em
+from mismatch_toolbox.src import sm
+
+# dataset and partitions inherited by the forked worker processes (see _run_partition())
+_SHARED = {}
+
+
+def partitions(piaac_df):
+
+    """
+    Split the observations of the PIAAC dataset by country.
+
+    Parameters
+    ----------
+    piaac_df : pandas.core.frame.DataFrame, PIAAC dataset.
+
+    Returns
+    -------
+    parts : list, (country ID, row positions) of each country, largest countries first
+    (observations with a missing country ID form the last partition).
+
+    Description
+    -----------
+    1. encode the country IDs with utilities.country_codes();
+    2. sort the row positions by country with a stable sort (the rows of a country keep their order);
+    3. split the sorted positions at the country boundaries.
+    """
+
+    codes, labels = utilities.country_codes(piaac_df)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(labels))
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    parts = []
+    for code in np.flatnonzero(counts[1:]) + 1:
+        parts.append((labels[code], order[offsets[code]:offsets[code + 1]]))
+    parts.sort(key=lambda part: -len(part[1]))
+    if counts[0] > 0:
+        parts.append((math.nan, order[:counts[0]]))
+    return parts
+
+
+def _collect_earn(piaac_df):
+
+    """
+    Return the row positions and earnings of a partition.
+    """
+
+    return piaac_df.index.to_numpy(), piaac_df['earn'].to_numpy(dtype=float)
+
+
+def _reduce_earn(collected):
+
+    """
+    Compute the earnings trimming bounds over all the partitions.
+    """
+
+    values = np.concatenate([values for positions, values in collected])
+    return {'bounds': clean.trim_bounds(values)}
+
+
+def _collect_alv(piaac_df, skill_vars):
+
+    """
+    Return the row positions and the variables standardised by sm.alv_batch() of a partition.
+    """
+
+    return piaac_df.index.to_numpy(), pd.concat([sm.alv_inputs(piaac_df, skill_var) for skill_var in skill_vars], axis=1)
+
+
+def _reduce_alv(collected):
+
+    """
+    Compute the moments of the variables standardised by sm.alv_batch() over all the partitions.
+    """
+
+    # the variables are put back into the serial row order, so that the sums match the serial run bit for bit
+    positions = np.concatenate([positions for positions, inputs in collected])
+    inputs_df = pd.concat([inputs for positions, inputs in collected], axis=0).iloc[np.argsort(positions, kind='stable')]
+    moments = {}
+    for var in inputs_df.columns:
+        values = pd.Series(inputs_df[var].to_numpy(dtype=float))
+        moments[var] = (values.mean(), values.std())
+    return {'moments': moments}
+
+
+def _preparation(args, kwargs):
+
+    """
+    Split clean.preparation() at the earnings trimming.
+    """
+
+    return ([(clean.preparation, args, dict(kwargs, trim_earn=False))], _collect_earn, _reduce_earn,
+            (clean.trim, ('earn',), {}))
+
+
+def _nested_standardisation(args, kwargs):
+
+    """
+    Check that sm.alv() or sm.alv_batch() does not standardise within groups across the countries
+    (the partitions would standardise within country x group, and [moments] is ignored with [by]).
+    """
+
+    if (kwargs.get('by') is not None) and (str(kwargs.get('by')).startswith('cntry') == False):
+        raise ValueError('standardising within [' + str(kwargs.get('by')) + '] needs the groups of all the countries;'
+                         + ' standardise within cntry* variables or run the step on the dataset returned by run()')
+
+
+def _alv(args, kwargs):
+
+    """
+    Split sm.alv() at the standardisation.
+    """
+
+    _nested_standardisation(args, kwargs)
+    return ([], functools.partial(_collect_alv, skill_vars=[args[0]]), _reduce_alv, (sm.alv, args, kwargs))
+
+
+def _alv_batch(args, kwargs):
+
+    """
+    Split sm.alv_batch() at the standardisation (the moments of all the skill variables are reduced at once).
+    """
+
+    _nested_standardisation(args, kwargs)
+    return ([], functools.partial(_collect_alv, skill_vars=list(args[0])), _reduce_alv, (sm.alv_batch, args, kwargs))
+
+
+# steps depending on statistics over all the countries:
+# function -> (steps run before the statistics, collect, reduce, step run with the statistics)
+GLOBAL_STEPS = {
+    clean.preparation: _preparation,
+    sm.alv: _alv,
+    sm.alv_batch: _alv_batch
+}
+
+
+def _country_features(args, kwargs):
+
+    """
+    Check that the shares are computed within groups nested in the countries (cntry* variables).
+    """
+
+    features = args[1] if len(args) > 1 else None
+    if isinstance(features, str):
+        features = [features]
+    return (features is not None) and all(str(feature).startswith('cntry') for feature in features)
+
+
+def _local_trimming(args, kwargs):
+
+    """
+    Check that clean.preparation() does not trim the earnings at the bounds over all the countries.
+    """
+
+    return kwargs.get('trim_earn', True) == False
+
+
+def _columns_output(args, kwargs):
+
+    """
+    Check that em.rm_grid() or utilities.mismatch_split() adds its columns to the dataset
+    (a separate block of measures or indicators would replace the partition).
+    """
+
+    return (kwargs.get('compact', False) == False) and (kwargs.get('output', 'columns') == 'columns')
+
+
+def _local_standardisation(args, kwargs):
+
+    """
+    Check that sm.alv() or sm.alv_batch() standardises with given moments or within groups nested in the countries.
+    """
+
+    _nested_standardisation(args, kwargs)
+    return (kwargs.get('moments') is not None) or str(kwargs.get('by')).startswith('cntry')
+
+
+# steps computed within countries: function -> None (always) or check of the step arguments
+# (the steps of GLOBAL_STEPS are computed within countries when the check is passed)
+LOCAL_STEPS = {
+    clean.preparation: _local_trimming,
+    clean.drop_nan: None,
+    clean.drop_val: None,
+    isco.education: None,
+    isco.occupations: None,
+    em.ja: None,
+    em.rm_mean: None,
+    em.rm_mode: None,
+    em.rm_grid: _columns_output,
+    em.isa: None,
+    sm.dsa: None,
+    sm.pf: None,
+    sm.pf_batch: None,
+    sm.alv: _local_standardisation,
+    sm.alv_batch: _local_standardisation,
+    utilities.mismatch_split: _columns_output,
+    utilities.mismatch_shares: _country_features
+}
+
+
+def _phases(steps):
+
+    """
+    Split the pipeline steps into phases separated by the global statistics.
+    """
+
+    phases = []
+    current = []
+    for step in steps:
+        function = step[0]
+        if len(step) > 1:
+            args = tuple(step[1])
+        else:
+            args = ()
+        if len(step) > 2:
+            kwargs = dict(step[2])
+        else:
+            kwargs = {}
+        if (function in LOCAL_STEPS) and ((LOCAL_STEPS[function] is None) or (LOCAL_STEPS[function](args, kwargs) == True)):
+            current.append((function, args, kwargs))
+        elif function in GLOBAL_STEPS:
+            before, collect, reduce, after = GLOBAL_STEPS[function](args, kwargs)
+            phases.append((current + before, collect, reduce, after))
+            current = []
+        else:
+            raise ValueError(getattr(function, '__name__', str(function)) + str(list(args))
+                             + ' is not known to be computed within countries; run it on the dataset returned by run()'
+                             + ' or register it in parallel.LOCAL_STEPS (or parallel.GLOBAL_STEPS)')
+    phases.append((current, None, None, None))
+    return phases
+
+
+def _run_partition(part, steps, collect, frame=None):
+
+    """
+    Run the steps of a phase on a partition in a worker process.
+    """
+
+    # the partition is taken from the dataset inherited from the parent process unless it is passed
+    if frame is None:
+        frame = _SHARED['frames'][part]
+        if isinstance(frame, np.ndarray):
+            frame = _SHARED['piaac_df'].take(frame)
+    log_df = utilities.LogBuffer(quiet=True)
+    start = time.perf_counter()
+    original = frame.copy()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for function, args, kwargs in steps:
+            frame, log_df = function(frame, *args, log_df, **kwargs)
+    if collect is None:
+        collected = None
+    else:
+        collected = collect(frame)
+
+    # only the surviving row positions and the added or changed columns are sent back to the parent
+    original = original.loc[frame.index]
+    changed = [column for column in frame.columns
+               if (column not in original.columns) or (frame[column].equals(original[column]) == False)]
+    delta = (frame.index.to_numpy(), list(frame.columns), frame[changed])
+    return delta, log_df.records, log_df.attrition, collected, time.perf_counter() - start
+
+
+def _apply(frame, delta):
+
+    """
+    Update a partition with the rows and columns returned by _run_partition().
+    """
+
+    positions, columns, changed = delta
+    frame = frame.loc[positions]
+    unchanged = [column for column in columns if column not in changed.columns]
+    return pd.concat([frame[unchanged], changed], axis=1)[columns]
+
+
+def _merge_attrition(records):
+
+    """
+    Add up the attrition records of the same cleaning step in several partitions.
+    """
+
+    ids = np.concatenate([record['cntryid'] for record in records])
+    ids = np.unique(ids[~np.isnan(ids)])
+    labels = np.concatenate([[math.nan], ids])
+    n_before = np.zeros(len(labels), dtype=np.int64)
+    n_dropped = np.zeros(len(labels), dtype=np.int64)
+    for record in records:
+        positions = np.where(np.isnan(record['cntryid']), 0, np.searchsorted(ids, record['cntryid']) + 1)
+        np.add.at(n_before, positions, record['n_before'])
+        np.add.at(n_dropped, positions, record['n_dropped'])
+    return {'step': _merge_steps([record['step'] for record in records]), 'cntryid': labels,
+            'n_before': n_before, 'n_dropped': n_dropped}
+
+
+def _merge_steps(steps):
+
+    """
+    Merge the descriptions of the same cleaning step in several partitions
+    (the values dropped by drop_val() may depend on the country, they are concatenated).
+    """
+
+    if all(step == steps[0] for step in steps) == True:
+        return steps[0]
+    if steps[0].startswith('drop_val [') == True:
+        start = steps[0].index(']') + 3
+        try:
+            values = []
+            for step in steps:
+                for value in ast.literal_eval(step[start:]):
+                    if value not in values:
+                        values.append(value)
+            return steps[0][:start] + str(values)
+        except (ValueError, SyntaxError):
+            pass
+    return steps[0]
+
+
+def _assemble(frames, index):
+
+    """
+    Pool the partitions in the original row order.
+    """
+
+    frames = [frame for frame in frames if isinstance(frame, pd.DataFrame) & (len(frame) > 0)] or frames[:1]
+    # categoricals get the sorted union of the categories of the partitions (as if created on the whole dataset)
+    for column in frames[0].columns:
+        if any(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames) == True:
+            categories = pd.api.types.union_categoricals(
+                [pd.Categorical(frame[column]) for frame in frames], sort_categories=True).categories
+            for frame in frames:
+                frame[column] = pd.Categorical(frame[column], categories=categories)
+    piaac_df = pd.concat(frames, axis=0)
+    piaac_df = piaac_df.iloc[np.argsort(piaac_df.index.to_numpy(), kind='stable')]
+    piaac_df.index = index.take(piaac_df.index.to_numpy())
+    return piaac_df
+
+
+def run(piaac_df, steps, log_df, max_workers=None):
+
+    """
+    Run the pipeline steps on the country partitions of the dataset in worker processes.
+
+    Parameters
+    ----------
+    piaac_df : pandas.core.frame.DataFrame, PIAAC dataset.
+    steps : list, (function, args) or (function, args, kwargs) tuples, each step is called as
+    function(piaac_df, *args, log_df, **kwargs), e.g. [(clean.preparation, ()), (isco.education, ()),
+    (isco.occupations, ()), (em.ja, ()), (em.rm_mode, (1,)), (sm.pf, ('num', 0.05, False)),
+    (sm.alv_batch, (['lit', 'num'], [1, 1.5]), {'compact': True})].
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe.
+    max_workers : int, number of worker processes. Default is None (number of CPUs, at most one per country).
+
+    Returns
+    -------
+    piaac_df : pandas.core.frame.DataFrame, updated dataset (rows in the original order).
+    log_df : pandas.core.frame.DataFrame or LogBuffer, updated log dataframe.
+
+    Description
+    -----------
+    1. split the dataset by country (see partitions());
+    2. split the steps into phases at the steps that need statistics over all the countries
+    (GLOBAL_STEPS): the earnings trimming bounds of clean.preparation() and the z-score moments
+    of sm.alv() and sm.alv_batch() (unless they standardise within countries with by='cntry...'
+    or with given moments; standardising within groups that are not nested in the countries,
+    e.g. by='gender_r', raises a ValueError); all the other steps must be registered in LOCAL_STEPS as computed within
+    countries (e.g. the measures of em and sm grouped by cntry_isco_lbl, or mismatch_shares()
+    across cntry* variables, or em.rm_grid() and mismatch_split() adding their columns to the dataset),
+    any other step raises a ValueError;
+    3. run each phase on every partition in a process pool, largest countries first;
+    the workers are forked and inherit the dataset and the partitions from this process,
+    so only the partition number is sent to them (on platforms without fork,
+    or with a single worker, the partitions are passed as arguments); the workers only send back
+    the surviving row positions and the columns added or changed by the phase;
+    4. reduce the global statistics over the partitions (in the original row order for the moments,
+    so that the results are identical to the serial run) and pass them to the next phase;
+    5. register the records of each country (prefixed with the country ID), the global statistics
+    and the time of each phase in [log_df], add up the attrition records of the countries;
+    6. pool the partitions in the original row order.
+    """
+
+    parts = partitions(piaac_df)
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    max_workers = max(1, min(max_workers, len(parts)))
+    phases = _phases(steps)
+    log_record = ('running ' + str(len(steps)) + ' steps on ' + str(len(parts)) + ' countries in '
+                  + str(len(phases)) + ' phase(s) with ' + str(max_workers) + ' worker(s)')
+    log_df = utilities.log(log_df, log_record)
+
+    # the partitions address the rows by position, the original index is restored at the end
+    index = piaac_df.index
+    piaac_df = piaac_df.set_axis(pd.RangeIndex(piaac_df.shape[0]), axis=0)
+    labels = [label for label, positions in parts]
+    frames = [positions for label, positions in parts]
+    fork = ('fork' in multiprocessing.get_all_start_methods()) & (max_workers > 1)
+
+    pending = None
+    for phase_no, (phase_steps, collect, reduce, after) in enumerate(phases):
+        if pending is not None:
+            phase_steps = [pending] + phase_steps
+        start = time.perf_counter()
+        # partitions left without observations by the previous phases are not processed any further
+        active = [i for i in range(len(frames)) if len(frames[i]) > 0]
+        if max_workers == 1:
+            results = [_run_partition(i, phase_steps, collect, _frame(piaac_df, frames[i])) for i in active]
+        elif fork == True:
+            _SHARED['piaac_df'] = piaac_df
+            _SHARED['frames'] = frames
+            try:
+                with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                    futures = [executor.submit(_run_partition, i, phase_steps, collect) for i in active]
+                    results = [future.result() for future in futures]
+            finally:
+                _SHARED.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(_run_partition, i, phase_steps, collect, _frame(piaac_df, frames[i]))
+                           for i in active]
+                results = [future.result() for future in futures]
+        for i, result in zip(active, results):
+            frames[i] = _apply(_frame(piaac_df, frames[i]), result[0])
+
+        # registering the records of the countries
+        for i, result in zip(active, results):
+            for record in result[1]:
+                log_df = utilities.log(log_df, '[' + _label(labels[i]) + '] ' + str(record))
+        for records in zip(*[result[2] for result in results]):
+            utilities.attrition_records(log_df).append(_merge_attrition(records))
+        log_record = ('phase ' + str(phase_no + 1) + ': n=' + str(sum(frame.shape[0] for frame in frames)) + '; '
+                      + str(round(time.perf_counter() - start, 3)) + 's')
+        log_df = utilities.log(log_df, log_record)
+
+        # reducing the global statistics
+        if reduce is not None:
+            statistics = reduce([result[3] for result in results])
+            log_record = after[0].__name__ + str(list(after[1])) + ' with statistics over all countries: ' + str(statistics)
+            log_df = utilities.log(log_df, log_record)
+            pending = (after[0], after[1], dict(after[2], **statistics))
+        else:
+            pending = None
+
+    piaac_df = _assemble(frames, index)
+    return piaac_df, log_df
+
+
+def _frame(piaac_df, frame):
+
+    """
+    Materialize a partition given by its row positions.
+    """
+
+    if isinstance(frame, np.ndarray):
+        return piaac_df.take(frame)
+    return frame
+
+
+def _label(label):
+
+    """
+    Format a country ID for the log.
+    """
+
+    if (isinstance(label, float) == True) and (math.isnan(label) == False) and (label == math.floor(label)):
+        return str(int(label))
+    return str(label)
@@ -0,0 +1,516 @@
+"""
+Lazy computation of the derived variables and mismatch measures.
+
+Classes:
+--------
+
+Pipeline(nodes)
+    Graph of the derived variables computing only the subgraph required by the requested outputs.
+    last update: 18/10/2026
+
+Session(nodes)
+    Pipeline remembering the values of its nodes between the calls of compute().
+    last update: 18/10/2026
+
+Functions:
+----------
+
+rm_nodes(centre, SDs)
+    Declare the realised matches measure.
+    last update: 18/10/2026
+
+isa_nodes(gap)
+    Declare the indirect self-assessment measure.
+    last update: 18/10/2026
+
+pf_nodes(skill_var, precision, dsa_relaxed)
+    Declare the Pellizzari and Fichen measure and its thresholds.
+    last update: 18/10/2026
+
+alv_nodes(skill_var, precision)
+    Declare the Allen-Levels-Van-der-Velden measure.
+    last update: 18/10/2026
+"""
+
+import pandas as pd
+import numpy as np
+import collections
+import functools
+import math
+from mismatch_toolbox.src import utilities
+from mismatch_toolbox.src import codebook
+from mismatch_toolbox.src import em
+from mismatch_toolbox.src import sm
+
+# a derived variable: its name, the names of its inputs, the kernel computing it from a dict of the input values,
+# the estimated cost in passes over the observations and whether it is a variable of the dataset
+# (internal nodes, e.g. group statistics, are only passed to the nodes depending on them)
+Node = collections.namedtuple('Node', ['name', 'inputs', 'kernel', 'cost', 'column'], defaults=[1, True])
+
+
+def _isco08_sl_r(values):
+    return codebook.isco_groups(values['isco1c'], values['isco2c'], 'skill_level')
+
+
+def _ja(values):
+    sl_o = pd.to_numeric(values['isco08_sl_o'], errors='coerce').to_numpy(dtype=float)
+    sl_r = np.asarray(values['isco08_sl_r'], dtype=float)
+    return np.select([sl_o > sl_r, sl_o == sl_r, sl_o < sl_r], [1, 0, -1], default=math.nan)
+
+
+def _group_codes(group_var, values):
+    return utilities.group_codes(values, group_var)
+
+
+def _sl_stats(values):
+    return em.sl_stats(values, 'cntry_isco_lbl')
+
+
+def _sl_broadcast(stat, values):
+    stats_df, codes = values['sl_stats']
+    return utilities.group_broadcast(stats_df[stat].to_numpy(), codes)
+
+
+def _rm(centre, SDs, values):
+    return em.rm_classify(pd.to_numeric(values['isco08_sl_o'], errors='coerce').to_numpy(dtype=float),
+                          np.asarray(values['og_' + centre + '_sl'], dtype=float),
+                          np.asarray(values['og_std_sl'], dtype=float), SDs)
+
+
+def _isa_mismatch(values):
+    return (pd.to_numeric(values['yrsqual'], errors='coerce') - pd.to_numeric(values['yrsget'], errors='coerce')).to_numpy(dtype=float)
+
+
+def _isa(gap, values):
+    mismatch = np.asarray(values['isa_mismatch'], dtype=float)
+    conditions = [(mismatch >= gap),
+                  ((mismatch < gap) & (mismatch >= gap * (-1))),
+                  (mismatch < gap * (-1))]
+    return np.select(conditions, [1, 0, -1], default=math.nan)
+
+
+def _dsa_item(var, values):
+    item = pd.to_numeric(values[var], errors='coerce').to_numpy(dtype=float)
+    return np.select([item == 1, item == 2], [1, 0], default=math.nan)
+
+
+def _dsa(error_value, values):
+    score = np.asarray(values['notchal'], dtype=float) + np.asarray(values['needtrain'], dtype=float) * 2
+    return np.select([score == 0, score == 1, score == 2, score == 3], [0, 1, -1, error_value], default=math.nan)
+
+
+def _dsa_observed(values):
+    return (np.isnan(pd.to_numeric(values['f_q07a'], errors='coerce').to_numpy(dtype=float))
+            | np.isnan(pd.to_numeric(values['f_q07b'], errors='coerce').to_numpy(dtype=float))) == False
+
+
+def _pv_average(skill_var, values):
+    return sm.pv_average(values, skill_var)
+
+
+def _zscore(var, values):
+    return sm.zscore(pd.Series(np.asarray(values[var], dtype=float))).to_numpy()
+
+
+def _alv_use(skill_var, values):
+    return sm.alv_use(pd.DataFrame({item: values[item] for item in sm.ALV_USE_ITEMS[skill_var]}), skill_var)
+
+
+def _pf_sorted(dsa_var, skill_var, values):
+    codes, groups = values['codes_cntry_isco_lbl']
+    well_matched = utilities.measure_values(values[dsa_var]) == 0
+    return utilities.group_sort(np.where(well_matched, codes, -1), np.asarray(values[skill_var], dtype=float), len(groups))
+
+
+def _pf_thresholds(sorted_name, precision, values):
+    codes, groups = values['codes_cntry_isco_lbl']
+    sorted_skill, offsets = values[sorted_name]
+    thresholds = utilities.group_quantiles(sorted_skill, offsets, [precision, 1 - precision])
+    return utilities.group_broadcast(thresholds, codes)
+
+
+def _pf(skill_var, thresholds, values):
+    # the observations dropped by sm.dsa() (missing f_q07a or f_q07b) are not classified
+    bounds = values[thresholds]
+    mismatch = sm.pf_classify(np.asarray(values[skill_var], dtype=float), bounds[:, 0], bounds[:, 1])
+    return np.where(values['dsa_observed'], mismatch, math.nan)
+
+
+def _alv(skill_var, precision, values):
+    return sm.alv_classify(values[skill_var + '_zscore'], values['alv_' + skill_var + '_use_zscore'], precision)
+
+
+# derived variables that do not depend on any parameter
+NODES = [
+    Node('isco08_sl_r', ['isco1c', 'isco2c'], _isco08_sl_r, 2),
+    Node('ja', ['isco08_sl_o', 'isco08_sl_r'], _ja, 3),
+    Node('codes_cntry_isco_lbl', ['cntry_isco_lbl'], functools.partial(_group_codes, 'cntry_isco_lbl'), 2, False),
+    Node('sl_stats', ['isco08_sl_o', 'cntry_isco_lbl'], _sl_stats, 6, False),
+    Node('og_mean_sl', ['sl_stats'], functools.partial(_sl_broadcast, 'mean'), 1),
+    Node('og_mode_sl', ['sl_stats'], functools.partial(_sl_broadcast, 'mode'), 1),
+    Node('og_std_sl', ['sl_stats'], functools.partial(_sl_broadcast, 'std'), 1),
+    Node('isa_mismatch', ['yrsqual', 'yrsget'], _isa_mismatch, 2),
+    Node('notchal', ['f_q07a'], functools.partial(_dsa_item, 'f_q07a'), 2),
+    Node('needtrain', ['f_q07b'], functools.partial(_dsa_item, 'f_q07b'), 2),
+    Node('dsa', ['notchal', 'needtrain'], functools.partial(_dsa, 9999), 4),
+    Node('dsa_relaxed', ['notchal', 'needtrain'], functools.partial(_dsa, 0), 4),
+    Node('dsa_observed', ['f_q07a', 'f_q07b'], _dsa_observed, 2, False)] + [
+    node for skill_var in sm.ALV_USE_ITEMS for node in [
+        Node(skill_var, ['pv' + skill_var + str(i) for i in range(1, 11)], functools.partial(_pv_average, skill_var), 10),
+        Node(skill_var + '_zscore', [skill_var], functools.partial(_zscore, skill_var), 3),
+        Node('alv_' + skill_var + '_use', sm.ALV_USE_ITEMS[skill_var], functools.partial(_alv_use, skill_var), len(sm.ALV_USE_ITEMS[skill_var])),
+        Node('alv_' + skill_var + '_use_zscore', ['alv_' + skill_var + '_use'], functools.partial(_zscore, 'alv_' + skill_var + '_use'), 3)]]
+
+
+def rm_nodes(centre, SDs):
+
+    """
+    Declare the realised matches measure.
+
+    Parameters:
+    ----------
+    centre: str
+        'mean' for mean-based or 'mode' for mode-based realised matches
+    SDs: float
+        Number of standard deviations defining the classification threshold
+
+    Returns:
+    -------
+    nodes: list
+        node of rm_[centre]_[SDs] (the same values as em.rm_mean() and em.rm_mode())
+    """
+
+    return [Node('rm_' + centre + '_' + str(SDs).replace('.', ''), ['isco08_sl_o', 'og_' + centre + '_sl', 'og_std_sl'],
+                 functools.partial(_rm, centre, SDs), 4)]
+
+
+def isa_nodes(gap):
+
+    """
+    Declare the indirect self-assessment measure.
+
+    Parameters:
+    ----------
+    gap: float
+        Gap between the required and the obtained years of education defining mismatch
+
+    Returns:
+    -------
+    nodes: list
+        node of isa_[gap] (the same values as em.isa())
+    """
+
+    return [Node('isa_' + str(gap).replace('.', ''), ['isa_mismatch'], functools.partial(_isa, gap), 4)]
+
+
+def pf_nodes(skill_var, precision, dsa_relaxed=False):
+
+    """
+    Declare the Pellizzari and Fichen measure and its thresholds.
+
+    Parameters:
+    ----------
+    skill_var: str
+        skill variable ('lit', 'num' or 'psl')
+    precision: float
+        precision level for the skill mismatch thresholds
+    dsa_relaxed: bool
+        relaxed DSA flag. If True, use relaxed DSA instead of regular DSA. Default is False
+
+    Returns:
+    -------
+    nodes: list
+        internal nodes of the skill of the well-matched workers sorted within each occupation group
+        [dsa_var]_[skill_var]_sorted (which does not depend on [precision]) and of the thresholds
+        [dsa_var]_[skill_var]_[precision]_thresholds, and node of pf_[skill_var]_[precision]
+        (with the suffix _relaxed if [dsa_relaxed] is True), the same values as sm.pf()
+        (the observations dropped by sm.dsa() are kept with a missing value)
+    """
+
+    dsa_var = 'dsa_relaxed' if dsa_relaxed == True else 'dsa'
+    precision_name = str(precision).replace('.', '')
+    sorted_name = dsa_var + '_' + skill_var + '_sorted'
+    thresholds = dsa_var + '_' + skill_var + '_' + precision_name + '_thresholds'
+    mismatch_var = 'pf_' + skill_var + '_' + precision_name + ('_relaxed' if dsa_relaxed == True else '')
+    return [Node(sorted_name, ['codes_cntry_isco_lbl', dsa_var, skill_var],
+                 functools.partial(_pf_sorted, dsa_var, skill_var), 5, False),
+            Node(thresholds, ['codes_cntry_isco_lbl', sorted_name],
+                 functools.partial(_pf_thresholds, sorted_name, precision), 2, False),
+            Node(mismatch_var, [skill_var, thresholds, 'dsa_observed'], functools.partial(_pf, skill_var, thresholds), 4)]
+
+
+def alv_nodes(skill_var, precision):
+
+    """
+    Declare the Allen-Levels-Van-der-Velden measure.
+
+    Parameters:
+    ----------
+    skill_var: str
+        skill variable ('lit', 'num' or 'psl')
+    precision: float
+        precision level for the skill mismatch thresholds
+
+    Returns:
+    -------
+    nodes: list
+        node of alv_[skill_var]_[precision] (the same values as sm.alv())
+    """
+
+    return [Node('alv_' + skill_var + '_' + str(precision).replace('.', ''), [skill_var + '_zscore', 'alv_' + skill_var + '_use_zscore'],
+                 functools.partial(_alv, skill_var, precision), 4)]
+
+
+class Pipeline:
+
+    """
+    Graph of the derived variables computing only the subgraph required by the requested outputs.
+
+    Parameters
+    ----------
+    nodes : list, nodes of the graph. Default is None (NODES, the derived variables without parameters).
+
+    Description
+    -----------
+    Every derived variable is declared once as a Node with its inputs and a vectorised kernel,
+    the measures with parameters are added with rm_nodes(), isa_nodes(), pf_nodes() and alv_nodes().
+    Any input that is not a node is a variable of the dataset (source). For the requested outputs,
+    compute() runs every node of the required subgraph once, in dependency order, keeps the
+    intermediate values outside the dataset and adds only the outputs to it. The dataset is not
+    filtered: the cleaning steps (clean, isco) are expected to be run before.
+
+    Attributes
+    ----------
+    nodes : dict, node name -> Node.
+    """
+
+    def __init__(self, nodes=None):
+        self.nodes = {}
+        self.add(NODES if nodes is None else nodes)
+
+    def add(self, *node_lists):
+
+        """
+        Add the nodes of one or several lists to the graph (replacing the nodes with the same names).
+        """
+
+        for nodes in node_lists:
+            for node in nodes:
+                self.nodes[node.name] = node
+        return self
+
+    def plan(self, outputs):
+
+        """
+        Return the names of the nodes required by [outputs] in dependency order.
+        """
+
+        order = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError('cycle in the graph: ' + ' -> '.join(path + [name]))
+            state[name] = 'visiting'
+            if name in self.nodes:
+                for input_name in self.nodes[name].inputs:
+                    visit(input_name, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in outputs:
+            visit(name, [])
+        return order
+
+    def explain(self, outputs, piaac_df=None):
+
+        """
+        Return the plan of [outputs] as a dataframe with the estimated cost of each node.
+
+        Parameters
+        ----------
+        outputs : list, requested variables.
+        piaac_df : pandas.core.frame.DataFrame, dataset the plan is run on (used to check the sources
+        and to count the observations). Default is None.
+
+        Returns
+        -------
+        plan_df : pandas.core.frame.DataFrame, one row per node with columns 'node', 'kind' ('source',
+        'internal', 'intermediate' or 'output'), 'inputs', 'cost' (passes over the observations)
+        and 'share' (of the total cost), plus 'rows' (cost x observations) if [piaac_df] is given.
+        """
+
+        rows = []
+        for name in self.plan(outputs):
+            if name not in self.nodes:
+                if (piaac_df is not None) and (name not in piaac_df.columns):
+                    raise KeyError('[' + name + '] is neither a node nor a variable of the dataset')
+                rows.append({'node': name, 'kind': 'source', 'inputs': '', 'cost': 0})
+                continue
+            node = self.nodes[name]
+            if name in outputs:
+                kind = 'output'
+            elif node.column == True:
+                kind = 'intermediate'
+            else:
+                kind = 'internal'
+            rows.append({'node': name, 'kind': kind, 'inputs': ', '.join(node.inputs), 'cost': node.cost})
+        plan_df = pd.DataFrame(rows, columns=['node', 'kind', 'inputs', 'cost'])
+        plan_df['share'] = (plan_df['cost'] / max(plan_df['cost'].sum(), 1)).round(3)
+        if piaac_df is not None:
+            plan_df['rows'] = plan_df['cost'] * piaac_df.shape[0]
+        return plan_df
+
+    def compute(self, piaac_df, outputs, log_df, keep=None):
+
+        """
+        Compute [outputs] and add them to the dataset.
+
+        Parameters
+        ----------
+        piaac_df : pandas.core.frame.DataFrame, PIAAC dataset.
+        outputs : list, requested variables.
+        log_df : pandas.core.frame.DataFrame, log dataframe.
+        keep : list, intermediate variables to add to the dataset as well, e.g. ['og_std_sl']. Default is None.
+
+        Returns
+        -------
+        piaac_df : pandas.core.frame.DataFrame, updated dataset.
+        log_df : pandas.core.frame.DataFrame, updated log dataframe.
+        """
+
+        if keep is None:
+            keep = []
+        order = self.plan(outputs)
+        values, n_computed = self._run(piaac_df, order)
+
+        # adding the outputs to the dataset (internal nodes are not variables of the dataset,
+        # the values are copied so that changing the dataset does not change the values stored by a Session)
+        written = [name for name in order if (name in self.nodes) and (self.nodes[name].column == True)
+                   and ((name in outputs) or (name in keep))]
+        for name in written:
+            piaac_df[name] = np.array(values[name], copy=True)
+            log_record = '[' + name + '] created'
+            log_df = utilities.log(log_df, log_record)
+        log_record = (str(n_computed) + ' nodes computed, ' + str(len([name for name in order if name in self.nodes]) - n_computed)
+                      + ' reused, ' + str(len(written)) + ' variables added')
+        log_df = utilities.log(log_df, log_record)
+
+        return piaac_df, log_df
+
+    def _run(self, piaac_df, order):
+
+        """
+        Compute the nodes of [order] and return their values and the number of nodes computed.
+        """
+
+        values = {}
+        n_computed = 0
+        for name in order:
+            if name not in self.nodes:
+                values[name] = _source(piaac_df, name)
+                continue
+            node = self.nodes[name]
+            values[name] = node.kernel({input_name: values[input_name] for input_name in node.inputs})
+            n_computed = n_computed + 1
+        return values, n_computed
+
+
+class Session(Pipeline):
+
+    """
+    Pipeline remembering the values of its nodes between the calls of compute().
+
+    Parameters
+    ----------
+    nodes : list, nodes of the graph. Default is None (NODES).
+
+    Description
+    -----------
+    Each node value is stored with a key made of the definition of the node (kernel and its parameters)
+    and the keys of its inputs, down to a fingerprint of each source variable of the dataset
+    (pd.util.hash_pandas_object() of the values and the index). When only the parameter of a measure
+    changes, e.g. rm_nodes('mean', 1) -> rm_nodes('mean', 1.5), only the nodes whose definition changed
+    are recomputed (the threshold comparison), while the group statistics, plausible value averages,
+    z-scores, DSA variables and sorted skills are reused. When a source variable of the dataset changes,
+    every node depending on it is recomputed. One value is kept per node name.
+
+    Attributes
+    ----------
+    nodes : dict, node name -> Node.
+    cache : dict, node name -> (key, value).
+    """
+
+    def __init__(self, nodes=None):
+        super().__init__(nodes)
+        self.cache = {}
+
+    def clear(self):
+
+        """
+        Forget all the stored values.
+        """
+
+        self.cache = {}
+        return self
+
+    def _run(self, piaac_df, order):
+
+        """
+        Compute the nodes of [order] that are not stored with the same key and return all their values
+        and the number of nodes computed.
+        """
+
+        values = {}
+        keys = {}
+        n_computed = 0
+        for name in order:
+            if name not in self.nodes:
+                values[name] = _source(piaac_df, name)
+                keys[name] = ('source', name, _fingerprint(values[name]))
+                continue
+            node = self.nodes[name]
+            keys[name] = (_definition(node), tuple(keys[input_name] for input_name in node.inputs))
+            cached = self.cache.get(name)
+            if (cached is not None) and (cached[0] == keys[name]):
+                values[name] = cached[1]
+                continue
+            values[name] = node.kernel({input_name: values[input_name] for input_name in node.inputs})
+            self.cache[name] = (keys[name], values[name])
+            n_computed = n_computed + 1
+        return values, n_computed
+
+
+def _source(piaac_df, name):
+
+    """
+    Return a source variable of the dataset.
+    """
+
+    if name not in piaac_df.columns:
+        raise KeyError('[' + name + '] is neither a node nor a variable of the dataset')
+    return piaac_df[name]
+
+
+def _fingerprint(values):
+
+    """
+    Return a fingerprint of the values and the index of a variable.
+    """
+
+    hashes = pd.util.hash_pandas_object(values, index=True).to_numpy()
+    return (len(hashes), int(hashes.sum()), int((hashes * np.arange(1, len(hashes) + 1, dtype=np.uint64)).sum()))
+
+
+def _definition(node):
+
+    """
+    Return the definition of a node: its kernel with the parameters bound to it and its inputs.
+    """
+
+    kernel = node.kernel
+    if isinstance(kernel, functools.partial):
+        kernel = (kernel.func, kernel.args, tuple(sorted(kernel.keywords.items())))
+    return (kernel, tuple(node.inputs))
@@ -4,21 +4,57 @@ Functions computing skill mismatch measures.
 Functions:
 ----------
 
-dsa(piaac_df, log_df)
+dsa(piaac_df, log_df, plan, compact)
     Measure skill mismatch using direct self-assessment.
-    last update: 24/01/2025
+    last update: 18/10/2026
+
+dsa_ready(piaac_df)
+    Check whether direct self-assessment has already been computed.
+    last update: 18/10/2026
+
+pv_average(piaac_df, skill_var)
+    Compute the average of the 10 plausible values of a skill variable.
+    last update: 18/10/2026
+
+pf_classify(skill, skill_min, skill_max)
+    Classify observations into Pellizzari and Fichen skill mismatch categories.
+    last update: 18/10/2026
 
 pf_thresholds(piaac_df, occ_variable, skill_variable, dsa_relaxed, l_quantile, h_quantile, log_df)
     Create Pellizzari and Fichen skill mismatch classification thresholds.
-    last update: 27/02/2025
+    last update: 18/10/2026
 
-pf(piaac_df, skill_var, precision, dsa_relaxed, log_df)
+pf(piaac_df, skill_var, precision, dsa_relaxed, log_df, compact)
     Measure skill mismatch using Pellizzari and Fichen (2017) method.
-    last update: 24/01/2025
+    last update: 18/10/2026
+
+pf_batch(piaac_df, skill_vars, precisions, dsa_variants, log_df, compact)
+    Measure skill mismatch using Pellizzari and Fichen (2017) method for several domains, precisions and DSA variants at once.
+    last update: 18/10/2026
+
+zscore(values, moments)
+    Standardise a variable with its own or with given moments.
+    last update: 18/10/2026
+
+alv_use(piaac_df, skill_var)
+    Compute the aggregate skill use variable of a skill domain.
+    last update: 18/10/2026
+
+alv_inputs(piaac_df, skill_var)
+    Compute the skill and aggregate skill use variables standardised by alv().
+    last update: 18/10/2026
 
-alv(piaac_df, skill_var, precision, log_df)
+alv_classify(skill_zscore, use_zscore, precision)
+    Classify observations into Allen-Levels-van-der-Velden skill mismatch categories.
+    last update: 18/10/2026
+
+alv(piaac_df, skill_var, precision, log_df, moments, compact, by)
     Measure skill mismatch using Allen et al. (2013) method.
-    last update: 24/01/2025
+    last update: 18/10/2026
+
+alv_batch(piaac_df, skill_vars, precisions, log_df, moments, compact, by)
+    Measure skill mismatch using Allen et al. (2013) method for several skill domains and precisions at once.
+    last update: 18/10/2026
 """
 
 import pandas as pd
@@ -27,7 +63,15 @@ import math
 from mismatch_toolbox.src import utilities
 from mismatch_toolbox.src import clean
 
-def dsa(piaac_df, log_df):
+# skill use items averaged into the aggregate skill use variable of alv()
+ALV_USE_ITEMS = {
+    'lit': ['g_q01a', 'g_q01b', 'g_q01c', 'g_q01d', 'g_q01e', 'g_q01f', 'g_q01g', 'g_q01h',
+            'g_q02a', 'g_q02b', 'g_q02c', 'g_q02d'],
+    'num': ['g_q03b', 'g_q03c', 'g_q03d', 'g_q03f', 'g_q03g', 'g_q03h'],
+    'psl': ['f_q05a', 'f_q05b']
+}
+
+def dsa(piaac_df, log_df, plan=None, compact=False):
 
     """
     Measure skill mismatch using direct self-assessment.
@@ -38,6 +82,12 @@ def dsa(piaac_df, log_df):
         PIAAC dataset
     log_df: DataFrame
         log DataFrame
+    plan: FilterPlan
+        if given, the observations are only marked for removal in [plan] and the caller
+        is responsible for plan.flush(). Default is None (the observations are removed once at the end)
+    compact: bool
+        if True, store [dsa] and [dsa_relaxed] as nullable Int8 variables, with the error category 9999
+        stored as utilities.ERROR_CODE (see utilities.compact_measure()). Default is False
 
     Returns:
     -------
@@ -58,6 +108,11 @@ def dsa(piaac_df, log_df):
     8. Count missing values in dsa_relaxed
     """
 
+    if plan is None:
+        local_plan = clean.FilterPlan(piaac_df)
+    else:
+        local_plan = plan
+
     # converting f_q07a to float
     log_record = 'converting [f_q07a] to float'
     log_df = utilities.log(log_df, log_record)
@@ -67,7 +122,7 @@ def dsa(piaac_df, log_df):
     var = 'f_q07a'
     log_record = 'check and drop for missing values in [' + var +']'
     log_df = utilities.log(log_df, log_record)
-    piaac_df, log_df = clean.drop_nan(piaac_df, var, log_df)
+    piaac_df, log_df = clean.drop_nan(piaac_df, var, log_df, local_plan)
 
     # creating variable for being not challenged enough
     log_record = 'creating variable for being not challenged enough'
@@ -89,7 +144,7 @@ def dsa(piaac_df, log_df):
     var = 'f_q07b'
     log_record = 'check and drop for missing values in [' + var +']'
     log_df = utilities.log(log_df, log_record)
-    piaac_df, log_df = clean.drop_nan(piaac_df, var, log_df)
+    piaac_df, log_df = clean.drop_nan(piaac_df, var, log_df, local_plan)
 
     # creating variable for feeling need in training
     log_record = 'creating variable for feeling need in training'
@@ -130,24 +185,126 @@ def dsa(piaac_df, log_df):
         -1,
         0]
     piaac_df['dsa_relaxed'] = np.select(conditions, values, default=math.nan)
+    if compact == True:
+        piaac_df['dsa'] = utilities.compact_measure(piaac_df['dsa'])
+        piaac_df['dsa_relaxed'] = utilities.compact_measure(piaac_df['dsa_relaxed'])
     
     # count missing values in dsa
     var = 'dsa'
     log_record = 'missing values cleaning skipped for [' + var + ']'
     log_df = utilities.log(log_df, log_record)
-    log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[False]) + ' observations have the value of nan for ' + var)
+    log_record = (str(int(local_plan.alive(piaac_df, var).isnull().sum())) + ' observations have the value of nan for ' + var)
     log_df = utilities.log(log_df, log_record)
     
     # count missing values in dsa_relaxed
     var = 'dsa_relaxed'
     log_record = 'missing values cleaning skipped for [' + var + ']'
     log_df = utilities.log(log_df, log_record)
-    log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[False]) + ' observations have the value of nan for ' + var)
+    log_record = (str(int(local_plan.alive(piaac_df, var).isnull().sum())) + ' observations have the value of nan for ' + var)
     log_df = utilities.log(log_df, log_record)
 
+    if plan is None:
+        piaac_df = local_plan.flush(piaac_df)
+
     return piaac_df, log_df
 
 
+def dsa_ready(piaac_df):
+
+    """
+    Check whether direct self-assessment has already been computed.
+
+    Parameters:
+    ----------
+    piaac_df: DataFrame
+        PIAAC dataset
+
+    Returns:
+    -------
+    ready: bool
+        True if dsa() has already been applied to the dataset
+
+    Description:
+    ------------
+    1. Check that notchal, needtrain, dsa and dsa_relaxed exist
+    2. Check that f_q07a and f_q07b are numeric and have no missing values left
+    """
+
+    for var in ['notchal', 'needtrain', 'dsa', 'dsa_relaxed', 'f_q07a', 'f_q07b']:
+        if (var in piaac_df.columns) == False:
+            return False
+    for var in ['f_q07a', 'f_q07b']:
+        if (pd.api.types.is_numeric_dtype(piaac_df[var]) == False) or (piaac_df[var].isnull().values.any() == True):
+            return False
+    return True
+
+
+def pv_average(piaac_df, skill_var):
+
+    """
+    Compute the average of the 10 plausible values of a skill variable.
+
+    Parameters:
+    ----------
+    piaac_df: DataFrame
+        PIAAC dataset
+    skill_var: str
+        skill variable ('lit', 'num' or 'psl')
+
+    Returns:
+    -------
+    skill: numpy.ndarray
+        average of pv[skill_var]1, ..., pv[skill_var]10
+
+    Description:
+    ------------
+    1. Add up the plausible values in place, in the order pv[skill_var]1, ..., pv[skill_var]10
+    2. Multiply the sum by 0.1
+    """
+
+    skill = pd.to_numeric(piaac_df['pv' + skill_var + '1'], errors='coerce').to_numpy(dtype=float).copy()
+    for i in range(2, 11):
+        skill += pd.to_numeric(piaac_df['pv' + skill_var + str(i)], errors='coerce').to_numpy(dtype=float)
+    return 0.1 * skill
+
+
+def pf_classify(skill, skill_min, skill_max):
+
+    """
+    Classify observations into Pellizzari and Fichen skill mismatch categories.
+
+    Parameters:
+    ----------
+    skill: numpy.ndarray
+        skill of each observation
+    skill_min: numpy.ndarray
+        lower threshold of each observation
+    skill_max: numpy.ndarray
+        higher threshold of each observation
+
+    Returns:
+    -------
+    pf: numpy.ndarray
+        -1 if under-skilled, 0 if well-matched, 1 if over-skilled and nan if missing
+
+    Description:
+    ------------
+    1. Assign -1 below the lower threshold
+    2. Assign 0 between the lower (inclusive) and the higher threshold
+    3. Assign 1 at or above the higher threshold
+    """
+
+    conditions = [
+        (skill < skill_min),
+        ((skill < skill_max) & (skill >= skill_min)),
+        (skill >= skill_max)]
+    values = [
+        -1,
+        0,
+        1]
+    return np.select(conditions, values, default=math.nan)
+
+
 def pf_thresholds(piaac_df, occ_variable, skill_variable, dsa_relaxed, l_quantile, h_quantile, log_df):
 
     """
@@ -179,22 +336,22 @@ def pf_thresholds(piaac_df, occ_variable, skill_variable, dsa_relaxed, l_quantil
 
     Description:
     ------------
-    1. For each occupation group, identify the lower quantile in the distribution of skill of the workers who 
-       are neither not challenged enough nor feel need in additional training
-    2. Append occupation group to the list of conditions
-    3. Append the lower quantile to the list values
-    4. Create the variable using conditions and values
-    5. For each occupation group, identify the higher quantile in the distribution of skill of the workers who
-         are neither not challenged enough nor feel need in additional training
-    6. Append occupation group to the list of conditions
-    7. Append the higher quantile to the list values
-    8. Create the variable using conditions and values
-    9. Count missing values in mismatch thresholds
+    0. Create dsa and dsa_relaxed unless they already exist (see dsa_ready())
+    1. Sort the skill of the workers who are neither not challenged enough nor feel need in additional
+       training once within each occupation group using utilities.group_sort()
+    2. Compute the lower and the higher quantiles for all occupation groups at once
+       using utilities.group_quantiles() (same interpolation as pandas)
+    3. Create both threshold variables by broadcasting the group quantiles to observations
+    4. Count missing values in mismatch thresholds
     """
     
-    log_record = 'creating dsa and dsa_relaxed'
-    log_df = utilities.log(log_df, log_record)
-    piaac_df, log_df = dsa(piaac_df, log_df)
+    if dsa_ready(piaac_df) == True:
+        log_record = 'dsa and dsa_relaxed already exist, skipping'
+        log_df = utilities.log(log_df, log_record)
+    else:
+        log_record = 'creating dsa and dsa_relaxed'
+        log_df = utilities.log(log_df, log_record)
+        piaac_df, log_df = dsa(piaac_df, log_df)
     
     if dsa_relaxed == True:
         dsa_var = 'dsa_relaxed'
@@ -203,22 +360,19 @@ def pf_thresholds(piaac_df, occ_variable, skill_variable, dsa_relaxed, l_quantil
 
     log_record = 'creating [' + dsa_var + '_' + skill_variable + '_min]: ' + occ_variable +'-specific thresholds at ' + str(l_quantile) + ' and ' + str(h_quantile) + ' percentiles'
     log_df = utilities.log(log_df, log_record)
-    conditions = []
-    values = []
-    
-    for group in piaac_df[occ_variable].unique():
-        sm_min = piaac_df.loc[(piaac_df[occ_variable] == group) * (piaac_df[dsa_var] == 0) == 1, skill_variable].quantile(l_quantile)
-        conditions.append((piaac_df[occ_variable] == group))
-        values.append(sm_min)
-    piaac_df[dsa_var + '_' + skill_variable + '_min'] = np.select(conditions, values, default=math.nan)
-
-    conditions = []
-    values = []
-    for group in piaac_df[occ_variable].unique():
-        sm_max = piaac_df.loc[(piaac_df[occ_variable] == group) * (piaac_df[dsa_var] == 0) == 1, skill_variable].quantile(h_quantile)
-        conditions.append((piaac_df[occ_variable] == group))
-        values.append(sm_max)
-    piaac_df[dsa_var + '_' + skill_variable + '_max'] = np.select(conditions, values, default=math.nan)
+
+    # sorting the skill of the well-matched workers once within each group
+    codes, groups = utilities.group_codes(piaac_df, occ_variable)
+    well_matched = utilities.measure_values(piaac_df[dsa_var]) == 0
+    sorted_skill, offsets = utilities.group_sort(np.where(well_matched, codes, -1),
+                                                 piaac_df[skill_variable].to_numpy(dtype=float),
+                                                 len(groups))
+
+    # computing both quantiles for all groups and broadcasting them to observations
+    thresholds = utilities.group_quantiles(sorted_skill, offsets, [l_quantile, h_quantile])
+    thresholds = utilities.group_broadcast(thresholds, codes)
+    piaac_df[dsa_var + '_' + skill_variable + '_min'] = thresholds[:, 0]
+    piaac_df[dsa_var + '_' + skill_variable + '_max'] = thresholds[:, 1]
     
     # count missing values in mismatch thresholds
     var = dsa_var + '_' + skill_variable + '_max'
@@ -235,7 +389,7 @@ def pf_thresholds(piaac_df, occ_variable, skill_variable, dsa_relaxed, l_quantil
 
     return piaac_df, log_df
 
-def pf(piaac_df, skill_var, precision, dsa_relaxed, log_df):
+def pf(piaac_df, skill_var, precision, dsa_relaxed, log_df, compact=False):
 
     """
     Measure skill mismatch using Pellizzari and Fichen (2017) method.
@@ -253,6 +407,8 @@ def pf(piaac_df, skill_var, precision, dsa_relaxed, log_df):
         relaxed DSA flag. If True, use relaxed DSA instead of regular DSA
     log_df: DataFrame
         log DataFrame
+    compact: bool
+        if True, store the skill mismatch variable as a nullable Int8 variable (see utilities.compact_measure()). Default is False
 
     Returns:
     -------
@@ -273,16 +429,7 @@ def pf(piaac_df, skill_var, precision, dsa_relaxed, log_df):
     # creating variable for the average of plausible values
     log_record = 'creating [' + skill_var + ']: variable for the average of literacy plausible values'
     log_df = utilities.log(log_df, log_record)
-    piaac_df[skill_var] = 0.1 * (piaac_df['pv' + skill_var + '1'] + 
-                                 piaac_df['pv' + skill_var + '2'] + 
-                                 piaac_df['pv' + skill_var + '3'] + 
-                                 piaac_df['pv' + skill_var + '4'] + 
-                                 piaac_df['pv' + skill_var + '5'] + 
-                                 piaac_df['pv' + skill_var + '6'] +
-                                 piaac_df['pv' + skill_var + '7'] +
-                                 piaac_df['pv' + skill_var + '8'] +
-                                 piaac_df['pv' + skill_var + '9'] +
-                                 piaac_df['pv' + skill_var + '10'])
+    piaac_df[skill_var] = pv_average(piaac_df, skill_var)
 
     # converting [skill_var] to float
     log_record = 'converting [' + skill_var + '] to float'
@@ -315,15 +462,11 @@ def pf(piaac_df, skill_var, precision, dsa_relaxed, log_df):
     # creating variable for skill mismatch
     log_record = 'creating [' + mismatch_var + ']: variable for literacy skill mismatch'
     log_df = utilities.log(log_df, log_record)
-    conditions = [
-        (piaac_df[skill_var] < piaac_df[skill_var_min]),
-        ((piaac_df[skill_var] < piaac_df[skill_var_max]) & (piaac_df[skill_var] >= piaac_df[skill_var_min])),
-        (piaac_df[skill_var] >= piaac_df[skill_var_max])]
-    values = [
-        -1,
-        0,
-        1]
-    piaac_df[mismatch_var] = np.select(conditions, values, default=math.nan)
+    piaac_df[mismatch_var] = pf_classify(piaac_df[skill_var].to_numpy(dtype=float),
+                                         piaac_df[skill_var_min].to_numpy(dtype=float),
+                                         piaac_df[skill_var_max].to_numpy(dtype=float))
+    if compact == True:
+        piaac_df[mismatch_var] = utilities.compact_measure(piaac_df[mismatch_var])
     
     # count missing values in [mismatch_var]
     var = mismatch_var
@@ -334,7 +477,213 @@ def pf(piaac_df, skill_var, precision, dsa_relaxed, log_df):
     
     return piaac_df, log_df
 
-def alv(piaac_df, skill_var, precision, log_df):
+def pf_batch(piaac_df, skill_vars, precisions, dsa_variants, log_df, compact=False):
+
+    """
+    Measure skill mismatch using Pellizzari and Fichen (2017) method for several
+    skill domains, precisions and DSA variants at once.
+
+    Parameters:
+    ----------
+    piaac_df: DataFrame
+        PIAAC dataset
+    skill_vars: list
+        skill variables, e.g. ['lit', 'num', 'psl']
+    precisions: list
+        precision levels for the skill mismatch thresholds, e.g. [0.05, 0.1]
+    dsa_variants: list
+        relaxed DSA flags, e.g. [False, True] for both regular and relaxed DSA
+    log_df: DataFrame
+        log DataFrame
+    compact: bool
+        if True, store the skill mismatch variables (and dsa, dsa_relaxed if created here) as nullable
+        Int8 variables (see utilities.compact_measure()). Default is False
+
+    Returns:
+    -------
+    piaac_df: DataFrame
+        updated PIAAC dataset
+    log_df: DataFrame
+        updated log DataFrame
+
+    Description:
+    ------------
+    1. Create dsa and dsa_relaxed once, unless they already exist (see dsa_ready())
+    2. For each skill variable, create the average of plausible values once
+    3. For each DSA variant, sort the skill of the well-matched workers within each
+       country-specific occupation group once
+    4. Compute the thresholds for all precisions at once and broadcast them to observations
+    5. Create pf_[skill_var]_[precision] (and pf_[skill_var]_[precision]_relaxed) for every combination
+    6. Count missing values in each measure
+
+    The threshold variables created by pf_thresholds() are not stored.
+    """
+
+    # creating dsa and dsa_relaxed once
+    if dsa_ready(piaac_df) == True:
+        log_record = 'dsa and dsa_relaxed already exist, skipping'
+        log_df = utilities.log(log_df, log_record)
+    else:
+        log_record = 'creating dsa and dsa_relaxed'
+        log_df = utilities.log(log_df, log_record)
+        piaac_df, log_df = dsa(piaac_df, log_df, compact=compact)
+
+    codes, groups = utilities.group_codes(piaac_df, 'cntry_isco_lbl')
+    quantiles = list(precisions) + [1 - precision for precision in precisions]
+
+    for skill_var in skill_vars:
+
+        # creating variable for the average of plausible values
+        log_record = 'creating [' + skill_var + ']: variable for the average of plausible values'
+        log_df = utilities.log(log_df, log_record)
+        piaac_df[skill_var] = pv_average(piaac_df, skill_var)
+        skill = piaac_df[skill_var].to_numpy(dtype=float)
+        log_record = (str(int(np.isnan(skill).sum())) + ' observations have the value of nan for [' + skill_var + ']')
+        log_df = utilities.log(log_df, log_record)
+
+        for relaxed in dsa_variants:
+            if relaxed == True:
+                dsa_var = 'dsa_relaxed'
+                suffix = '_relaxed'
+            else:
+                dsa_var = 'dsa'
+                suffix = ''
+
+            # sorting the skill of the well-matched workers once within each group
+            log_record = 'creating [' + skill_var + '] skill mismatch thresholds at ' + str(quantiles) + ' quantiles, [dsa_relaxed] = ' + str(relaxed)
+            log_df = utilities.log(log_df, log_record)
+            well_matched = utilities.measure_values(piaac_df[dsa_var]) == 0
+            sorted_skill, offsets = utilities.group_sort(np.where(well_matched, codes, -1), skill, len(groups))
+            thresholds = utilities.group_broadcast(utilities.group_quantiles(sorted_skill, offsets, quantiles), codes)
+
+            for i, precision in enumerate(precisions):
+                mismatch_var = 'pf_' + skill_var + '_' + str(precision).replace('.', '') + suffix
+                log_record = 'creating [' + mismatch_var + ']: variable for skill mismatch'
+                log_df = utilities.log(log_df, log_record)
+                piaac_df[mismatch_var] = pf_classify(skill, thresholds[:, i], thresholds[:, len(precisions) + i])
+                if compact == True:
+                    piaac_df[mismatch_var] = utilities.compact_measure(piaac_df[mismatch_var])
+                log_record = (str(int(piaac_df[mismatch_var].isnull().sum())) + ' observations have the value of nan for [' + mismatch_var + ']')
+                log_df = utilities.log(log_df, log_record)
+
+    return piaac_df, log_df
+
+def zscore(values, moments=None):
+
+    """
+    Standardise a variable with its own or with given moments.
+
+    Parameters:
+    ----------
+    values: Series
+        variable to be standardised
+    moments: tuple
+        (mean, standard deviation) to standardise with, e.g. computed over all the countries
+        when the dataset is processed by country. Default is None (the moments of [values])
+
+    Returns:
+    -------
+    zscore: Series
+        standardised variable
+    """
+
+    if moments is None:
+        moments = (values.mean(), values.std())
+    return (values - moments[0]) / moments[1]
+
+
+def alv_use(piaac_df, skill_var):
+
+    """
+    Compute the aggregate skill use variable of a skill domain.
+
+    Parameters:
+    ----------
+    piaac_df: DataFrame
+        PIAAC dataset
+    skill_var: str
+        skill variable, a key of ALV_USE_ITEMS ('lit', 'num' or 'psl')
+
+    Returns:
+    -------
+    use: ndarray
+        average of the skill use items, nan if any of them is missing
+
+    Description:
+    ------------
+    1. Stack the skill use items (ALV_USE_ITEMS) into one 2-D float array, converting them to float if necessary
+    2. Mark the observations with all the items present and average the items in one reduction
+    """
+
+    items = ALV_USE_ITEMS[skill_var]
+    block = piaac_df[items]
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in block.dtypes) == False:
+        block = block.apply(pd.to_numeric, errors='coerce')
+    stacked = block.to_numpy(dtype=float, na_value=math.nan)
+    complete = np.isnan(stacked).any(axis=1) == False
+    return np.where(complete, stacked.sum(axis=1) / len(items), math.nan)
+
+
+def alv_inputs(piaac_df, skill_var):
+
+    """
+    Compute the skill and aggregate skill use variables standardised by alv().
+
+    Parameters:
+    ----------
+    piaac_df: DataFrame
+        PIAAC dataset
+    skill_var: str
+        skill variable ('lit', 'num' or 'psl')
+
+    Returns:
+    -------
+    inputs_df: DataFrame
+        [skill_var] and [alv_<skill_var>_use] with the index of [piaac_df]
+
+    Description:
+    ------------
+    1. Average the plausible values of the skill variable (see pv_average())
+    2. Average the skill use items (see alv_use())
+
+    The values are identical to the variables created by alv(), so that their moments
+    can be computed before alv() is run (see parallel.run()).
+    """
+
+    return pd.DataFrame({skill_var: pv_average(piaac_df, skill_var),
+                         'alv_' + skill_var + '_use': alv_use(piaac_df, skill_var)},
+                        index=piaac_df.index)
+
+
+def alv_classify(skill_zscore, use_zscore, precision):
+
+    """
+    Classify observations into Allen-Levels-van-der-Velden skill mismatch categories.
+
+    Parameters:
+    ----------
+    skill_zscore: ndarray
+        standardised skill
+    use_zscore: ndarray
+        standardised aggregate skill use
+    precision: float
+        precision level for the skill mismatch thresholds
+
+    Returns:
+    -------
+    alv: ndarray
+        -1 if the skill is below the use by more than [precision], 1 if above, 0 if within,
+        nan if any input is missing or the gap is exactly at a threshold
+    """
+
+    gap = np.asarray(skill_zscore, dtype=float) - np.asarray(use_zscore, dtype=float)
+    conditions = [(gap < -precision),
+                  ((gap > -precision) & (gap < precision)),
+                  (gap > precision)]
+    return np.select(conditions, [-1, 0, 1], default=math.nan)
+
+
+def alv(piaac_df, skill_var, precision, log_df, moments=None, compact=False, by=None):
 
     """
     Measure skill mismatch using Allen et al. (2013) method.
@@ -350,6 +699,14 @@ def alv(piaac_df, skill_var, precision, log_df):
         e.g. if precision = 1.5, the thresholds will be set at the 1.5 and -1.5 z-scores
     log_df: DataFrame
         log DataFrame
+    moments: dict
+        (mean, standard deviation) of [skill_var] and [alv_<skill_var>_use] to standardise with,
+        e.g. computed over all the countries by parallel.run(). Default is None (the moments of [piaac_df])
+    compact: bool
+        if True, store the skill mismatch variable as a nullable Int8 variable (see utilities.compact_measure()). Default is False
+    by: str
+        if given, standardise within the groups of this variable, e.g. 'cntrycode' ([moments] is ignored).
+        Default is None
 
     Returns:
     -------
@@ -360,215 +717,102 @@ def alv(piaac_df, skill_var, precision, log_df):
 
     Description:
     ------------
-    1. Create variable for the average of plausible values of the skill variable
-    2. Convert the skill variable to float, count missing values
-    3. Create and standardise aggregate skill use variable  
-    4. Create Allen-Levels-van-der-Velden skill mismatch variable
-    5. Check and drop for missing values in alv skill mismatch
+    Run alv_batch() for a single skill variable and precision.
     """
 
-    # creating variable for the average of plausible values
-    log_record = 'creating [' + skill_var + ']: variable for the average of literacy plausible values'
-    log_df = utilities.log(log_df, log_record)
-    piaac_df[skill_var] = 0.1 * (piaac_df['pv' + skill_var + '1'] +
-                                 piaac_df['pv' + skill_var + '2'] +
-                                 piaac_df['pv' + skill_var + '3'] +
-                                 piaac_df['pv' + skill_var + '4'] +
-                                 piaac_df['pv' + skill_var + '5'] +
-                                 piaac_df['pv' + skill_var + '6'] +
-                                 piaac_df['pv' + skill_var + '7'] +
-                                 piaac_df['pv' + skill_var + '8'] +
-                                 piaac_df['pv' + skill_var + '9'] +
-                                 piaac_df['pv' + skill_var + '10'])
+    return alv_batch(piaac_df, [skill_var], [precision], log_df, moments, compact, by)
 
-    # converting [skill_var] to float
-    log_record = 'converting [' + skill_var + '] to float'
-    log_df = utilities.log(log_df, log_record)
-    piaac_df[skill_var] = pd.to_numeric(piaac_df[skill_var], errors='coerce')
 
-    # count missing values in [skill_var]
-    var = skill_var
-    log_record = 'missing values cleaning skipped for [' + var + ']'
-    log_df = utilities.log(log_df, log_record)
-    log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[
-        False]) + ' observations have the value of nan for [' + var + ']')
-    log_df = utilities.log(log_df, log_record)
+def alv_batch(piaac_df, skill_vars, precisions, log_df, moments=None, compact=False, by=None):
 
-    # creating a standardised version of the skill variable
-    log_record = 'creating [' + skill_var + '_zscore] (standardising)'
-    log_df = utilities.log(log_df, log_record)
-    piaac_df[skill_var + '_zscore'] = (piaac_df[skill_var] - piaac_df[skill_var].mean()) / piaac_df[skill_var].std()
+    """
+    Measure skill mismatch using Allen et al. (2013) method for several skill domains and precisions at once.
 
-    if skill_var == 'lit':
+    Parameters:
+    ----------
+    piaac_df: DataFrame
+        PIAAC dataset
+    skill_vars: list
+        skill variables, keys of ALV_USE_ITEMS, e.g. ['lit', 'num', 'psl']
+    precisions: list
+        precision levels for the skill mismatch thresholds, e.g. [0.5, 1, 1.5]
+    log_df: DataFrame
+        log DataFrame
+    moments: dict
+        (mean, standard deviation) of [skill_var] and [alv_<skill_var>_use] to standardise with,
+        e.g. computed over all the countries by parallel.run(). Default is None (the moments of [piaac_df])
+    compact: bool
+        if True, store the skill mismatch variables as nullable Int8 variables (see utilities.compact_measure()). Default is False
+    by: str
+        if given, standardise within the groups of this variable, e.g. 'cntrycode', with the group moments
+        computed at once (see utilities.group_moments()); [moments] is ignored. Default is None
 
-        # converting literacy use variables to float
-        log_record = 'converting literacy use variables to float'
-        log_df = utilities.log(log_df, log_record)
-        varlist = ['g_q01a', 'g_q01b', 'g_q01c', 'g_q01d', 'g_q01e', 'g_q01f', 'g_q01g', 'g_q01h',
-                   'g_q02a', 'g_q02b', 'g_q02c', 'g_q02d']
-        for var in varlist:
-            piaac_df[var] = pd.to_numeric(piaac_df[var], errors='coerce')
+    Returns:
+    -------
+    piaac_df: DataFrame
+        updated PIAAC dataset
+    log_df: DataFrame
+        updated log DataFrame
 
-        # creating and standardising aggregate literacy use variable
-        log_record = 'creating and standardising aggregate literacy use variables'
-        log_df = utilities.log(log_df, log_record)
-        conditions = [
-            (piaac_df['g_q01a'].isnull().astype(int) +
-            piaac_df['g_q01b'].isnull().astype(int) +
-            piaac_df['g_q01c'].isnull().astype(int) +
-            piaac_df['g_q01d'].isnull().astype(int) +
-            piaac_df['g_q01e'].isnull().astype(int) +
-            piaac_df['g_q01f'].isnull().astype(int) +
-            piaac_df['g_q01g'].isnull().astype(int) +
-            piaac_df['g_q01h'].isnull().astype(int) +
-            piaac_df['g_q02a'].isnull().astype(int) +
-            piaac_df['g_q02b'].isnull().astype(int) +
-            piaac_df['g_q02c'].isnull().astype(int) +
-            piaac_df['g_q02d'].isnull().astype(int) == 0)
-        ]
-        values = [
-            ((piaac_df['g_q01a'] +
-             piaac_df['g_q01b'] +
-             piaac_df['g_q01c'] +
-             piaac_df['g_q01d'] +
-             piaac_df['g_q01e'] +
-             piaac_df['g_q01f'] +
-             piaac_df['g_q01g'] +
-             piaac_df['g_q01h'] +
-             piaac_df['g_q02a'] +
-             piaac_df['g_q02b'] +
-             piaac_df['g_q02c'] +
-             piaac_df['g_q02d']) / 12)
-        ]
-        piaac_df['alv_lit_use'] = np.select(conditions, values, default=math.nan)
-        piaac_df['alv_lit_use_zscore'] = (piaac_df['alv_lit_use'] - piaac_df['alv_lit_use'].mean()) / piaac_df['alv_lit_use'].std()
-
-        # creating Allen-Levels-van-der-Velden skill mismatch variable for literacy
-        log_record = 'creating Allen-Levels-van-der-Velden skill mismatch variable for literacy'
-        log_df = utilities.log(log_df, log_record)
-        conditions = [
-            (piaac_df['lit_zscore'] - piaac_df['alv_lit_use_zscore'] < -precision),
-            ((piaac_df['lit_zscore'] - piaac_df['alv_lit_use_zscore'] > -precision) & (piaac_df['lit_zscore'] - piaac_df['alv_lit_use_zscore'] < precision)),
-            (piaac_df['lit_zscore'] - piaac_df['alv_lit_use_zscore'] > precision)
-        ]
-        values = [
-            -1,
-            0,
-            1
-        ]
-        piaac_df['alv_lit_' + str(precision).replace('.', '')] = np.select(conditions, values, default=math.nan)
-
-        # count missing values in [alv_lit_]
-        var = 'alv_lit_' + str(precision).replace('.', '')
-        log_record = 'missing values cleaning skipped for [' + var + ']'
-        log_df = utilities.log(log_df, log_record)
-        log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[
-            False]) + ' observations have the value of nan for [' + var + ']')
-        log_df = utilities.log(log_df, log_record)
+    Description:
+    ------------
+    1. For each skill variable, create the average of plausible values and count missing values
+    2. Create the aggregate skill use variable alv_[skill_var]_use (see alv_use())
+    3. Standardise both variables overall or within the groups of [by]
+    4. Create alv_[skill_var]_[precision] for every precision (see alv_classify())
+    5. Count missing values in each measure
+    """
 
-    elif skill_var == 'num':
+    if moments is None:
+        moments = {}
+    if by is not None:
+        codes, groups = utilities.group_codes(piaac_df, by)
 
-        # converting numeracy use variables to float
-        log_record = 'numeracy numeracy use variables to float'
-        log_df = utilities.log(log_df, log_record)
-        varlist = ['g_q03b', 'g_q03c', 'g_q03d', 'g_q03f', 'g_q03g', 'g_q03h']
-        for var in varlist:
-            piaac_df[var] = pd.to_numeric(piaac_df[var], errors='coerce')
+    for skill_var in skill_vars:
 
-        # creating and standardising aggregate numeracy use variable
-        log_record = 'creating and standardising aggregate numeracy use variables'
-        log_df = utilities.log(log_df, log_record)
-        conditions = [
-            (piaac_df['g_q03b'].isnull().astype(int) +
-             piaac_df['g_q03c'].isnull().astype(int) +
-             piaac_df['g_q03d'].isnull().astype(int) +
-             piaac_df['g_q03f'].isnull().astype(int) +
-             piaac_df['g_q03g'].isnull().astype(int) +
-             piaac_df['g_q03h'].isnull().astype(int) == 0)
-        ]
-        values = [
-            ((piaac_df['g_q03b'] +
-              piaac_df['g_q03c'] +
-              piaac_df['g_q03d'] +
-              piaac_df['g_q03f'] +
-              piaac_df['g_q03g'] +
-              piaac_df['g_q03h']) / 6)
-        ]
-        piaac_df['alv_num_use'] = np.select(conditions, values, default=math.nan)
-        piaac_df['alv_num_use_zscore'] = (piaac_df['alv_num_use'] - piaac_df['alv_num_use'].mean()) / piaac_df[
-            'alv_num_use'].std()
-
-        # creating Allen-Levels-van-der-Velden skill mismatch variable for numeracy
-        log_record = 'creating Allen-Levels-van-der-Velden skill mismatch variable for numeracy'
+        # creating variable for the average of plausible values
+        log_record = 'creating [' + skill_var + ']: variable for the average of plausible values'
         log_df = utilities.log(log_df, log_record)
-        conditions = [
-            (piaac_df['num_zscore'] - piaac_df['alv_num_use_zscore'] < -precision),
-            ((piaac_df['num_zscore'] - piaac_df['alv_num_use_zscore'] > -precision) & (
-                        piaac_df['num_zscore'] - piaac_df['alv_num_use_zscore'] < precision)),
-            (piaac_df['num_zscore'] - piaac_df['alv_num_use_zscore'] > precision)
-        ]
-        values = [
-            -1,
-            0,
-            1
-        ]
-        piaac_df['alv_num_' + str(precision).replace('.', '')] = np.select(conditions, values, default=math.nan)
-
-        # count missing values in [alv_num_]
-        var = 'alv_num_' + str(precision).replace('.', '')
-        log_record = 'missing values cleaning skipped for [' + var + ']'
+        piaac_df[skill_var] = pv_average(piaac_df, skill_var)
+        log_record = (str(int(piaac_df[skill_var].isnull().sum())) + ' observations have the value of nan for [' + skill_var + ']')
         log_df = utilities.log(log_df, log_record)
-        log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[
-            False]) + ' observations have the value of nan for [' + var + ']')
-        log_df = utilities.log(log_df, log_record)
-
-
-    elif skill_var == 'psl':
 
-        # converting problem-solving use variables to float
-        log_record = 'problem-solving numeracy use variables to float'
+        # creating the aggregate skill use variable
+        use_var = 'alv_' + skill_var + '_use'
+        log_record = 'creating [' + use_var + ']: aggregate skill use variable from ' + str(len(ALV_USE_ITEMS[skill_var])) + ' items'
         log_df = utilities.log(log_df, log_record)
-        varlist = ['f_q05a', 'f_q05b']
-        for var in varlist:
-            piaac_df[var] = pd.to_numeric(piaac_df[var], errors='coerce')
+        piaac_df[use_var] = alv_use(piaac_df, skill_var)
 
-        # creating and standardising aggregate problem-solving use variable
-        log_record = 'creating and standardising aggregate problem-solving use variables'
+        # standardising the skill and the aggregate skill use variables
+        if by is None:
+            log_record = 'creating [' + skill_var + '_zscore] and [' + use_var + '_zscore] (standardising)'
+        else:
+            log_record = 'creating [' + skill_var + '_zscore] and [' + use_var + '_zscore] (standardising within [' + by + '])'
         log_df = utilities.log(log_df, log_record)
-        conditions = [
-            (piaac_df['f_q05a'].isnull().astype(int) +
-             piaac_df['f_q05b'].isnull().astype(int) == 0)
-        ]
-        values = [
-            ((piaac_df['f_q05a'] +
-              piaac_df['f_q05b']) / 2)
-        ]
-        piaac_df['alv_psl_use'] = np.select(conditions, values, default=math.nan)
-        piaac_df['alv_psl_use_zscore'] = (piaac_df['alv_psl_use'] - piaac_df['alv_psl_use'].mean()) / piaac_df[
-            'alv_psl_use'].std()
-
-        # creating Allen-Levels-van-der-Velden skill mismatch variable for problem-solving
-        log_record = 'creating Allen-Levels-van-der-Velden skill mismatch variable for problem-solving'
-        log_df = utilities.log(log_df, log_record)
-        conditions = [
-            (piaac_df['psl_zscore'] - piaac_df['alv_psl_use_zscore'] < -precision),
-            ((piaac_df['psl_zscore'] - piaac_df['alv_psl_use_zscore'] > -precision) & (
-                    piaac_df['psl_zscore'] - piaac_df['alv_psl_use_zscore'] < precision)),
-            (piaac_df['psl_zscore'] - piaac_df['alv_psl_use_zscore'] > precision)
-        ]
-        values = [
-            -1,
-            0,
-            1
-        ]
-        piaac_df['alv_psl_' + str(precision).replace('.', '')] = np.select(conditions, values, default=math.nan)
-
-        # count missing values in [alv_psl_]
-        var = 'alv_psl_' + str(precision).replace('.', '')
-        log_record = 'missing values cleaning skipped for [' + var + ']'
-        log_df = utilities.log(log_df, log_record)
-        log_record = (str(piaac_df.shape[0] - piaac_df[var].isnull().value_counts()[
-            False]) + ' observations have the value of nan for [' + var + ']')
-        log_df = utilities.log(log_df, log_record)
-    
-    return piaac_df, log_df
\ No newline at end of file
+        for var in [skill_var, use_var]:
+            if by is None:
+                piaac_df[var + '_zscore'] = zscore(piaac_df[var], moments.get(var))
+            else:
+                values = piaac_df[var].to_numpy(dtype=float)
+                mean, std = utilities.group_moments(codes, values, len(groups))
+                piaac_df[var + '_zscore'] = (values - utilities.group_broadcast(mean, codes)) / utilities.group_broadcast(std, codes)
+
+        skill_zscore = piaac_df[skill_var + '_zscore'].to_numpy(dtype=float)
+        use_zscore = piaac_df[use_var + '_zscore'].to_numpy(dtype=float)
+        for precision in precisions:
+
+            # creating Allen-Levels-van-der-Velden skill mismatch variable
+            var = 'alv_' + skill_var + '_' + str(precision).replace('.', '')
+            log_record = 'creating [' + var + ']: variable for Allen-Levels-van-der-Velden skill mismatch'
+            log_df = utilities.log(log_df, log_record)
+            piaac_df[var] = alv_classify(skill_zscore, use_zscore, precision)
+            if compact == True:
+                piaac_df[var] = utilities.compact_measure(piaac_df[var])
+
+            # count missing values in [var]
+            log_record = 'missing values cleaning skipped for [' + var + ']'
+            log_df = utilities.log(log_df, log_record)
+            log_record = (str(int(piaac_df[var].isnull().sum())) + ' observations have the value of nan for [' + var + ']')
+            log_df = utilities.log(log_df, log_record)
+
+    return piaac_df, log_df
@@ -1,39 +1,224 @@
 """
 A set of functions for data processing and analysis. 
 
+Classes:
+--------
+
+LogBuffer(quiet, sink, log_df)
+    Append-only log buffer that can be used instead of the log dataframe.
+    last update: 18/10/2026
+
+SharesCube(group_var, groups, measures, shares, n, sort_values)
+    Compact group x measure x share cube of the mismatch shares.
+    last update: 18/10/2026
+
 Functions:
 ----------
 
 section(new_section, log_df) 
     Create a new section in the log file.
-    last update: 22/01/2025
+    last update: 18/10/2026
 
 log(log_df, record) 
     Add a new record to the log file.
-    last update: 22/01/2025
+    last update: 18/10/2026
 
 print_tab(df) 
     Print a dataframe in a tabular format.
     last update: 22/01/2025
     
+compact_measure(values)
+    Store a mismatch measure as a nullable Int8 array.
+    last update: 18/10/2026
+
+measure_values(values)
+    Return the values of a mismatch measure stored either as float or in the compact form.
+    last update: 18/10/2026
+
 mismatch_shares(piaac_df, mismatch_variable, feature, log_df)
     Compute mismatch shares within each group.
-    last update: 22/01/2025
+    last update: 18/10/2026
+
+share_cells(values)
+    Encode a mismatch variable as share category codes.
+    last update: 18/10/2026
+
+share_table(cells, codes, n_groups)
+    Compute the shares of the mismatch values within each group with a single crosstab.
+    last update: 18/10/2026
+
+shares_cube(piaac_df, mismatch_variable, feature, sort_by)
+    Compute the mismatch shares of several measures within each group as a SharesCube.
+    last update: 18/10/2026
 
 mcc_matrix(df, feature_list)
     Compute Matthew's correlation coefficient matrix.
-    last update: 22/01/2025
+    last update: 18/10/2026
 
-mismatch_split(piaac_df, measure_list)
+measure_codes(df, feature_list)
+    Encode the values of several measures with one factorization.
+    last update: 18/10/2026
+
+contingency_tables(df, feature_list, group_var, max_bins)
+    Compute the contingency tables of all pairs of measures (within each group) in one pass.
+    last update: 18/10/2026
+
+mcc_from_tables(tables)
+    Compute Matthew's correlation coefficients from contingency tables.
+    last update: 18/10/2026
+
+mcc_tensor(df, feature_list, group_var)
+    Compute Matthew's correlation coefficient matrices of all groups at once.
+    last update: 18/10/2026
+
+mismatch_split(piaac_df, measure_list, log_df, dtype, output)
     Split each measure into 3 binary variables.
-    last update: 22/01/2025
+    last update: 18/10/2026
+
+group_codes(piaac_df, group_var)
+    Encode a group variable as integer group codes.
+    last update: 18/10/2026
+
+group_broadcast(values, codes)
+    Broadcast group-level values back to the observations.
+    last update: 18/10/2026
+
+group_sort(codes, values, n_groups)
+    Sort values within each group once.
+    last update: 18/10/2026
+
+group_quantiles(sorted_values, offsets, quantiles)
+    Compute any number of quantiles for all groups at once.
+    last update: 18/10/2026
+
+group_moments(codes, values, n_groups)
+    Compute the mean and standard deviation of a variable for all groups at once.
+    last update: 18/10/2026
+
+country_codes(df)
+    Encode country IDs as dense integer codes.
+    last update: 18/10/2026
+
+attrition(log_df, step, codes, labels, drop_mask, keep)
+    Record the number of observations dropped in each country at a cleaning step.
+    last update: 18/10/2026
+
+attrition_records(log_df)
+    Return the list of the sample attrition records of a log.
+    last update: 18/10/2026
+
+attrition_table(log_df)
+    Return the sample attrition table (cleaning step x country).
+    last update: 18/10/2026
 """
 
 import pandas as pd
 import tabulate as tab
 import numpy as np
 import math
-from sklearn.metrics import matthews_corrcoef
+import json
+
+# mismatch values and the names of their shares (see mismatch_shares())
+SHARES = {0: 'wellshare', 1: 'overshare', -1: 'undershare', 9999: 'errorshare'}
+
+# suffixes of the binary variables and the mismatch values they indicate (see mismatch_split())
+SPLITS = {'_u': -1, '_w': 0, '_o': 1}
+
+# code of the DSA error category (9999) in the compact measures (see compact_measure())
+ERROR_CODE = 9
+
+class LogBuffer:
+
+    """
+    Append-only log buffer that can be used instead of the log dataframe.
+
+    Parameters
+    ----------
+    quiet : bool, if True, records are not printed. Default is False.
+    sink : str, path to a JSONL file, every record is appended to it as soon as it is added. Default is None.
+    log_df : pandas.core.frame.DataFrame, existing log dataframe to start from. Default is None.
+
+    Description
+    -----------
+    The buffer keeps the records in python lists, so adding a record costs O(1)
+    instead of copying the whole log dataframe with pd.concat. It can be passed
+    as [log_df] to every function of the toolbox, which return it in place of
+    the log dataframe. Use to_df() to obtain the usual log dataframe with
+    3 columns ('index', 'section', 'record'). The sample attrition records
+    (see attrition()) are kept in the [attrition] list.
+    """
+
+    def __init__(self, quiet=False, sink=None, log_df=None):
+        self.quiet = quiet
+        self.sink = sink
+        self._sink_file = None
+        self.index = []
+        self.sections = []
+        self.records = []
+        self.attrition = []
+        if log_df is not None:
+            self.index = log_df['index'].tolist()
+            self.sections = log_df['section'].tolist()
+            self.records = log_df['record'].tolist()
+            self.attrition = list(log_df.attrs.get('attrition', []))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def size(self):
+        return 3 * len(self.records)
+
+    def current_section(self):
+        if len(self.sections) > 0:
+            return self.sections[-1]
+        return "no section has been started"
+
+    def append(self, section_title, record):
+
+        """
+        Append a record and return its index.
+        """
+
+        if len(self.index) > 0:
+            log_index = self.index[-1] + 1
+        else:
+            log_index = 0
+        self.index.append(log_index)
+        self.sections.append(section_title)
+        self.records.append(record)
+        if self.sink is not None:
+            if self._sink_file is None:
+                self._sink_file = open(self.sink, 'a', buffering=1)
+            self._sink_file.write(json.dumps({'index': log_index, 'section': section_title, 'record': record}, default=str) + '\n')
+        return log_index
+
+    def to_df(self):
+
+        """
+        Materialize the log dataframe with 3 columns ('index', 'section', 'record').
+        """
+
+        log_df = pd.DataFrame({'index': self.index, 'section': self.sections, 'record': self.records},
+                              columns=['index', 'section', 'record'])
+        log_df.attrs['attrition'] = list(self.attrition)
+        return log_df
+
+    def close(self):
+
+        """
+        Close the JSONL sink.
+        """
+
+        if self._sink_file is not None:
+            self._sink_file.close()
+            self._sink_file = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_sink_file'] = None
+        return state
+
 
 def section(new_section, log_df):
 
@@ -43,27 +228,34 @@ def section(new_section, log_df):
     Parameters
     ----------
     new_section : str, contains new sectio title.
-    log_df : pandas.core.frame.DataFrame, log dataframe with 3 columns ('index', 'section', 'record').
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe with 3 columns ('index', 'section', 'record').
     
     Returns
     -------
-    log_df : pandas.core.frame.DataFrame, updated log dataframe
+    log_df : pandas.core.frame.DataFrame or LogBuffer, updated log dataframe
     
     Description
     -----------
-    1. print the [new_section];
+    1. print the [new_section] (unless [log_df] is a quiet LogBuffer);
     2. append a record to [log_df] containing [new_section]
     (new log records will be entered under [new_section] until renewed);
     3. return updated [log_df]
     """
     
-    if log_df.size > 0:
-        log_index = log_df.iloc[-1,0] + 1
-    else: 
-        log_index = 0
-    
-    new_section_record = pd.DataFrame([[log_index, new_section, "new section started"]], columns=['index', 'section', 'record'])
-    log_df = pd.concat(objs=[log_df, new_section_record], axis=0, ignore_index=True)
+    if isinstance(log_df, LogBuffer):
+        log_df.append(new_section, "new section started")
+        if log_df.quiet == True:
+            return log_df
+    else:
+        if log_df.size > 0:
+            log_index = log_df.iloc[-1,0] + 1
+        else: 
+            log_index = 0
+        
+        new_section_record = pd.DataFrame([[log_index, new_section, "new section started"]], columns=['index', 'section', 'record'])
+        attrs = log_df.attrs
+        log_df = pd.concat(objs=[log_df, new_section_record], axis=0, ignore_index=True)
+        log_df.attrs = attrs
     print()
     print(new_section)
     print('---------------------------------------------')
@@ -78,29 +270,36 @@ def log(log_df, record):
 
     Parameters
     ----------
-    log_df : pandas.core.frame.DataFrame, log dataframe with 3 columns ('index', 'section', 'record').
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe with 3 columns ('index', 'section', 'record').
     record : str, contains new log record.
     
     Returns
     -------
-    log_df : pandas.core.frame.DataFrame, updated log dataframe.
+    log_df : pandas.core.frame.DataFrame or LogBuffer, updated log dataframe.
     
     Description
     -----------
-    1. print [record];
+    1. print [record] (unless [log_df] is a quiet LogBuffer);
     2. append [record] to [log_df];
     3. return updated [log_df].
     """
     
-    if log_df.size > 0:
-        log_index = log_df.iloc[-1,0] + 1
-        section_title = log_df.iloc[-1,1]
-    else: 
-        log_index = 0
-        section_title = "no section has been started"
-        
-    new_rec = pd.DataFrame([[log_index, section_title, record]], columns=['index', 'section', 'record'])
-    log_df = pd.concat(objs=[log_df, new_rec], axis=0, ignore_index=True)
+    if isinstance(log_df, LogBuffer):
+        log_index = log_df.append(log_df.current_section(), record)
+        if log_df.quiet == True:
+            return log_df
+    else:
+        if log_df.size > 0:
+            log_index = log_df.iloc[-1,0] + 1
+            section_title = log_df.iloc[-1,1]
+        else: 
+            log_index = 0
+            section_title = "no section has been started"
+            
+        new_rec = pd.DataFrame([[log_index, section_title, record]], columns=['index', 'section', 'record'])
+        attrs = log_df.attrs
+        log_df = pd.concat(objs=[log_df, new_rec], axis=0, ignore_index=True)
+        log_df.attrs = attrs
     message = 'log[' + str(log_index) + '] ' + str(record)
     print(message)
     return log_df
@@ -130,6 +329,49 @@ def print_tab(df):
     print(tab.tabulate(df, headers='keys', tablefmt='psql'))
 
 
+def compact_measure(values):
+
+    """
+    Store a mismatch measure as a nullable Int8 array.
+
+    Parameters
+    ----------
+    values : array-like, mismatch measure (-1, 0, 1, 9999 for the DSA error category, nan if missing).
+
+    Returns
+    -------
+    compact : pandas.arrays.IntegerArray, Int8 measure with 9999 stored as ERROR_CODE and
+    the missing values as <NA> (1 byte per value and 1 byte of mask instead of 8 bytes).
+    """
+
+    values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float, na_value=math.nan)
+    missing = np.isnan(values)
+    codes = np.where(missing, 0, np.where(values == 9999, ERROR_CODE, values))
+    return pd.arrays.IntegerArray(codes.astype(np.int8), missing)
+
+
+def measure_values(values):
+
+    """
+    Return the values of a mismatch measure stored either as float or in the compact form.
+
+    Parameters
+    ----------
+    values : array-like, mismatch measure.
+
+    Returns
+    -------
+    values : numpy.ndarray, float values (-1, 0, 1, 9999 for the DSA error category, nan if missing).
+    """
+
+    values = pd.Series(values, copy=False)
+    if values.dtype == 'Int8':
+        decoded = values.to_numpy(dtype=float, na_value=math.nan)
+        decoded[decoded == ERROR_CODE] = 9999
+        return decoded
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=math.nan)
+
+
 def mismatch_shares(piaac_df, mismatch_variable, feature, log_df):
     
     """
@@ -138,8 +380,8 @@ def mismatch_shares(piaac_df, mismatch_variable, feature, log_df):
     Parameters
     ----------
     piaac_df : pandas.core.frame.DataFrame, piaac dataset.
-    mismatch_variable : str, mismatch variable name.
-    feature: : str, group variable.
+    mismatch_variable : str or list, mismatch variable name(s).
+    feature: : str or list, group variable(s).
     log_df : pandas.core.frame.DataFrame, log file.
 
     Returns
@@ -149,74 +391,244 @@ def mismatch_shares(piaac_df, mismatch_variable, feature, log_df):
     
     Description
     -----------
-    1. compute relative frequencies of each mismatch value (shares) within each group;
-    2. create respective mismatch share variables;
-    3. register the changes in [log_df].
+    1. encode each group variable once with group_codes() and each mismatch variable once
+    with share_cells();
+    2. for each pair of mismatch and group variables, count the group x category crosstab
+    with a single np.bincount (see share_table());
+    3. compute relative frequencies of each mismatch value (shares) within each group
+    (missing mismatch values are not counted; a group without any mismatch value gets the share 0,
+    observations with a missing group get nan);
+    4. create respective mismatch share variables [mismatch_variable]_[share]_by_[feature]
+    (the error share only for dsa);
+    5. register the changes in [log_df].
     """
-    
-    log_record = ('creating mismatch shares for [' + mismatch_variable + '] across [' + feature + ']')
-    log_df = log(log_df, log_record)
-    
-    conditions = []
-    values = []
-    for value in piaac_df[feature].unique():
-        mismatch_shares = piaac_df.loc[piaac_df[feature] == value, mismatch_variable].value_counts(normalize=True)
-        if (0 in mismatch_shares.index) == True:
-            values.append(mismatch_shares[0])
-        else:
-            values.append(0)
-        conditions.append(piaac_df[feature] == value)
-    piaac_df[mismatch_variable + '_wellshare_by_' + feature] = np.select(conditions, values, default=math.nan)
-    
-    log_record = ('[' + mismatch_variable + '_wellshare_by_' + feature + '] created')
-    log_df = log(log_df, log_record)
-    
-    conditions = []
-    values = []
-    for value in piaac_df[feature].unique():
-        mismatch_shares = piaac_df.loc[piaac_df[feature] == value, mismatch_variable].value_counts(normalize=True)
-        if (1 in mismatch_shares.index) == True:
-            values.append(mismatch_shares[1])
-        else:
-            values.append(0)
-        conditions.append(piaac_df[feature] == value)
-    piaac_df[mismatch_variable + '_overshare_by_' + feature] = np.select(conditions, values, default=math.nan)
-
-    log_record = ('[' + mismatch_variable + '_overshare_by_' + feature + '] created')
-    log_df = log(log_df, log_record)
-
-    conditions = []
-    values = []
-    for value in piaac_df[feature].unique():
-        mismatch_shares = piaac_df.loc[piaac_df[feature] == value, mismatch_variable].value_counts(normalize=True)
-        if (-1 in mismatch_shares.index) == True:
-            values.append(mismatch_shares[-1])
-        else:
-            values.append(0)
-        conditions.append(piaac_df[feature] == value)
-    piaac_df[mismatch_variable + '_undershare_by_' + feature] = np.select(conditions, values, default=math.nan)
 
-    log_record = ('[' + mismatch_variable + '_undershare_by_' + feature + '] created')
-    log_df = log(log_df, log_record)
-    
-    if mismatch_variable == 'dsa':
-        conditions = []
-        values = []
-        for value in piaac_df[feature].unique():
-            mismatch_shares = piaac_df.loc[piaac_df[feature] == value, mismatch_variable].value_counts(normalize=True)
-            if (9999 in mismatch_shares.index) == True:
-                values.append(mismatch_shares[9999])
-            else:
-                values.append(0)
-            conditions.append(piaac_df[feature] == value)
-        piaac_df[mismatch_variable + '_errorshare_by_' + feature] = np.select(conditions, values, default=math.nan)
-        
-        log_record = ('[' + mismatch_variable + '_errorshare_by_' + feature + '] created')
-        log_df = log(log_df, log_record)
+    if isinstance(mismatch_variable, str):
+        mismatch_variable = [mismatch_variable]
+    if isinstance(feature, str):
+        feature = [feature]
+    grouping = {}
+    for group_var in feature:
+        grouping[group_var] = group_codes(piaac_df, group_var)
+
+    for measure in mismatch_variable:
+        cells = share_cells(piaac_df[measure])
+        for group_var in feature:
+            log_record = ('creating mismatch shares for [' + measure + '] across [' + group_var + ']')
+            log_df = log(log_df, log_record)
+            codes, groups = grouping[group_var]
+            group_shares, n = share_table(cells, codes, len(groups))
+            for cell, (value, share) in enumerate(SHARES.items()):
+                if (value == 9999) & (measure != 'dsa'):
+                    continue
+                piaac_df[measure + '_' + share + '_by_' + group_var] = group_broadcast(group_shares[:, cell], codes)
+                log_record = ('[' + measure + '_' + share + '_by_' + group_var + '] created')
+                log_df = log(log_df, log_record)
     
     return piaac_df, log_df
 
 
+def share_cells(values):
+
+    """
+    Encode a mismatch variable as share category codes.
+
+    Parameters
+    ----------
+    values : pandas.core.series.Series, mismatch variable (float or compact, see measure_values()).
+
+    Returns
+    -------
+    cells : numpy.ndarray, position of the value in SHARES, len(SHARES) for any other value
+    and len(SHARES) + 1 for a missing value.
+    """
+
+    values = measure_values(values)
+    cells = pd.Index(list(SHARES.keys())).get_indexer(values)
+    cells[cells < 0] = len(SHARES)
+    cells[np.isnan(values)] = len(SHARES) + 1
+    return cells
+
+
+def share_table(cells, codes, n_groups):
+
+    """
+    Compute the shares of the mismatch values within each group with a single crosstab.
+
+    Parameters
+    ----------
+    cells : numpy.ndarray, share category codes as returned by share_cells().
+    codes : numpy.ndarray, integer group codes as returned by group_codes() (-1 if the group is missing).
+    n_groups : int, number of groups.
+
+    Returns
+    -------
+    shares : numpy.ndarray, (n_groups, len(SHARES)) share of each value of SHARES within each group
+    (0 for a group without any non-missing value).
+    n : numpy.ndarray, number of non-missing values in each group.
+
+    Description
+    -----------
+    1. count the group x category crosstab with np.bincount over group code x category code;
+    2. divide the counts by the number of non-missing values in the group
+    (the same relative frequencies as value_counts(normalize=True)).
+    """
+
+    n_cells = len(SHARES) + 2
+    present = codes >= 0
+    counts = np.bincount(codes[present] * n_cells + cells[present],
+                         minlength=n_groups * n_cells).reshape(n_groups, n_cells)
+    n = counts[:, :len(SHARES) + 1].sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = np.where(n[:, None] > 0, counts[:, :len(SHARES)] / n[:, None], 0)
+    return shares, n
+
+
+class SharesCube:
+
+    """
+    Compact group x measure x share cube of the mismatch shares.
+
+    Parameters
+    ----------
+    group_var : str, group variable.
+    groups : numpy.ndarray, group values.
+    measures : list, mismatch variable names.
+    shares : numpy.ndarray, (n_groups, n_measures, len(SHARES)) share of each value of SHARES
+    (nan for the error share of the measures other than dsa).
+    n : numpy.ndarray, (n_groups, n_measures) number of non-missing values.
+    sort_values : dict, variable name -> (n_groups,) median of the variable within each group,
+    used to sort the groups (e.g. by median earnings). Default is None.
+
+    Description
+    -----------
+    The shares are constant within a group, so the cube keeps one value per group instead of
+    the broadcast columns created by mismatch_shares(). It is built with shares_cube(),
+    saved with save() and loaded with SharesCube.load(), and can be passed to
+    graphs.shares_heatmap() instead of the dataset, with the same column names
+    ([measure]_[share]_by_[group_var]).
+    """
+
+    def __init__(self, group_var, groups, measures, shares, n, sort_values=None):
+        self.group_var = group_var
+        self.groups = np.asarray(groups)
+        self.measures = list(measures)
+        self.shares = np.asarray(shares, dtype=float)
+        self.n = np.asarray(n)
+        if sort_values is None:
+            sort_values = {}
+        self.sort_values = {var: np.asarray(values, dtype=float) for var, values in sort_values.items()}
+
+    def column(self, name):
+
+        """
+        Return the group values of a share column [measure]_[share]_by_[group_var] or of a sort variable.
+        """
+
+        if name in self.sort_values:
+            return self.sort_values[name]
+        for m, measure in enumerate(self.measures):
+            for cell, share in enumerate(SHARES.values()):
+                if name == measure + '_' + share + '_by_' + self.group_var:
+                    return self.shares[:, m, cell]
+        raise KeyError(name + ' is not in the cube')
+
+    def order(self, sort_by):
+
+        """
+        Return the positions of the groups sorted by [sort_by] in descending order.
+        """
+
+        return np.argsort(-self.column(sort_by), kind='stable')
+
+    def to_frame(self):
+
+        """
+        Return the cube as a long dataframe with columns [group_var], 'measure', 'share', 'value', 'n'.
+        """
+
+        n_groups, n_measures, n_shares = self.shares.shape
+        return pd.DataFrame({
+            self.group_var: np.repeat(self.groups, n_measures * n_shares),
+            'measure': np.tile(np.repeat(self.measures, n_shares), n_groups),
+            'share': np.tile(list(SHARES.values()), n_groups * n_measures),
+            'value': self.shares.ravel(),
+            'n': np.repeat(self.n.ravel(), n_shares)})
+
+    def save(self, path):
+
+        """
+        Save the cube to a .npz file.
+        """
+
+        arrays = {'group_var': np.array(self.group_var), 'groups': self.groups, 'measures': np.array(self.measures, dtype=str),
+                  'shares': self.shares, 'n': self.n, 'sort_vars': np.array(list(self.sort_values.keys()), dtype=str)}
+        if self.groups.dtype == object:
+            arrays['groups'] = self.groups.astype(str)
+        for i, values in enumerate(self.sort_values.values()):
+            arrays['sort_' + str(i)] = values
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+
+        """
+        Load a cube saved with save().
+        """
+
+        with np.load(path, allow_pickle=False) as arrays:
+            sort_values = {str(var): arrays['sort_' + str(i)] for i, var in enumerate(arrays['sort_vars'])}
+            return cls(str(arrays['group_var']), arrays['groups'], arrays['measures'].tolist(), arrays['shares'],
+                       arrays['n'], sort_values)
+
+
+def shares_cube(piaac_df, mismatch_variable, feature, sort_by=None):
+
+    """
+    Compute the mismatch shares of several measures within each group as a SharesCube.
+
+    Parameters
+    ----------
+    piaac_df : pandas.core.frame.DataFrame, piaac dataset.
+    mismatch_variable : str or list, mismatch variable name(s).
+    feature : str, group variable.
+    sort_by : str or list, variable(s) whose group medians are kept to sort the groups, e.g. 'earn'. Default is None.
+
+    Returns
+    -------
+    cube : SharesCube, group x measure x share cube.
+
+    Description
+    -----------
+    1. factorize [feature] with sorted groups (missing groups are left out);
+    2. compute the shares of each measure with share_cells() and share_table()
+    (the same values as the columns created by mismatch_shares());
+    3. compute the median of each [sort_by] variable within each group (as groupby().median());
+    4. return the cube.
+    """
+
+    if isinstance(mismatch_variable, str):
+        mismatch_variable = [mismatch_variable]
+    if sort_by is None:
+        sort_by = []
+    elif isinstance(sort_by, str):
+        sort_by = [sort_by]
+    codes, groups = pd.factorize(piaac_df[feature], sort=True)
+    shares = np.full((len(groups), len(mismatch_variable), len(SHARES)), math.nan)
+    n = np.zeros((len(groups), len(mismatch_variable)), dtype=np.int64)
+    for m, measure in enumerate(mismatch_variable):
+        group_shares, n[:, m] = share_table(share_cells(piaac_df[measure]), codes, len(groups))
+        for cell, value in enumerate(SHARES.keys()):
+            if (value != 9999) | (measure == 'dsa'):
+                shares[:, m, cell] = group_shares[:, cell]
+    present = codes >= 0
+    sort_values = {}
+    for var in sort_by:
+        medians = pd.Series(piaac_df[var].to_numpy()[present]).groupby(codes[present]).median()
+        sort_values[var] = medians.reindex(np.arange(len(groups))).to_numpy(dtype=float)
+    return SharesCube(feature, np.asarray(groups), mismatch_variable, shares, n, sort_values)
+
+
 def mcc_matrix(df, feature_list):
     
     """
@@ -233,27 +645,174 @@ def mcc_matrix(df, feature_list):
 
     Description
     -----------
-    1. for each pair of features in [feature_list]:
-        * compute Matthew's correlation coefficient;
-        * fill the matrix with the computed values;
-    2. return the matrix.
-    """
-
-    mcc_matrix = pd.DataFrame(index = feature_list,
-                              columns = feature_list)
-    for measure_row in feature_list:
-        for measure_col in feature_list:
-            true_cleaned = df.loc[(df[measure_row].isnull()==False)*(df[measure_col].isnull()==False), measure_row]
-            pred_cleaned = df.loc[(df[measure_row].isnull()==False)*(df[measure_col].isnull()==False), measure_col]
-            mcc = matthews_corrcoef(true_cleaned, pred_cleaned)
-            mcc_matrix.loc[measure_row, measure_col] = mcc
-    
-    mcc_matrix = mcc_matrix.astype(float)
+    1. build the contingency tables of all pairs of features (observations with
+    non-missing values of both features) with contingency_tables();
+    2. compute Matthew's correlation coefficient for the upper triangle with mcc_from_tables()
+    (same values as sklearn.metrics.matthews_corrcoef) and mirror it;
+    3. return the matrix.
+    """
+
+    mcc, groups = mcc_tensor(df, feature_list)
+    mcc_matrix = pd.DataFrame(mcc[0], index=feature_list, columns=feature_list)
             
     return mcc_matrix
-            
 
-def mismatch_split(piaac_df, measure_list, log_df):
+
+def measure_codes(df, feature_list):
+
+    """
+    Encode the values of several measures with one factorization.
+
+    Parameters
+    ----------
+    df : pandas.core.frame.DataFrame, dataset.
+    feature_list : list, list of measures (float or compact, see measure_values()).
+
+    Returns
+    -------
+    codes : numpy.ndarray, (k, n) integer code of each measure and observation (-1 if the value is missing).
+    values : pandas.core.indexes.base.Index, sorted values of the measures (the same code means the same value in every measure).
+    """
+
+    codes, values = pd.factorize(np.concatenate([measure_values(df[feature]) for feature in feature_list]), sort=True)
+    return codes.reshape(len(feature_list), df.shape[0]), values
+
+
+def contingency_tables(df, feature_list, group_var=None, max_bins=2**22):
+
+    """
+    Compute the contingency tables of all pairs of measures (within each group) in one pass.
+
+    Parameters
+    ----------
+    df : pandas.core.frame.DataFrame, dataset.
+    feature_list : list, list of measures (variables with a few categories, e.g. -1, 0, 1 and 9999 for dsa).
+    group_var : str, group variable, e.g. 'cntryname'. Default is None (a single group).
+    max_bins : int, maximum size of the joint histogram of all the measures. Default is 2**22.
+
+    Returns
+    -------
+    tables : numpy.ndarray, (n_groups, k, k, n_values, n_values) counts, tables[g, i, j, a, b] is the number of
+    observations in group g with the value a of measure i and the value b of measure j
+    (observations with a missing value of either measure are not counted).
+    values : pandas.core.indexes.base.Index, sorted values of the measures (the categories a, b).
+    groups : pandas.core.indexes.base.Index, group values (see group_codes()), None if [group_var] is None.
+
+    Description
+    -----------
+    1. encode the values of all the measures with measure_codes() (missing values get the extra code n_values);
+    2. if the joint histogram of the group and all the measures has at most [max_bins] bins, count it with
+    a single np.bincount and obtain the table of every pair as its margin; otherwise count each pair
+    of measures with its own np.bincount;
+    3. count the upper triangle and the diagonal, the lower triangle is their transpose.
+    """
+
+    k = len(feature_list)
+    n = df.shape[0]
+    codes, values = measure_codes(df, feature_list)
+    n_values = len(values)
+    if group_var is None:
+        group = np.zeros(n, dtype=np.intp)
+        groups = None
+        n_groups = 1
+    else:
+        group, groups = group_codes(df, group_var)
+        n_groups = len(groups)
+    rows = group >= 0
+    tables = np.zeros((n_groups, k, k, n_values, n_values), dtype=np.int64)
+    base = n_values + 1
+
+    if n_groups * base ** k <= max_bins:
+        # joint histogram of the group and all the measures, the last code of each measure is missing
+        key = group[rows].astype(np.int64)
+        for m in range(k):
+            key = key * base + np.where(codes[m, rows] < 0, n_values, codes[m, rows])
+        hist = np.bincount(key, minlength=n_groups * base ** k).reshape((n_groups,) + (base,) * k)
+        for i in range(k):
+            margin = hist.sum(axis=tuple(1 + m for m in range(k) if m != i))
+            tables[:, i, i] = margin[:, :n_values, None] * np.eye(n_values, dtype=np.int64)
+            for j in range(i + 1, k):
+                margin = hist.sum(axis=tuple(1 + m for m in range(k) if (m != i) & (m != j)))
+                tables[:, i, j] = margin[:, :n_values, :n_values]
+    else:
+        for i in range(k):
+            for j in range(i, k):
+                both = rows & (codes[i] >= 0) & (codes[j] >= 0)
+                key = (group[both].astype(np.int64) * n_values + codes[i, both]) * n_values + codes[j, both]
+                tables[:, i, j] = np.bincount(key, minlength=n_groups * n_values ** 2).reshape(n_groups, n_values, n_values)
+    for i in range(k):
+        for j in range(i + 1, k):
+            tables[:, j, i] = tables[:, i, j].transpose(0, 2, 1)
+    return tables, values, groups
+
+
+def mcc_from_tables(tables):
+
+    """
+    Compute Matthew's correlation coefficients from contingency tables.
+
+    Parameters
+    ----------
+    tables : numpy.ndarray, (..., n_values, n_values) contingency tables (rows: first measure, columns: second measure).
+
+    Returns
+    -------
+    mcc : numpy.ndarray, (...) Matthew's correlation coefficient of each table (0 if it is undefined).
+
+    Description
+    -----------
+    Multiclass Matthew's correlation coefficient computed with the same floating point operations
+    as sklearn.metrics.matthews_corrcoef, for all the tables at once.
+    """
+
+    t_sum = tables.sum(axis=-1, dtype=np.float64)
+    p_sum = tables.sum(axis=-2, dtype=np.float64)
+    n_correct = np.trace(tables, axis1=-2, axis2=-1, dtype=np.float64)
+    n_samples = p_sum.sum(axis=-1)
+    cov_ytyp = n_correct * n_samples - (t_sum * p_sum).sum(axis=-1)
+    cov_ypyp = n_samples ** 2 - (p_sum * p_sum).sum(axis=-1)
+    cov_ytyt = n_samples ** 2 - (t_sum * t_sum).sum(axis=-1)
+    cov_ypyp_ytyt = cov_ypyp * cov_ytyt
+    defined = cov_ypyp_ytyt != 0
+    mcc = np.zeros(cov_ypyp_ytyt.shape)
+    mcc[defined] = cov_ytyp[defined] / np.sqrt(cov_ypyp_ytyt[defined])
+    return mcc
+
+
+def mcc_tensor(df, feature_list, group_var=None):
+
+    """
+    Compute Matthew's correlation coefficient matrices of all groups at once.
+
+    Parameters
+    ----------
+    df : pandas.core.frame.DataFrame, dataset.
+    feature_list : list, list of measures.
+    group_var : str, group variable, e.g. 'cntryname'. Default is None (a single group).
+
+    Returns
+    -------
+    mcc : numpy.ndarray, (n_groups, k, k) Matthew's correlation coefficient matrix of each group.
+    groups : pandas.core.indexes.base.Index, group values (see group_codes()), None if [group_var] is None.
+
+    Description
+    -----------
+    1. build the contingency tables of all pairs of measures within each group with contingency_tables()
+    (the data is scanned once for all the groups);
+    2. compute Matthew's correlation coefficient for the upper triangle and the diagonal with mcc_from_tables();
+    3. mirror the upper triangle, e.g. mcc[groups.get_loc('Austria')] can be passed to graphs.corr_heat_map().
+    """
+
+    tables, values, groups = contingency_tables(df, feature_list, group_var)
+    k = len(feature_list)
+    upper = np.triu_indices(k)
+    mcc = np.zeros((tables.shape[0], k, k))
+    mcc[:, upper[0], upper[1]] = mcc_from_tables(tables[:, upper[0], upper[1]])
+    mcc[:, upper[1], upper[0]] = mcc[:, upper[0], upper[1]]
+    return mcc, groups
+
+
+def mismatch_split(piaac_df, measure_list, log_df, dtype='float', output='columns'):
 
     """
     Split each measure into 3 binary variables.
@@ -263,47 +822,359 @@ def mismatch_split(piaac_df, measure_list, log_df):
     piaac_df : pandas.core.frame.DataFrame, piaac dataset.
     measure_list : list, list of measures.
     log_df : pandas.core.frame.DataFrame, log file.
+    dtype : str, 'float' (float64 with nan), 'boolean' (nullable boolean) or 'uint8' (nullable UInt8). Default is 'float'.
+    output : str, 'columns' (add the variables to [piaac_df]), 'block' (return them as a separate dataframe
+    with the index of [piaac_df]) or 'sparse' (separate dataframe of sparse float64 columns with the fill value 0,
+    [dtype] is ignored). Default is 'columns'.
 
     Returns
     -------
-    piaac_df : pandas.core.frame.DataFrame, updated piaac dataset.
+    piaac_df : pandas.core.frame.DataFrame, updated piaac dataset (the indicator block if [output] is 'block' or 'sparse').
     log_df : pandas.core.frame.DataFrame, updated log file.
 
     Description
     -----------
     1. for each measure in [measure_list]:
-        * create 3 binary variables:
+        * compare the measure once with the category codes in SPLITS to create 3 binary variables:
             - [measure]_u: 1 if undermatched ([measure] == -1) and 0 otherwise;
             - [measure]_w: 1 if well-matched ([measure] == 0) and 0 otherwise;
             - [measure]_o: 1 if overmatched ([measure] == 1) and 0 otherwise;
+          (missing for the values other than -1, 0, 1 and 9999);
         * register the changes in [log_df].
-    2. return updated [piaac_df] and [log_df].
+    2. return updated [piaac_df] (or the indicator block) and [log_df].
     """
 
+    if dtype not in ['float', 'boolean', 'uint8']:
+        raise ValueError("dtype must be 'float', 'boolean' or 'uint8'")
+    if output not in ['columns', 'block', 'sparse']:
+        raise ValueError("output must be 'columns', 'block' or 'sparse'")
+    codes = np.array(list(SPLITS.values()))
+    block = {}
+
     for measure in measure_list:
         
         log_record = ('splitting [' + measure + '] into 3 binary variables')
         log_df = log(log_df, log_record)
-        conditions = []
+        values = measure_values(piaac_df[measure])
+        indicators = values[:, None] == codes[None, :]
+        missing = ~(indicators.any(axis=1) | (values == 9999))
         
-        values =[]
-        conditions = [piaac_df[measure] == -1,
-                      piaac_df[measure] == 0,
-                      piaac_df[measure] == 1,
-                      piaac_df[measure] == 9999]
-        values = [1, 0, 0, 0]
-        piaac_df[measure + "_u"] = np.select(conditions, values, default=math.nan)
-        log_record = ('[' + measure + "_u" + '] created')
-        log_df = log(log_df, log_record)
-        
-        values = [0, 1, 0, 0]
-        piaac_df[measure + "_w"] = np.select(conditions, values, default=math.nan)
-        log_record = ('[' + measure + "_w" + '] created')
-        log_df = log(log_df, log_record)
-        
-        values = [0, 0, 1, 0]
-        piaac_df[measure + "_o"] = np.select(conditions, values, default=math.nan)
-        log_record = ('[' + measure + "_o" + '] created')
-        log_df = log(log_df, log_record)
+        for j, suffix in enumerate(SPLITS.keys()):
+            if output == 'sparse':
+                column = pd.arrays.SparseArray(np.where(missing, math.nan, indicators[:, j]), fill_value=0.0)
+            elif dtype == 'boolean':
+                column = pd.arrays.BooleanArray(indicators[:, j], missing)
+            elif dtype == 'uint8':
+                column = pd.arrays.IntegerArray(indicators[:, j].astype(np.uint8), missing)
+            else:
+                column = np.where(missing, math.nan, indicators[:, j])
+            if output == 'columns':
+                piaac_df[measure + suffix] = column
+            else:
+                block[measure + suffix] = column
+            log_record = ('[' + measure + suffix + '] created')
+            log_df = log(log_df, log_record)
+
+    if output != 'columns':
+        return pd.DataFrame(block, index=piaac_df.index), log_df
         
-    return piaac_df, log_df
\ No newline at end of file
+    return piaac_df, log_df
+
+
+def group_codes(piaac_df, group_var):
+
+    """
+    Encode a group variable as integer group codes.
+
+    Parameters
+    ----------
+    piaac_df : pandas.core.frame.DataFrame, piaac dataset.
+    group_var : str, group variable.
+
+    Returns
+    -------
+    codes : numpy.ndarray, integer group code of each observation (-1 if the group is missing).
+    groups : pandas.core.indexes.base.Index, group values in the order of their first appearance.
+
+    Description
+    -----------
+    1. factorize [group_var] once, so that grouped computations can use the codes
+    with np.bincount and integer indexing instead of one boolean mask per group;
+    2. return the codes and the group values.
+    """
+
+    codes, groups = pd.factorize(piaac_df[group_var], sort=False)
+    return codes, groups
+
+
+def group_broadcast(values, codes):
+
+    """
+    Broadcast group-level values back to the observations.
+
+    Parameters
+    ----------
+    values : numpy.ndarray, group-level values (one row per group).
+    codes : numpy.ndarray, integer group codes as returned by group_codes().
+
+    Returns
+    -------
+    broadcast : numpy.ndarray, observation-level values (nan for missing groups).
+
+    Description
+    -----------
+    1. append a row of nan to [values] so that the code -1 points at it;
+    2. take the rows of [values] indexed by [codes].
+    """
+
+    values = np.asarray(values, dtype=float)
+    padded = np.concatenate([values, np.full((1,) + values.shape[1:], math.nan)])
+    return padded.take(codes, axis=0)
+
+
+def group_sort(codes, values, n_groups):
+
+    """
+    Sort values within each group once.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray, integer group codes as returned by group_codes().
+    values : numpy.ndarray, values to be sorted.
+    n_groups : int, number of groups.
+
+    Returns
+    -------
+    sorted_values : numpy.ndarray, non-missing values sorted by group and then by value.
+    offsets : numpy.ndarray, position of the first value of each group in [sorted_values]
+    (group g occupies sorted_values[offsets[g]:offsets[g + 1]]).
+
+    Description
+    -----------
+    1. drop observations with a missing group or a missing value;
+    2. sort the remaining values by group code and value with a single lexsort;
+    3. compute group offsets from the group counts.
+    """
+
+    values = np.asarray(values, dtype=float)
+    valid = (codes >= 0) & ~np.isnan(values)
+    group = codes[valid]
+    values = values[valid]
+    order = np.lexsort((values, group))
+    sorted_values = values[order]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(group, minlength=n_groups))])
+    return sorted_values, offsets
+
+
+def group_quantiles(sorted_values, offsets, quantiles):
+
+    """
+    Compute any number of quantiles for all groups at once.
+
+    Parameters
+    ----------
+    sorted_values : numpy.ndarray, values sorted within groups as returned by group_sort().
+    offsets : numpy.ndarray, group offsets as returned by group_sort().
+    quantiles : list, quantiles between 0 and 1.
+
+    Returns
+    -------
+    group_q : numpy.ndarray, array of shape (number of groups, number of quantiles),
+    nan for groups without values.
+
+    Description
+    -----------
+    1. locate the virtual index (n - 1) * q of each quantile within each group;
+    2. interpolate linearly between the neighbouring order statistics,
+    exactly as pandas.Series.quantile() with the default 'linear' interpolation.
+    """
+
+    q = np.asarray(quantiles, dtype=float)
+    start = offsets[:-1][:, None]
+    n = np.diff(offsets)[:, None]
+    virtual = (n - 1) * q[None, :]
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    above = virtual >= n - 1
+    previous = np.where(above, n - 1, previous).astype(np.intp)
+    following = np.where(above, n - 1, previous + 1).astype(np.intp)
+    empty = np.broadcast_to(n == 0, virtual.shape)
+    if sorted_values.size == 0:
+        return np.full(virtual.shape, math.nan)
+    a = sorted_values.take(np.where(empty, 0, start + previous))
+    b = sorted_values.take(np.where(empty, 0, start + following))
+    diff_b_a = b - a
+    group_q = np.where(gamma >= 0.5, b - diff_b_a * (1 - gamma), a + diff_b_a * gamma)
+    group_q[empty] = math.nan
+    return group_q
+
+
+def group_moments(codes, values, n_groups):
+
+    """
+    Compute the mean and standard deviation of a variable for all groups at once.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray, integer group codes as returned by group_codes() (-1 if the group is missing).
+    values : numpy.ndarray, float values (nan if missing).
+    n_groups : int, number of groups.
+
+    Returns
+    -------
+    mean : numpy.ndarray, mean of the non-missing values of each group (nan for groups without values).
+    std : numpy.ndarray, sample standard deviation (ddof=1) of each group, as pandas.Series.std()
+    (nan for groups with less than 2 values).
+
+    Description
+    -----------
+    1. count and sum the non-missing values of each group with np.bincount;
+    2. sum the squared deviations from the group means with a second np.bincount.
+    """
+
+    values = np.asarray(values, dtype=float)
+    valid = (codes >= 0) & (np.isnan(values) == False)
+    codes = codes[valid]
+    values = values[valid]
+    n = np.bincount(codes, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(codes, weights=values, minlength=n_groups) / n
+        squares = np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=n_groups)
+        std = np.sqrt(squares / (n - 1))
+    std[n < 2] = math.nan
+    return mean, std
+
+
+def country_codes(df):
+
+    """
+    Encode country IDs as dense integer codes.
+
+    Parameters
+    ----------
+    df : pandas.core.frame.DataFrame, dataset.
+
+    Returns
+    -------
+    codes : numpy.ndarray, integer country code of each observation (0 if the country ID is missing).
+    labels : numpy.ndarray, country ID of each code (nan for the code 0).
+
+    Description
+    -----------
+    1. convert cntryid to float (all the observations get the code 0 if there is no cntryid);
+    2. if the IDs are non-negative integers (ISO 3166 numeric codes), use ID + 1 as the code,
+    so that no hashing is needed; otherwise factorize the IDs;
+    3. return the codes and the country ID of each code.
+    """
+
+    if 'cntryid' not in df.columns:
+        return np.zeros(df.shape[0], dtype=np.intp), np.array([math.nan])
+    ids = pd.to_numeric(df['cntryid'], errors='coerce').to_numpy(dtype=float)
+    present = ~np.isnan(ids)
+    if present.any() == False:
+        return np.zeros(df.shape[0], dtype=np.intp), np.array([math.nan])
+    valid_ids = ids[present]
+    if (valid_ids.min() >= 0) & (valid_ids.max() < 100000) & (np.all(valid_ids == np.floor(valid_ids)) == True):
+        codes = np.zeros(df.shape[0], dtype=np.intp)
+        codes[present] = valid_ids.astype(np.intp) + 1
+        labels = np.concatenate([[math.nan], np.arange(int(valid_ids.max()) + 1, dtype=float)])
+    else:
+        codes, uniques = pd.factorize(ids, sort=True)
+        codes = codes + 1
+        labels = np.concatenate([[math.nan], uniques])
+    return codes, labels
+
+
+def attrition(log_df, step, codes, labels, drop_mask, keep=None):
+
+    """
+    Record the number of observations dropped in each country at a cleaning step.
+
+    Parameters
+    ----------
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe.
+    step : str, description of the cleaning step.
+    codes : numpy.ndarray, integer country codes as returned by country_codes().
+    labels : numpy.ndarray, country IDs as returned by country_codes().
+    drop_mask : numpy.ndarray, boolean mask of the observations dropped at the step.
+    keep : numpy.ndarray, boolean mask of the observations surviving before the step. Default is None (all).
+
+    Returns
+    -------
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe with the attrition record.
+
+    Description
+    -----------
+    1. count the observations before the step and the dropped observations in each country
+    with np.bincount over [codes];
+    2. append the counts to the attrition records of [log_df]
+    (LogBuffer.attrition, or log_df.attrs['attrition'] for a log dataframe);
+    3. return [log_df].
+    """
+
+    drop_mask = np.asarray(drop_mask, dtype=bool)
+    if keep is None:
+        before_codes = codes
+    else:
+        drop_mask = drop_mask & keep
+        before_codes = codes[keep]
+    n_before = np.bincount(before_codes, minlength=len(labels))
+    n_dropped = np.bincount(codes[drop_mask], minlength=len(labels))
+    record = {'step': step, 'cntryid': labels, 'n_before': n_before, 'n_dropped': n_dropped}
+    attrition_records(log_df).append(record)
+    return log_df
+
+
+def attrition_records(log_df):
+
+    """
+    Return the list of the sample attrition records of [log_df]
+    (LogBuffer.attrition, or log_df.attrs['attrition'] for a log dataframe, created if missing).
+    """
+
+    if isinstance(log_df, LogBuffer):
+        return log_df.attrition
+    if 'attrition' not in log_df.attrs:
+        log_df.attrs['attrition'] = []
+    return log_df.attrs['attrition']
+
+
+def attrition_table(log_df):
+
+    """
+    Return the sample attrition table (cleaning step x country).
+
+    Parameters
+    ----------
+    log_df : pandas.core.frame.DataFrame or LogBuffer, log dataframe.
+
+    Returns
+    -------
+    attrition_df : pandas.core.frame.DataFrame, one row per cleaning step and country with columns
+    'step_no', 'step', 'cntryid', 'n_before', 'n_dropped', 'n_after'.
+
+    Description
+    -----------
+    1. collect the attrition records of [log_df] in the order of the cleaning steps;
+    2. keep the countries with observations before each step;
+    3. compute the number of observations after each step.
+    """
+
+    records = attrition_records(log_df)
+    columns = ['step_no', 'step', 'cntryid', 'n_before', 'n_dropped', 'n_after']
+    if len(records) == 0:
+        return pd.DataFrame(columns=columns)
+    blocks = []
+    for step_no, record in enumerate(records):
+        present = record['n_before'] > 0
+        n_before = record['n_before'][present]
+        n_dropped = record['n_dropped'][present]
+        blocks.append(pd.DataFrame({
+            'step_no': step_no,
+            'step': record['step'],
+            'cntryid': record['cntryid'][present],
+            'n_before': n_before,
+            'n_dropped': n_dropped,
+            'n_after': n_before - n_dropped}, columns=columns))
+    attrition_df = pd.concat(blocks, axis=0, ignore_index=True)
+    return attrition_df